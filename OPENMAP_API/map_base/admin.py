@@ -6,8 +6,12 @@ admin.site.register(models.MapFacility)
 admin.site.register(models.MLFacility)
 admin.site.register(models.Campaign)
 admin.site.register(models.Experiment)
+admin.site.register(models.ExperimentNameSequence)
 admin.site.register(models.MapStage)
+admin.site.register(models.StageDuration)
 admin.site.register(models.MapInput)
 admin.site.register(models.ExpInputVal)
+admin.site.register(models.CampaignConstraint)
+admin.site.register(models.CampaignAtomicConstraint)
 admin.site.register(models.MapOutput)
 admin.site.register(models.ExpOutputVal)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MapBaseConfig(AppConfig):
     name = 'map_base'
+
+    def ready(self):
+        # connect signal receivers
+        import map_base.signals
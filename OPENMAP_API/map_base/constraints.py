@@ -0,0 +1,129 @@
+import logging
+
+import numpy as np
+
+from map_base.models import CampaignAtomicConstraint
+from map_base.schema import get_map_schema
+
+logger = logging.getLogger(__name__)
+
+############################################################
+# CampaignConstraints
+#
+# a campaign's constraints compiled to arrays for evaluating many points at once
+#
+#   points are rows of an n x d matrix with columns in MAP schema input order
+#   a point is excluded when every atomic constraint of any one parent constraint holds
+#   atomic constraints on inputs missing from a point (nan) do not hold
+#   a parent constraint with an atom on an input not in the schema is dropped whole
+############################################################
+class CampaignConstraints:
+    def __init__(self, schema, atoms):
+        # atoms: ( parent id, input id, constraint type, v1, v2 ) ordered by parent id
+        # dropping only the unknown atoms would leave a looser constraint excluding more points
+        unknown = sorted( set( atom[0] for atom in atoms if atom[1] not in schema.input_by_id ) )
+        if ( len(unknown) > 0 ):
+            logger.warning( "constraints %s name inputs not in the MAP schema - ignored", unknown )
+        atoms = [ atom for atom in atoms if atom[0] not in unknown ]
+
+        self.n_atoms = len(atoms)
+        self.columns = np.array( [ schema.input_index[ schema.input_by_id[atom[1]].name ] for atom in atoms ], dtype=np.int64 )
+        self.types = np.array( [ atom[2] for atom in atoms ] )
+        self.v1 = np.array( [ atom[3] for atom in atoms ], dtype=np.float64 )
+        self.v2 = np.array( [ np.nan if atom[4] is None else atom[4] for atom in atoms ], dtype=np.float64 )
+
+        parents = [ atom[0] for atom in atoms ]
+        self.group_ids = [ parent for i, parent in enumerate(parents) if i == 0 or parent != parents[i-1] ]
+        self.group_starts = np.array( [ i for i, parent in enumerate(parents) if i == 0 or parent != parents[i-1] ], dtype=np.int64 )
+
+        self.n_inputs = len(schema.inputs)
+
+    @classmethod
+    def load(cls, campaign):
+        atoms = CampaignAtomicConstraint.objects.filter(parent__campaign=campaign).order_by('parent_id', 'id').values_list(
+                            'parent_id', 'parameter_id', 'constraint_type', 'v1', 'v2' )
+        return cls( get_map_schema(campaign.for_map_id), list(atoms) )
+
+    def __len__(self):
+        return len(self.group_ids)
+
+    def atom_mask(self, points):
+        # n x atoms, True where the atomic constraint holds
+        values = np.asarray(points, dtype=np.float64)[:, self.columns]
+        lower = np.fmin(self.v1, self.v2)
+        upper = np.fmax(self.v1, self.v2)
+
+        with np.errstate(invalid='ignore'):
+            between = (values >= lower) & (values <= upper)
+            equal = np.isclose(values, self.v1)
+            conditions = {
+                        'BTW': between,
+                        'OUT': ~between & ~np.isnan(values),
+                        'LTE': values <= self.v1,
+                        'LT': values < self.v1,
+                        'GTE': values >= self.v1,
+                        'GT': values > self.v1,
+                        'EQ': equal,
+                        'NEQ': ~equal & ~np.isnan(values),
+                    }
+
+        mask = np.zeros(values.shape, dtype=bool)
+        for constraint_type, holds in conditions.items():
+            selected = (self.types == constraint_type)
+            mask[:, selected] = holds[:, selected]
+        return mask
+
+    def group_mask(self, points):
+        # n x parent constraints, True where the parent constraint excludes the point
+        points = np.atleast_2d( np.asarray(points, dtype=np.float64) )
+        if ( self.n_atoms == 0 ):
+            return np.zeros( (points.shape[0], 0), dtype=bool )
+        return np.logical_and.reduceat( self.atom_mask(points), self.group_starts, axis=1 )
+
+    def excluded(self, points):
+        return self.group_mask(points).any(axis=1)
+
+    def allowed(self, points):
+        return ~self.excluded(points)
+
+    def excluded_by(self, points):
+        # ids of the parent constraints excluding each point
+        group_ids = np.array(self.group_ids)
+        return [ [ int(group_id) for group_id in group_ids[row] ] for row in self.group_mask(points) ]
+
+    def sample(self, generate, n, max_rounds=20):
+        # reject-sample up to n allowed points from generate(k), which returns k candidate points
+        # returns fewer than n points if too few candidates are allowed
+        if ( self.n_atoms == 0 ):
+            return generate(n)
+
+        accepted = []
+        n_accepted = 0
+        acceptance = 1.0
+        for i in range(max_rounds):
+            n_wanted = n - n_accepted
+            if ( n_wanted <= 0 ):
+                break
+
+            # oversample by the acceptance rate seen so far
+            candidates = generate( int( np.ceil( n_wanted / max(acceptance, 0.01) ) ) )
+            allowed = candidates[ self.allowed(candidates) ]
+            acceptance = len(allowed) / len(candidates)
+
+            accepted.append( allowed[:n_wanted] )
+            n_accepted += len(accepted[-1])
+
+        if ( len(accepted) == 0 ):
+            return np.empty( (0, self.n_inputs) )
+        return np.concatenate(accepted)
+
+############################################################
+# input_matrix
+# { input name: value } dicts as rows of a matrix in schema input order, nan where missing
+############################################################
+def input_matrix(schema, input_values):
+    points = np.full( (len(input_values), len(schema.inputs)), np.nan )
+    for i, values in enumerate(input_values):
+        for name, value in values.items():
+            points[i, schema.input_index[name]] = value
+    return points
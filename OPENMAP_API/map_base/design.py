@@ -0,0 +1,86 @@
+import numpy as np
+
+try:
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+
+############################################################
+# space-filling designs
+#
+# each generator returns an n x d array of points in the unit hypercube
+############################################################
+DESIGN_CHOICES = [
+            ("random", "Random"),
+            ("lhs", "Latin hypercube"),
+            ("sobol", "Scrambled Sobol (requires scipy)"),
+            ("halton", "Halton"),
+        ]
+
+def design_available(method):
+    # Sobol designs need scipy
+    return ( method != 'sobol' or qmc is not None )
+
+def available_design_choices():
+    # the choices this installation can generate - the model keeps every choice
+    # so its migrations do not depend on whether scipy is installed
+    return [ choice for choice in DESIGN_CHOICES if design_available(choice[0]) ]
+
+def _first_primes(n):
+    primes = []
+    candidate = 2
+    while ( len(primes) < n ):
+        if all( candidate % p != 0 for p in primes if p * p <= candidate ):
+            primes.append(candidate)
+        candidate += 1
+    return np.array(primes, dtype=np.int64)
+
+def random_design(n, d, rng):
+    return rng.random( (n, d) )
+
+def lhs_design(n, d, rng):
+    # one point in each of the n strata of every dimension, strata paired at random
+    strata = rng.permuted( np.tile( np.arange(n), (d, 1) ), axis=1 ).T
+    return ( strata + rng.random( (n, d) ) ) / n
+
+def halton_design(n, d, rng):
+    # radical inverse of 1..n in the first d prime bases, digits taken for all points and bases at once
+    bases = _first_primes(d)
+    n_digits = int( np.ceil( np.log(n + 1) / np.log(bases.min()) ) ) + 1
+
+    index = np.arange(1, n + 1, dtype=np.int64)[:, None]
+    powers = bases[None, :, None] ** np.arange(n_digits)[None, None, :]
+    digits = ( index[:, :, None] // powers ) % bases[None, :, None]
+    points = ( digits / ( powers * bases[None, :, None] ) ).sum(axis=2)
+
+    # random shift modulo 1 so repeated designs differ but keep their spacing
+    return ( points + rng.random(d) ) % 1.0
+
+def sobol_design(n, d, rng):
+    if qmc is None:
+        raise ImportError("scipy is required for Sobol designs")
+    return qmc.Sobol(d, scramble=True, seed=rng).random(n)
+
+DESIGN_GENERATORS = {
+            'random': random_design,
+            'lhs': lhs_design,
+            'sobol': sobol_design,
+            'halton': halton_design,
+        }
+
+############################################################
+# design_points
+# n points of the named design scaled to the bounds of each dimension
+############################################################
+def design_points(method, n, lower, upper, rng=None):
+    lower = np.asarray(lower, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if ( n <= 0 or lower.size == 0 ):
+        return np.empty( (max(n, 0), lower.size) )
+
+    unit = DESIGN_GENERATORS[method](n, lower.size, rng)
+    return lower + unit * (upper - lower)
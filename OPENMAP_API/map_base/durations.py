@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from map_base.models import StageDuration
+from map_base.schema import get_map_schema
+
+############################################################
+# stage durations
+############################################################
+def record_stage_duration(stage, facility_id):
+    if ( facility_id is None or stage.start_time is None or stage.end_time is None ):
+        return
+
+    seconds = (stage.end_time - stage.start_time).total_seconds()
+    if ( seconds < 0 ):
+        return
+
+    with transaction.atomic():
+        StageDuration.objects.get_or_create(map_stage_id=stage.map_stage_id, facility_id=facility_id)
+        duration = StageDuration.objects.select_for_update().get(map_stage_id=stage.map_stage_id, facility_id=facility_id)
+        duration.add(seconds)
+        duration.save()
+
+def duration_table(facility_ids):
+    # { (facility id, map stage id): (median seconds, 90th percentile seconds) } for stages with history
+    durations = StageDuration.objects.filter(facility_id__in=facility_ids, count__gt=0)
+    return { (duration.facility_id, duration.map_stage_id): ( duration.quantile(0.5), duration.quantile(0.9) ) for duration in durations }
+
+def expected_stage_duration(stage, facility_id, table=None):
+    if ( table is None ):
+        table = duration_table([facility_id])
+    return table.get( (facility_id, stage.map_stage_id) )
+
+def expected_experiment_duration(experiment, table=None):
+    # stages run in turn - known only if every stage of the MAP has history at the facility
+    if ( table is None ):
+        table = duration_table([experiment.facility_id])
+    map_stage_ids = list( get_map_schema(experiment.campaign.for_map_id).stage_by_id )
+    expected = [ table.get( (experiment.facility_id, map_stage_id) ) for map_stage_id in map_stage_ids ]
+    if ( len(expected) == 0 or None in expected ):
+        return None
+    return ( sum( e[0] for e in expected ), sum( e[1] for e in expected ) )
+
+############################################################
+# poll scheduling
+#
+#   with history, the first poll after a status change is made near the
+#   median duration, the next at the 90th percentile, then backing off
+#   without history, polls start at MAP_MONITOR_DEFAULT_DELAY and back off
+#
+#   instance.poll_interval is None until the backing off starts
+############################################################
+def clamp_delay(seconds):
+    return min( max(seconds, settings.MAP_MONITOR_MIN_DELAY), settings.MAP_MONITOR_MAX_DELAY )
+
+def first_poll(instance, expected, now):
+    instance.poll_interval = None
+    if ( instance.status == 'R' and expected is not None and instance.start_time is not None ):
+        instance.next_poll = max( instance.start_time + timedelta(seconds=expected[0]), now + timedelta(seconds=settings.MAP_MONITOR_MIN_DELAY) )
+    else:
+        instance.next_poll = now + timedelta(seconds=settings.MAP_MONITOR_DEFAULT_DELAY)
+
+def next_poll(instance, expected, now):
+    # schedule the poll after one that found no change
+    if ( instance.status == 'R' and expected is not None and instance.start_time is not None and instance.poll_interval is None ):
+        late = instance.start_time + timedelta(seconds=expected[1])
+        if ( now < late ):
+            instance.next_poll = max( late, now + timedelta(seconds=settings.MAP_MONITOR_MIN_DELAY) )
+            return
+        interval = clamp_delay( 0.1 * expected[1] )
+    elif ( instance.poll_interval is None ):
+        interval = clamp_delay( settings.MAP_MONITOR_DEFAULT_DELAY )
+    else:
+        interval = clamp_delay( instance.poll_interval * settings.MAP_MONITOR_BACKOFF )
+
+    instance.poll_interval = interval
+    instance.next_poll = now + timedelta(seconds=interval)
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED
+
+logger = logging.getLogger(__name__)
+
+############################################################
+# FacilityLatency
+# running summary of call times to a facility
+############################################################
+class FacilityLatency:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+
+    def record(self, elapsed, failed):
+        self.calls += 1
+        self.errors += int(failed)
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.last = elapsed
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls > 0 else None
+
+    def as_dict(self):
+        return { 'calls': self.calls, 'errors': self.errors, 'mean': self.mean, 'max': self.max, 'last': self.last }
+
+############################################################
+# FacilityClient
+#
+# HTTP calls to one facility over a pooled keep-alive session
+#   every call has connect and read timeouts
+#   failed connections and timeouts raise requests.RequestException
+#
+#   bulk_get() asks about several experiments in one call where the
+#   facility serves experiments/<resource>/?ids=..., and remembers
+#   when it does not so callers can fall back to per-experiment calls -
+#   asking again after MAP_FACILITY_BULK_RECHECK seconds in case the
+#   facility was upgraded or the endpoint was briefly unavailable
+############################################################
+class FacilityClient:
+    def __init__(self, location, pool_size=None, timeout=None):
+        self.location = location
+        self.timeout = timeout if timeout is not None else ( settings.MAP_FACILITY_CONNECT_TIMEOUT, settings.MAP_FACILITY_READ_TIMEOUT )
+
+        pool_size = pool_size if pool_size is not None else settings.MAP_FACILITY_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.latency = {}
+        self.lock = threading.Lock()
+        self.bulk = None    # unknown until the first bulk call
+        self.bulk_checked = None
+
+    def url(self, path):
+        return self.location + path
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = path.split('/')[0]
+        status_code = None
+
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.latency.setdefault( (method, endpoint), FacilityLatency() ).record( elapsed, status_code is None or status_code >= 500 )
+            logger.debug( "facility %s %s %s -> %s in %.1f ms", self.location, method, path, status_code, elapsed * 1000.0 )
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def bulk_get(self, resource, facility_expids):
+        # { facility expid (str): data } or None if the facility has no bulk endpoint
+        if ( self.bulk is False and time.monotonic() - self.bulk_checked < settings.MAP_FACILITY_BULK_RECHECK ):
+            return None
+
+        ids = ','.join( str(facility_expid) for facility_expid in facility_expids )
+        response = self.get( 'experiments/{}/'.format(resource), params={'ids': ids} )
+        if ( response.status_code in (HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED) ):
+            self.bulk = False
+            self.bulk_checked = time.monotonic()
+            return None
+        if ( response.status_code != HTTP_200_OK ):
+            return None
+
+        self.bulk = True
+        return response.json()
+
+    def latency_stats(self):
+        with self.lock:
+            return { '{} {}'.format(*key): latency.as_dict() for key, latency in self.latency.items() }
+
+    def close(self):
+        self.session.close()
+
+############################################################
+# facility_client
+# the client for a facility, shared by the tasks of a worker process
+############################################################
+_clients = {}
+_clients_lock = threading.Lock()
+
+def facility_client(facility):
+    location = getattr(facility, 'location', facility)
+
+    with _clients_lock:
+        client = _clients.get(location)
+        if client is None:
+            client = FacilityClient(location)
+            _clients[location] = client
+        return client
+
+def facility_latency_stats():
+    with _clients_lock:
+        clients = list( _clients.values() )
+    return { client.location: client.latency_stats() for client in clients }
+
+def _reset_clients():
+    # forked worker processes must not share the parent's sockets
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork( after_in_child=_reset_clients )
@@ -0,0 +1,48 @@
+from django.db import transaction
+
+from map_base.models import Experiment, ExpStage, ExpInputVal, ExpOutputVal
+from map_base.schema import get_map_schema
+
+############################################################
+# create_experiments
+# build new proposed experiments with their input, stage and output rows
+#
+#   input_values is a list with one { input name: requested value } dict per experiment
+#   inputs missing from a dict get no row
+#
+#   the number of queries does not depend on the number of
+#   experiments, inputs, stages or outputs
+############################################################
+def create_experiments(campaign, mode, input_values):
+    schema = get_map_schema(campaign.for_map_id)
+    names = Experiment.objects.allocate_names(campaign, mode, len(input_values))
+
+    with transaction.atomic():
+        experiments = Experiment.objects.bulk_create([ Experiment(campaign=campaign, name=name) for name in names ])
+
+        # not every database backend returns primary keys from a bulk insert
+        if ( len(experiments) > 0 and experiments[0].pk is None ):
+            by_name = { experiment.name: experiment for experiment in campaign.experiments.filter(name__in=names) }
+            experiments = [ by_name[name] for name in names ]
+
+        ExpInputVal.objects.bulk_create([
+                        ExpInputVal(experiment=experiment, map_input=schema.input_by_name[name], value_request=value)
+                        for experiment, values in zip(experiments, input_values) for name, value in values.items()
+                    ])
+        ExpStage.objects.bulk_create([
+                        ExpStage(experiment=experiment, map_stage=map_stg)
+                        for experiment in experiments for map_stg in schema.stages
+                    ])
+        ExpOutputVal.objects.bulk_create([
+                        ExpOutputVal(experiment=experiment, map_output=map_out)
+                        for experiment in experiments for map_out in schema.outputs
+                    ])
+
+    return experiments
+
+############################################################
+# create_experiment
+# build one new proposed experiment
+############################################################
+def create_experiment(campaign, mode, input_values):
+    return create_experiments(campaign, mode, [input_values])[0]
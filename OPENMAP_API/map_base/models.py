@@ -1,7 +1,13 @@
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.db import transaction, IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
 import re
-from random import uniform as random_uniform
 
+from map_base.design import DESIGN_CHOICES
+from map_base.quantiles import StreamingQuantile
 from map_base.util import generate_uid_node_campaign
 
 ############################################################
@@ -11,6 +17,8 @@ class MapBase(models.Model):
     name = models.CharField(max_length=255)
     storage_location = models.CharField(max_length=1024, blank=True, default='')
     storage_user = models.CharField(max_length=80, blank=True, default='')
+    # changed whenever the MAP's stages, inputs or outputs change (map_base.schema)
+    schema_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         constraints = [
@@ -28,6 +36,7 @@ class MapFacility(models.Model):
     for_map = models.ForeignKey(MapBase, related_name='facilities', verbose_name='for MAP', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     location = models.CharField(max_length=1024)
+    capacity = models.PositiveIntegerField(default=0, help_text='experiments queued or running at once (0 for no limit)')
 
     class Meta:
         constraints = [
@@ -47,6 +56,8 @@ class MLFacility(models.Model):
     location = models.CharField(max_length=1024)
     train_script = models.CharField(max_length=255)
     probe_script = models.CharField(max_length=255)
+    server_url = models.CharField(max_length=1024, blank=True, default='',
+                        help_text='gp_server address (e.g. http://mlhost:8500/) - if set, training and probing are requested from it instead of running the scripts over ssh')
 
     class Meta:
         constraints = [
@@ -69,11 +80,28 @@ class Campaign(models.Model):
                 ("T", "Trained"),
                 ("E", "Error during training"),
             ]
+    # transition name: (statuses it may start from, resulting status)
+    ML_STATUS_TRANSITIONS = {
+                'start_training': (("U", "O", "T", "E"), "R"),
+                'finish_training': (("R",), "T"),
+                'fail_training': (("R",), "E"),
+                'fail_probing': (("T",), "E"),
+                'data_changed': (("T", "E"), "O"),
+                'reset': (("U", "O", "R", "T", "E"), "U"),
+            }
+    # fields a transition also sets - a reset model has no update pending
+    ML_TRANSITION_UPDATES = {
+                'reset': {'ml_update_requested': False, 'ml_update_scheduled_at': None},
+            }
     for_map = models.ForeignKey(MapBase, related_name='campaigns', verbose_name='for MAP', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     max_experiments = models.PositiveIntegerField(default=0, blank=True)
     with_ml = models.ForeignKey(MLFacility, null=True, related_name='campaigns+', verbose_name='with ML', on_delete=models.SET_NULL)
     ml_model_status = models.CharField(max_length=1, choices=ML_STATUS_CHOICES, verbose_name='ML model status', default='U')
+    ml_update_requested = models.BooleanField(default=False, verbose_name='ML update requested')
+    ml_update_scheduled_at = models.DateTimeField(null=True, blank=True, verbose_name='ML update scheduled at')
+    initial_experiments = models.PositiveIntegerField(default=1, verbose_name='initial experiments')
+    initial_design = models.CharField(max_length=8, choices=DESIGN_CHOICES, verbose_name='initial design', default='random')
     goal = models.CharField(max_length=255, blank=True, default='')
     performance = models.FloatField(null=True, blank=True)
     uid_node = models.CharField(max_length=12, default=generate_uid_node_campaign, verbose_name='UID node')
@@ -84,21 +112,65 @@ class Campaign(models.Model):
                 models.UniqueConstraint(fields=['uid_node'], name='unique_campaign_mac_ref'),
             ]
 
+    @staticmethod
+    def update_not_scheduled(now):
+        # no training task scheduled, or the one scheduled is overdue by MAP_ML_UPDATE_STALE
+        # debounce periods and taken to be lost (worker restart, purged queue)
+        stale_before = now - timedelta(seconds=settings.MAP_ML_UPDATE_DEBOUNCE * settings.MAP_ML_UPDATE_STALE)
+        return ( Q(ml_update_scheduled_at__isnull=True) | Q(ml_update_scheduled_at__lt=stale_before) )
+
+    def request_model_update(self):
+        # flag that the model is missing data
+        # returns True if the caller should schedule training, False if training is already scheduled
+        now = timezone.now()
+        Campaign.objects.filter(pk=self.pk).update(ml_update_requested=True)
+        return ( Campaign.objects.filter(Campaign.update_not_scheduled(now), pk=self.pk).update(ml_update_scheduled_at=now) == 1 )
+
+    def claim_model_update(self):
+        # take the pending update request and mark the model as training
+        # fails if there is no request or training is already running, in which case the request is left for later
+        Campaign.objects.filter(pk=self.pk).update(ml_update_scheduled_at=None)
+        return self.ml_transition('start_training', conditions={'ml_update_requested': True}, updates={'ml_update_requested': False})
+
+    def ml_transition(self, transition, conditions=None, updates=None):
+        # apply a ML model status transition as a single conditional UPDATE
+        # returns True if this call made the transition, False if the status (or conditions) did not allow it
+        conditions = conditions or {}
+        updates = dict( self.ML_TRANSITION_UPDATES.get(transition, {}), **(updates or {}) )
+        from_status, to_status = self.ML_STATUS_TRANSITIONS[transition]
+        won = Campaign.objects.filter(pk=self.pk, ml_model_status__in=from_status, **conditions).update(ml_model_status=to_status, **updates)
+
+        if ( won == 1 ):
+            self.ml_model_status = to_status
+            for field, value in updates.items():
+                setattr(self, field, value)
+
+        return ( won == 1 )
+
+    def propose_design_experiments(self, method, n):
+        from map_base.constraints import CampaignConstraints
+        from map_base.design import design_points
+        from map_base.factory import create_experiments
+        from map_base.schema import get_map_schema
+
+        # points excluded by campaign constraints are replaced by further draws
+        # fewer than n experiments are proposed if the design cannot find enough allowed points
+        schema = get_map_schema(self.for_map_id)
+        constraints = CampaignConstraints.load(self)
+        points = constraints.sample( lambda k: design_points(method, k, schema.input_min, schema.input_max), n )
+        input_values = [ { map_inp.name: float(value) for map_inp, value in zip(schema.inputs, point) } for point in points ]
+
+        return create_experiments(self, method, input_values)
+
     def propose_random_experiment(self):
         #if len( self.experiments.all() ) < max_experiments:
-        experiment = Experiment.objects.new_proposed(self, 'random')
-
-        for map_inp in MapInput.objects.filter(for_map=self.for_map):
-            rndval = random_uniform(map_inp.min_val, map_inp.max_val)
-            ExpInputVal.objects.create(experiment=experiment, map_input=map_inp, value_request=rndval)
-
-        for map_stg in MapStage.objects.filter(for_map=self.for_map):
-            ExpStage.objects.create(experiment=experiment, map_stage=map_stg)
+        experiments = self.propose_design_experiments('random', 1)
+        return experiments[0] if len(experiments) > 0 else None
 
-        for map_out in MapOutput.objects.filter(for_map=self.for_map):
-            ExpOutputVal.objects.create(experiment=experiment, map_output=map_out)
-
-        return experiment
+    def propose_initial_experiments(self):
+        # seed a campaign without experiments with a batch from its initial design
+        n = min( self.initial_experiments, self.max_experiments )
+        return self.propose_design_experiments(self.initial_design, n)
 
     def __str__(self):
         return "{}: {}".format(self.for_map, self.name)
@@ -117,23 +189,59 @@ class Campaign_File(models.Model):
 ############################################################
 # Experiment
 ############################################################
+class ExperimentNameSequence(models.Model):
+    campaign = models.ForeignKey(Campaign, related_name='+', on_delete=models.CASCADE)
+    mode = models.CharField(max_length=255)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+                models.UniqueConstraint(fields=['campaign', 'mode'], name='unique_expseq_ref')
+            ]
+
+    def __str__(self):
+        return "{}: {} ({})".format(self.campaign, self.mode, self.last_value)
+
 class ExperimentManager(models.Manager):
-    def new_proposed(self, campaign, mode):
+    def name_sequence(self, campaign, mode):
+        # proposal modes are matched case-insensitively, as experiment names were before sequences
+        seq_mode = mode.lower()
+
+        try:
+            return ExperimentNameSequence.objects.get(campaign=campaign, mode=seq_mode)
+        except ExperimentNameSequence.DoesNotExist:
+            pass
+
+        # first use - continue numbering from experiments named before the sequence existed
         base_name = "Experiment - {}".format(mode)
         name_regex = "^{}\\s\\d+$".format(base_name)
         exclude_regex = "(?<={})\\s*\\d+".format(base_name)
 
-        q = Experiment.objects.filter(campaign=campaign, name__iregex=name_regex)
-        if (len(q)==0):
-            name = "{} {}".format(base_name, 1)
-        else:
-            max_num = 0
-            for exp_name in q.values_list('name', flat=True):
-                num = int( re.search(exclude_regex, exp_name).group() )
-                if (num > max_num):
-                    max_num = num
+        max_num = 0
+        for exp_name in Experiment.objects.filter(campaign=campaign, name__iregex=name_regex).values_list('name', flat=True):
+            num = int( re.search(exclude_regex, exp_name, re.IGNORECASE).group() )
+            if (num > max_num):
+                max_num = num
+
+        try:
+            with transaction.atomic():
+                return ExperimentNameSequence.objects.create(campaign=campaign, mode=seq_mode, last_value=max_num)
+        except IntegrityError:
+            # created by a parallel proposer
+            return ExperimentNameSequence.objects.get(campaign=campaign, mode=seq_mode)
+
+    def allocate_names(self, campaign, mode, count=1):
+        base_name = "Experiment - {}".format(mode)
 
-            name = "{} {}".format(base_name, max_num+1)
+        with transaction.atomic():
+            sequence = self.name_sequence(campaign, mode)
+            ExperimentNameSequence.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + count)
+            last_value = ExperimentNameSequence.objects.values_list('last_value', flat=True).get(pk=sequence.pk)
+
+        return [ "{} {}".format(base_name, num) for num in range(last_value - count + 1, last_value + 1) ]
+
+    def new_proposed(self, campaign, mode):
+        name = self.allocate_names(campaign, mode)[0]
 
         experiment = Experiment(campaign=campaign, name=name)
         experiment.save()
@@ -157,6 +265,8 @@ class Experiment(models.Model):
     facility_expid = models.IntegerField(null=True, blank=True)
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
+    next_poll = models.DateTimeField(null=True, blank=True)
+    poll_interval = models.FloatField(null=True, blank=True)
 
     objects = ExperimentManager()
 
@@ -198,6 +308,8 @@ class ExpStage(models.Model):
     status = models.CharField(max_length=1, choices=STAGE_STATUS_CHOICES, default='P')
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
+    next_poll = models.DateTimeField(null=True, blank=True)
+    poll_interval = models.FloatField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -207,6 +319,36 @@ class ExpStage(models.Model):
     def __str__(self):
         return "{}: {}".format(self.experiment, self.map_stage.name)
 
+############################################################
+# Stage Durations
+#   running quantiles of how long a stage takes at a facility
+############################################################
+class StageDuration(models.Model):
+    QUANTILES = (0.5, 0.9)
+
+    map_stage = models.ForeignKey(MapStage, related_name='+', on_delete=models.CASCADE)
+    facility = models.ForeignKey(MapFacility, related_name='+', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+    quantiles = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+                models.UniqueConstraint(fields=['map_stage', 'facility'], name='unique_stgdur_ref')
+            ]
+
+    def add(self, seconds):
+        for p in self.QUANTILES:
+            estimate = StreamingQuantile(p, self.quantiles.get(str(p)))
+            estimate.add(seconds)
+            self.quantiles[str(p)] = estimate.state()
+        self.count += 1
+
+    def quantile(self, p):
+        return StreamingQuantile(p, self.quantiles.get(str(p))).value()
+
+    def __str__(self):
+        return "{}: {}".format(self.facility, self.map_stage.name)
+
 ############################################################
 # Inputs
 ############################################################
@@ -282,11 +424,37 @@ class MapOutput(models.Model):
     def __str__(self):
         return "{}: {}".format(self.for_map, self.name)
 
+class ExpOutputValManager(models.Manager):
+    def set_values(self, values):
+        # values: { (experiment_id, map_output_id): value }
+        # existing rows are updated and missing rows created with one statement each
+        remaining = dict(values)
+        experiment_ids = set( experiment_id for experiment_id, map_output_id in remaining )
+        map_output_ids = set( map_output_id for experiment_id, map_output_id in remaining )
+
+        with transaction.atomic():
+            updated = []
+            for exp_out in self.filter(experiment_id__in=experiment_ids, map_output_id__in=map_output_ids):
+                key = (exp_out.experiment_id, exp_out.map_output_id)
+                if key in remaining:
+                    exp_out.value = remaining.pop(key)
+                    updated.append(exp_out)
+            self.bulk_update(updated, ['value'])
+
+            created = self.bulk_create([
+                            ExpOutputVal(experiment_id=experiment_id, map_output_id=map_output_id, value=value)
+                            for (experiment_id, map_output_id), value in remaining.items()
+                        ])
+
+        return updated + created
+
 class ExpOutputVal(models.Model):
     experiment = models.ForeignKey(Experiment, related_name = 'output_values', on_delete=models.CASCADE)
     map_output = models.ForeignKey(MapOutput, related_name = '+', on_delete=models.CASCADE)
     value = models.FloatField(null=True, blank=True)
 
+    objects = ExpOutputValManager()
+
     class Meta:
         constraints = [
                 models.UniqueConstraint(fields=['experiment', 'map_output'], name='unique_expoutval_ref')
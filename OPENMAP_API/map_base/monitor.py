@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from rest_framework.status import HTTP_200_OK
+
+from map_base.models import Experiment, ExpStage
+from map_base.durations import duration_table, expected_experiment_duration, expected_stage_duration, next_poll
+from map_base.facility import facility_client
+from map_base.schema import get_map_schema
+from map_base.serializers import StageStatusSerializer, ExperimentStatusSerializer
+
+############################################################
+# experiment monitoring
+#
+# experiments placed at a facility and not yet finished are polled
+# by one periodic sweep instead of a retrying task per experiment
+# each experiment and stage is polled once its next_poll time is due
+############################################################
+EXPERIMENT_ACTIVE_STATUSES = ('Q', 'R', 'H')
+STAGE_ACTIVE_STATUSES = ('P', 'Q', 'R', 'H')
+
+def poll_facility(facility, experiments, stages):
+    # status of each experiment and stage at one facility, None if the facility gave no status
+    # one bulk call where the facility supports it, otherwise a call per experiment and stage
+    # polling stops at the first failed call, leaving the rest for the next sweep
+    # runs outside the database - stage names are resolved by the caller
+    client = facility_client(facility)
+    experiment_status = {}
+    stage_status = {}
+
+    try:
+        facility_expids = { experiment.facility_expid for experiment in experiments } | { stage.experiment.facility_expid for stage, stage_name in stages }
+        bulk = client.bulk_get( 'status', sorted(facility_expids) )
+        if ( bulk is not None ):
+            for experiment in experiments:
+                experiment_status[experiment.id] = bulk_status( bulk.get( str(experiment.facility_expid) ) )
+            for stage, stage_name in stages:
+                stage_status[stage.id] = bulk_status( bulk.get( str(stage.experiment.facility_expid) ), stage_name )
+            return experiment_status, stage_status
+
+        for experiment in experiments:
+            response = client.get( 'experiment/{}/status/'.format(experiment.facility_expid) )
+            experiment_status[experiment.id] = response.json() if ( response.status_code == HTTP_200_OK ) else None
+
+        for stage, stage_name in stages:
+            response = client.get( 'experiment/{}/status/{}/'.format(stage.experiment.facility_expid, stage_name) )
+            stage_status[stage.id] = response.json() if ( response.status_code == HTTP_200_OK ) else None
+    except (requests.RequestException, ValueError):
+        pass
+
+    return experiment_status, stage_status
+
+def fetch_results(client, facility_expid, stage_names):
+    # results of every stage of an experiment - one bulk call where the facility supports it
+    bulk = client.bulk_get( 'results', [facility_expid] )
+    if ( bulk is not None ):
+        return bulk.get( str(facility_expid), {} )
+
+    received_results = {}
+    for stage_name in stage_names:
+        response = client.get( 'experiment/{}/results/{}/'.format(facility_expid, stage_name) )
+        received_results.update( response.json() )
+    return received_results
+
+def bulk_status(exp_status, stage_name=None):
+    # status data of an experiment or one of its stages from a bulk status response
+    if ( exp_status is None ):
+        return None
+    if ( stage_name is None ):
+        return {'status': exp_status['status']}
+    if ( stage_name not in exp_status.get('modules', {}) ):
+        return None
+    return {'status': exp_status['modules'][stage_name]}
+
+def apply_status(instance, serializer_class, data):
+    # returns True if the status changed
+    if data is None:
+        return False
+
+    old_status = instance.status
+    serializer = serializer_class(instance, data=data)
+    if serializer.is_valid():
+        serializer.save()
+    return ( instance.status != old_status )
+
+def sweep_experiments(now=None):
+    # polls experiments and stages whose next poll is due
+    # returns ( { campaign name: [ (experiment name, new status) ] }, [ (campaign, experiment, stage, new status) ] )
+    now = now or timezone.now()
+    due = Q(next_poll__isnull=True) | Q(next_poll__lte=now)
+
+    experiments = list( Experiment.objects.filter(due, status__in=EXPERIMENT_ACTIVE_STATUSES, facility__isnull=False)
+                            .select_related('facility', 'campaign') )
+    stages = list( ExpStage.objects.filter(due, status__in=STAGE_ACTIVE_STATUSES,
+                                            experiment__status__in=EXPERIMENT_ACTIVE_STATUSES, experiment__facility__isnull=False)
+                            .select_related('experiment__facility', 'experiment__campaign') )
+    if ( len(experiments) == 0 and len(stages) == 0 ):
+        return {}, []
+
+    by_facility = {}
+    for experiment in experiments:
+        by_facility.setdefault( experiment.facility_id, (experiment.facility, [], []) )[1].append(experiment)
+    for stage in stages:
+        stage_name = get_map_schema(stage.experiment.campaign.for_map_id).stage_by_id[stage.map_stage_id].name
+        by_facility.setdefault( stage.experiment.facility_id, (stage.experiment.facility, [], []) )[2].append( (stage, stage_name) )
+
+    # facilities are polled concurrently, each over its own pooled session
+    with ThreadPoolExecutor( max_workers=min( len(by_facility), settings.MAP_MONITOR_SWEEP_WORKERS ) ) as executor:
+        polled = list( executor.map( lambda group: poll_facility(*group), by_facility.values() ) )
+
+    durations = duration_table( list(by_facility) )
+    experiment_transitions = {}
+    stage_transitions = []
+    unchanged_experiments = []
+    unchanged_stages = []
+    with transaction.atomic():
+        for (facility, facility_experiments, facility_stages), (experiment_status, stage_status) in zip(by_facility.values(), polled):
+            for experiment in facility_experiments:
+                if ( experiment.id not in experiment_status ):
+                    continue
+                if ( apply_status(experiment, ExperimentStatusSerializer, experiment_status[experiment.id]) ):
+                    experiment_transitions.setdefault( experiment.campaign.name, [] ).append( (experiment.name, experiment.status) )
+                else:
+                    next_poll( experiment, expected_experiment_duration(experiment, durations), now )
+                    unchanged_experiments.append(experiment)
+
+            for stage, stage_name in facility_stages:
+                if ( stage.id not in stage_status ):
+                    continue
+                if ( apply_status(stage, StageStatusSerializer, stage_status[stage.id]) ):
+                    stage_transitions.append( (stage.experiment.campaign.name, stage.experiment.name, stage_name, stage.status) )
+                else:
+                    next_poll( stage, expected_stage_duration(stage, facility.id, durations), now )
+                    unchanged_stages.append(stage)
+
+        Experiment.objects.bulk_update(unchanged_experiments, ['next_poll', 'poll_interval'])
+        ExpStage.objects.bulk_update(unchanged_stages, ['next_poll', 'poll_interval'])
+
+    return experiment_transitions, stage_transitions
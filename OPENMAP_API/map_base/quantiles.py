@@ -0,0 +1,68 @@
+############################################################
+# StreamingQuantile
+#
+# P-squared estimate of one quantile of a stream of observations
+# (Jain and Chlamtac, 1985) kept in five markers, so the state stays
+# the same size however many observations are added
+############################################################
+class StreamingQuantile:
+    def __init__(self, p, state=None):
+        self.p = p
+        state = state or {}
+        self.heights = list( state.get('heights', []) )
+        self.positions = list( state.get('positions', []) )
+        self.desired = list( state.get('desired', []) )
+
+    @property
+    def count(self):
+        return self.positions[4] if len(self.positions) == 5 else len(self.heights)
+
+    def state(self):
+        return { 'heights': self.heights, 'positions': self.positions, 'desired': self.desired }
+
+    def add(self, x):
+        if ( len(self.positions) < 5 ):
+            # collect the first five observations directly
+            self.heights = sorted( self.heights + [x] )
+            if ( len(self.heights) == 5 ):
+                p = self.p
+                self.positions = [1, 2, 3, 4, 5]
+                self.desired = [1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5]
+            return
+
+        q, n = self.heights, self.positions
+        if ( x < q[0] ):
+            q[0] = x
+            k = 0
+        elif ( x >= q[4] ):
+            q[4] = x
+            k = 3
+        else:
+            k = next( i for i in range(4) if q[i] <= x < q[i+1] )
+
+        for i in range(k+1, 5):
+            n[i] += 1
+        increments = [0, self.p/2, self.p, (1 + self.p)/2, 1]
+        self.desired = [ d + inc for d, inc in zip(self.desired, increments) ]
+
+        # move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if ( (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1) ):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i+1] - n[i-1]) * (
+                                (n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i])
+                                + (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1]) )
+                if ( q[i-1] < parabolic < q[i+1] ):
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if ( len(self.heights) == 0 ):
+            return None
+        if ( len(self.positions) < 5 ):
+            # nearest rank of the observations so far
+            return self.heights[ min( int(self.p * len(self.heights)), len(self.heights) - 1 ) ]
+        return self.heights[2]
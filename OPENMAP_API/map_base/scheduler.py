@@ -0,0 +1,43 @@
+from django.db.models import Count
+
+from map_base.models import Experiment, MapFacility
+
+############################################################
+# FacilityScheduler
+#
+# chooses facilities of a MAP for new experiments
+#   load is the number of experiments queued, running or suspended
+#   at a facility - a suspended experiment keeps its place there
+#   facilities are tried least loaded first, relative to their capacity
+#   facilities at capacity are not offered (capacity 0 is unlimited)
+#
+#   loads are a snapshot taken when the scheduler is built and
+#   are updated by assign() as experiments are placed
+############################################################
+class FacilityScheduler:
+    IN_FLIGHT_STATUSES = ('Q', 'R', 'H')
+
+    def __init__(self, facilities, loads):
+        self.facilities = list(facilities)
+        self.loads = { facility.id: loads.get(facility.id, 0) for facility in self.facilities }
+
+    @classmethod
+    def for_map(cls, for_map):
+        facilities = MapFacility.objects.filter(for_map=for_map).order_by('id')
+        loads = dict( Experiment.objects.filter(facility__for_map=for_map, status__in=cls.IN_FLIGHT_STATUSES)
+                        .values_list('facility_id').annotate(n=Count('id')).order_by() )
+        return cls(facilities, loads)
+
+    def has_capacity(self, facility):
+        return ( facility.capacity == 0 or self.loads[facility.id] < facility.capacity )
+
+    def candidates(self):
+        # facilities with room for another experiment, best choice first
+        def fill(facility):
+            weight = facility.capacity if facility.capacity > 0 else 1
+            return ( (self.loads[facility.id] + 1) / weight, facility.id )
+
+        return sorted( [ facility for facility in self.facilities if self.has_capacity(facility) ], key=fill )
+
+    def assign(self, facility):
+        self.loads[facility.id] += 1
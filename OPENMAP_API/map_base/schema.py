@@ -0,0 +1,96 @@
+import random
+import time
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+
+from map_base.models import MapBase, MapInput, MapOutput, MapStage
+
+############################################################
+# MapSchema
+#
+# static description of a MAP (stages, inputs, outputs)
+# built with one query per table and shared between requests
+############################################################
+class MapSchema:
+    def __init__(self, map_id, stages, inputs, outputs):
+        self.map_id = map_id
+
+        self.stages = list(stages)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+        self.stage_by_id = { stage.id: stage for stage in self.stages }
+        self.stage_by_name = { stage.name: stage for stage in self.stages }
+        self.input_by_id = { map_input.id: map_input for map_input in self.inputs }
+        self.input_by_name = { map_input.name: map_input for map_input in self.inputs }
+        self.output_by_id = { map_output.id: map_output for map_output in self.outputs }
+        self.output_by_name = { map_output.name: map_output for map_output in self.outputs }
+
+        # column order of the bounds arrays follows self.inputs
+        self.input_index = { map_input.name: i for i, map_input in enumerate(self.inputs) }
+        self.input_min = np.array( [ map_input.min_val for map_input in self.inputs ], dtype=np.float64 )
+        self.input_max = np.array( [ map_input.max_val for map_input in self.inputs ], dtype=np.float64 )
+
+        self.stage_inputs = { stage.id: [] for stage in self.stages }
+        for map_input in self.inputs:
+            if map_input.for_stage_id in self.stage_inputs:
+                self.stage_inputs[map_input.for_stage_id].append(map_input)
+
+        self.stage_outputs = { stage.id: [] for stage in self.stages }
+        for map_output in self.outputs:
+            if map_output.from_stage_id in self.stage_outputs:
+                self.stage_outputs[map_output.from_stage_id].append(map_output)
+
+    @classmethod
+    def load(cls, map_id):
+        return cls(
+                    map_id,
+                    MapStage.objects.filter(for_map_id=map_id).order_by('id'),
+                    MapInput.objects.filter(for_map_id=map_id).order_by('id'),
+                    MapOutput.objects.filter(for_map_id=map_id).order_by('id'),
+                )
+
+############################################################
+# cache
+#
+# the version of a MAP's schema is MapBase.schema_version, so every
+# process (web or celery worker) sees a change once it is committed
+# schemas are kept in-process and in the django cache by version, and a
+# process checks the version at most every MAP_SCHEMA_VERSION_CHECK seconds
+############################################################
+SCHEMA_CACHE_TIMEOUT = 24*60*60
+
+_local_schemas = {}
+
+def _schema_key(map_id, version):
+    return 'map_base:schema:{}:{}'.format(map_id, version)
+
+def get_map_schema(for_map):
+    map_id = getattr(for_map, 'pk', for_map)
+    now = time.monotonic()
+
+    local = _local_schemas.get(map_id)
+    if local is not None and now - local[2] < settings.MAP_SCHEMA_VERSION_CHECK:
+        return local[1]
+
+    version = MapBase.objects.filter(pk=map_id).values_list('schema_version', flat=True).first()
+    if local is not None and local[0] == version:
+        _local_schemas[map_id] = (version, local[1], now)
+        return local[1]
+
+    schema = cache.get(_schema_key(map_id, version))
+    if schema is None:
+        schema = MapSchema.load(map_id)
+        cache.set(_schema_key(map_id, version), schema, SCHEMA_CACHE_TIMEOUT)
+
+    _local_schemas[map_id] = (version, schema, now)
+    return schema
+
+def invalidate_map_schema(map_id):
+    # other processes load the new schema once this is committed. The version is random
+    # rather than a count so a version rolled back with its transaction is not reused
+    _local_schemas.pop(map_id, None)
+    MapBase.objects.filter(pk=map_id).update( schema_version=random.getrandbits(31) )
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from map_base.models import Experiment, ExpStage
+from map_base.durations import expected_experiment_duration, expected_stage_duration, first_poll, record_stage_duration
 from django.utils import timezone
 
 class ExperimentStatusSerializer(serializers.Serializer):
@@ -20,6 +21,9 @@ class ExperimentStatusSerializer(serializers.Serializer):
             instance.start_time = validated_data.get('time', timezone.localtime())
         elif ( instance.status == 'C' and old_status in ('P', 'Q', 'R', 'H') ):
             instance.end_time = validated_data.get('time', timezone.localtime())
+        if ( instance.status != old_status ):
+            expected = expected_experiment_duration(instance) if ( instance.status == 'R' and instance.facility_id is not None ) else None
+            first_poll(instance, expected, timezone.now())
         instance.save()
         return instance
 
@@ -41,5 +45,12 @@ class StageStatusSerializer(serializers.Serializer):
             instance.start_time = validated_data.get('time', timezone.localtime())
         elif ( instance.status == 'C' and old_status in ('P', 'Q', 'R', 'H') ):
             instance.end_time = validated_data.get('time', timezone.localtime())
+        if ( instance.status != old_status ):
+            facility_id = instance.experiment.facility_id
+            expected = expected_stage_duration(instance, facility_id) if ( instance.status == 'R' and facility_id is not None ) else None
+            first_poll(instance, expected, timezone.now())
         instance.save()
+
+        if ( instance.status == 'C' and old_status in ('P', 'Q', 'R', 'H') ):
+            record_stage_duration(instance, instance.experiment.facility_id)
         return instance
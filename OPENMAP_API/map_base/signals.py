@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from map_base.models import MapBase, MapStage, MapInput, MapOutput
+from map_base.schema import invalidate_map_schema
+
+############################################################
+# keep cached MAP schemas in step with the database
+############################################################
+@receiver([post_save, post_delete], sender=MapBase)
+def map_changed(sender, instance, **kwargs):
+    invalidate_map_schema(instance.pk)
+
+@receiver([post_save, post_delete], sender=MapStage)
+@receiver([post_save, post_delete], sender=MapInput)
+@receiver([post_save, post_delete], sender=MapOutput)
+def map_schema_changed(sender, instance, **kwargs):
+    invalidate_map_schema(instance.for_map_id)
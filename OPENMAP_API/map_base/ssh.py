@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+
+from paramiko import SSHClient, SSHException
+
+from django.conf import settings
+
+############################################################
+# SSHConnection
+# one authenticated client for a host, shared by the tasks of a worker process
+############################################################
+class SSHConnection:
+    def __init__(self, host, max_channels, timeout):
+        self.host = host
+        self.client = SSHClient()
+        self.client.load_system_host_keys()
+        self.client.connect(host, timeout=timeout, banner_timeout=timeout, auth_timeout=timeout)
+
+        # limit the sessions opened at once on one transport (sshd MaxSessions)
+        self.channels = threading.BoundedSemaphore(max_channels)
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        # dropped from the pool - closed once no task is using it
+        self.discarded = False
+
+    def is_healthy(self):
+        transport = self.client.get_transport()
+        if ( transport is None or not transport.is_active() ):
+            return False
+
+        try:
+            transport.send_ignore()
+        except (SSHException, OSError, EOFError):
+            return False
+        return True
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+############################################################
+# SSHPool
+#
+# connections keyed by host, reused across tasks
+#   connections are checked before reuse and replaced if dropped
+#   connections unused for idle_timeout seconds are closed
+#   each host allows at most max_channels commands to be started at once
+#   connecting and checking happen outside the pool lock, so a slow
+#   host does not hold up tasks using other hosts
+############################################################
+class SSHPool:
+    def __init__(self, idle_timeout=None, max_channels=None, connect_timeout=None):
+        self.idle_timeout = idle_timeout
+        self.max_channels = max_channels
+        self.connect_timeout = connect_timeout
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.reaper = None
+
+    def get_idle_timeout(self):
+        return self.idle_timeout if self.idle_timeout is not None else settings.MAP_SSH_IDLE_TIMEOUT
+
+    def get_max_channels(self):
+        return self.max_channels if self.max_channels is not None else settings.MAP_SSH_MAX_CHANNELS
+
+    def get_connect_timeout(self):
+        return self.connect_timeout if self.connect_timeout is not None else settings.MAP_SSH_CONNECT_TIMEOUT
+
+    def acquire(self, host):
+        with self.lock:
+            connection = self.connections.get(host)
+            if ( connection is not None ):
+                connection.in_use += 1
+                # a connection other tasks are using was checked by the first of them
+                check = ( connection.in_use == 1 )
+
+        if ( connection is not None ):
+            if ( not check or connection.is_healthy() ):
+                return connection
+            self.release(connection, discard=True)
+
+        new_connection = SSHConnection(host, self.get_max_channels(), self.get_connect_timeout())
+        with self.lock:
+            connection = self.connections.get(host)
+            if ( connection is None ):
+                connection = new_connection
+                self.connections[host] = connection
+                self.start_reaper()
+            connection.in_use += 1
+
+        if ( connection is not new_connection ):
+            # another task connected first
+            new_connection.close()
+        return connection
+
+    def release(self, connection, discard=False):
+        with self.lock:
+            connection.in_use -= 1
+            connection.last_used = time.monotonic()
+
+            if ( discard ):
+                connection.discarded = True
+                if ( self.connections.get(connection.host) is connection ):
+                    del self.connections[connection.host]
+            close = ( connection.discarded and connection.in_use == 0 )
+
+        if ( close ):
+            connection.close()
+
+    def exec_command(self, host, command):
+        # start command on host without waiting for it to finish
+        # a connection that dropped since it was checked is replaced once
+        for attempt in range(2):
+            connection = self.acquire(host)
+            try:
+                with connection.channels:
+                    stdin, stdout, stderr = connection.client.exec_command(command)
+                    stdout.channel.close()
+            except (SSHException, OSError, EOFError):
+                self.release(connection, discard=True)
+                if ( attempt > 0 ):
+                    raise
+            else:
+                self.release(connection)
+                return
+
+    def reap(self):
+        now = time.monotonic()
+        with self.lock:
+            for host, connection in list( self.connections.items() ):
+                if ( connection.in_use == 0 and now - connection.last_used > self.get_idle_timeout() ):
+                    del self.connections[host]
+                    connection.close()
+
+    def close_all(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.discarded = True
+                connection.close()
+            self.connections = {}
+
+    def start_reaper(self):
+        # called with the lock held
+        if ( self.reaper is not None and self.reaper.is_alive() ):
+            return
+
+        def reap_idle():
+            while True:
+                time.sleep( max(self.get_idle_timeout() / 2, 1) )
+                self.reap()
+
+        self.reaper = threading.Thread(target=reap_idle, name='ssh-pool-reaper', daemon=True)
+        self.reaper.start()
+
+    def reset(self):
+        # forked worker processes must not share the parent's sockets
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.reaper = None
+
+ssh_pool = SSHPool()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork( after_in_child=ssh_pool.reset )
@@ -1,16 +1,26 @@
 from __future__ import absolute_import, unicode_literals
 from celery import shared_task, Task
 from celery.exceptions import TaskError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
 import requests
-from paramiko import SSHClient
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
-from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_202_ACCEPTED
 
 from map_base.models import Campaign, Experiment, ExpStage, ExpInputVal, ExpOutputVal
-from map_base.models import MapFacility
-from map_base.serializers import StageStatusSerializer, ExperimentStatusSerializer
+from map_base.facility import facility_client, facility_latency_stats
+from map_base.monitor import fetch_results, sweep_experiments
+from map_base.scheduler import FacilityScheduler
+from map_base.schema import get_map_schema
+from map_base.ssh import ssh_pool
+
+logger = logging.getLogger(__name__)
 
 ############################################################
 #  custom task exceptions
@@ -45,6 +55,31 @@ def monitor_training_status(self, campaign_name, status):
     if ( continue_monitoring ):
         self.retry()
 
+############################################################
+#   where ML scripts read training data from
+#   'api' fetches it from ml-api trainingData/, anything else is
+#   the database file, for ML hosts sharing the API's filesystem
+############################################################
+def ml_data_source():
+    if ( settings.MAP_ML_DATA_SOURCE == 'api' ):
+        return 'api'
+    return settings.DATABASES['default']['NAME']
+
+############################################################
+#   ask an ML facility's gp_server (OPENMAP_GP/gp_server.py) to train or probe
+#   the server keeps models in memory and reports back to the ml-api as the scripts do
+#   the server reads training data from its own configured source (ml-api or --database)
+#   requests carry the server's shared key (MAP_ML_SERVER_KEY)
+#   returns True if the server accepted the request
+############################################################
+def ml_server_request(ml_facility, task, request):
+    server_url = ml_facility.server_url if ml_facility.server_url.endswith('/') else ml_facility.server_url + '/'
+    try:
+        response = facility_client(server_url).post( '{}/'.format(task), json=request, headers={'X-GP-Server-Key': settings.MAP_ML_SERVER_KEY} )
+    except requests.RequestException:
+        return False
+    return ( response.status_code == HTTP_202_ACCEPTED )
+
 ############################################################
 #   
 ############################################################
@@ -54,91 +89,226 @@ def probe_model(self, campaign_name):
     ml_host = campaign.with_ml.location
     probe_command = campaign.with_ml.probe_script
     model_name = campaign.uid_node
-    db_name = settings.DATABASES['default']['NAME']
+    data_source = ml_data_source()
     num_samples = 1                     # hardcoded until scheme for determining how many to multi-select
-    api_base = 'http://localhost:8000/ml-api/' # hardcoded for testing
+    api_base = settings.MAP_ML_API_BASE
 
-    ssh = SSHClient()
-    ssh.load_system_host_keys()
-    ssh.connect(ml_host)
+    if ( campaign.with_ml.server_url ):
+        request = { 'campaign_name': campaign_name, 'model': model_name, 'num_samples': num_samples }
+        if not ( ml_server_request(campaign.with_ml, 'probe', request) ):
+            raise self.retry(countdown=60)
+    else:
+        ssh_pool.exec_command(ml_host, '{} "{}" {} {} {} {}'.format(probe_command, campaign_name, model_name, data_source, num_samples, api_base))
 
-    stdin, stdout, stderr = ssh.exec_command('{} "{}" {} {} {} {}'.format(probe_command, campaign_name, model_name, db_name, num_samples, api_base))
+############################################################
+#   request a model update
+#   requests within the debounce window collapse into one training launch
+############################################################
+@shared_task(bind=True, ignore_result=True)
+def update_model(self, campaign_name):
+    campaign = Campaign.objects.get(name=campaign_name)
 
-    ssh.close()
+    if ( campaign.request_model_update() ):
+        train_model.apply_async( (campaign_name,), countdown=settings.MAP_ML_UPDATE_DEBOUNCE )
 
 ############################################################
-#   
+#   schedule training again for campaigns with an update requested
+#   but no training launch scheduled or running - the launch was lost
+#   or never scheduled. A model that failed training ('E') waits for
+#   new data or a reset rather than being retried every sweep
+#   run by the periodic sweep (monitor_experiments)
+############################################################
+def reschedule_model_updates(now=None):
+    now = now or timezone.now()
+    waiting = Campaign.objects.filter( Campaign.update_not_scheduled(now), ml_update_requested=True, ml_model_status__in=('U', 'O', 'T') )
+
+    for campaign in waiting:
+        if ( campaign.request_model_update() ):
+            train_model.apply_async( (campaign.name,), countdown=settings.MAP_ML_UPDATE_DEBOUNCE )
+
+############################################################
+#   launch model training
 ############################################################
 @shared_task(bind=True, ignore_result=True)
-def update_model(self, campaign_name):
+def train_model(self, campaign_name):
     campaign = Campaign.objects.get(name=campaign_name)
     ml_host = campaign.with_ml.location
     train_command = campaign.with_ml.train_script
     model_name = campaign.uid_node
-    db_name = settings.DATABASES['default']['NAME']
-    api_base = 'http://localhost:8000/ml-api/' # hardcoded for testing
-
-    if ( campaign.ml_model_status in [ "R", "T" ] ):
-        # don't bother if already updating model or just updated
-        return # possibly change to raising an exception to prevent followups in a chain?
+    data_source = ml_data_source()
+    api_base = settings.MAP_ML_API_BASE
+
+    if not ( campaign.claim_model_update() ):
+        # already training - the request stays flagged and training is run again once reported complete
+        return
+
+    if ( campaign.with_ml.server_url ):
+        request = { 'campaign_name': campaign_name, 'model': model_name }
+        if not ( ml_server_request(campaign.with_ml, 'train', request) ):
+            # training was claimed but not started - report it failed so it can be requested again
+            campaign.ml_transition('fail_training')
     else:
-        campaign.ml_model_status = "R"
-        campaign.save()
-
-        ssh = SSHClient()
-        ssh.load_system_host_keys()
-        ssh.connect(ml_host)
-
-        stdin, stdout, stderr = ssh.exec_command('{} "{}" {} {} {}'.format(train_command, campaign_name, model_name, db_name, api_base))
-
-        ssh.close()
+        try:
+            ssh_pool.exec_command(ml_host, '{} "{}" {} {} {}'.format(train_command, campaign_name, model_name, data_source, api_base))
+        except Exception:
+            # training was claimed but not started - report it failed so it can be requested again
+            campaign.ml_transition('fail_training')
+            raise
 
 ############################################################
 #   send new experiment to a facility
+#   an experiment left proposed is placed by a later sweep
 ############################################################
 @shared_task(bind=True, ignore_result=True)
 def place_experiment(self, campaign_name, experiment_name):
-    placed = False
+    experiments = Experiment.objects.select_related('campaign').filter(campaign__name=campaign_name, name=experiment_name, status='P')
+    if ( len(experiments) > 0 ):
+        place_proposed(list(experiments))
 
-    experiment = Experiment.objects.get(campaign__name=campaign_name, name=experiment_name)
-    exp_uid = { 'experiment_name': experiment_name, 'campaign_name': campaign_name }
+############################################################
+#   send a batch of new experiments to facilities in one pass
+#   experiments left proposed are placed by a later sweep
+############################################################
+@shared_task(bind=True, ignore_result=True)
+def place_experiments(self, campaign_name, experiment_names):
+    experiments = { experiment.name: experiment for experiment in
+                        Experiment.objects.select_related('campaign').filter(campaign__name=campaign_name, name__in=experiment_names, status='P') }
+    experiments = [ experiments[name] for name in experiment_names if name in experiments ]
+    if ( len(experiments) > 0 ):
+        place_proposed(experiments)
 
-    for facility in MapFacility.objects.all():
-        url_new_experiment = facility.location + 'experiment/new/'
+############################################################
+#   place every proposed experiment due for placement, one pass per MAP
+#   run by the periodic sweep (monitor_experiments)
+############################################################
+def place_pending_experiments(now=None):
+    now = now or timezone.now()
+    pending = ( Experiment.objects.select_related('campaign').filter(status='P')
+                    .filter( Q(next_poll__isnull=True) | Q(next_poll__lte=now) ).order_by('id') )
 
-        new_exp_response = requests.post( url_new_experiment, json=exp_uid )
-        if ( new_exp_response.status_code == HTTP_201_CREATED ):
-            placed = True
-            experiment.facility = facility
-            experiment.facility_expid = new_exp_response.json()['id']
-            experiment.status = 'Q'
-            experiment.save()
+    by_map = {}
+    for experiment in pending:
+        by_map.setdefault(experiment.campaign.for_map_id, []).append(experiment)
 
-            # facilty expects input values to be provided stage-by-stage
-            for stage in experiment.stages.all():
-                url_inp = facility.location + 'experiment/{}/config/{}/'.format(experiment.facility_expid, stage.map_stage.name)
-                stage_inputs = experiment.input_values.filter(map_input__for_stage__name=stage.map_stage.name)
-                inp_data = [ {'input_name': i.map_input.name, 'input_value': i.value_request} for i in stage_inputs ]
+    for experiments in by_map.values():
+        place_proposed(experiments, now)
 
-                stage_config_response = requests.post( url_inp, json=inp_data )
-                # if ( stage_config_response != HTTP_200_OK )
-                    # respond to status code
+############################################################
+#   place proposed experiments of one MAP in turn while its facilities have room
+#   each experiment is claimed for MAP_PLACEMENT_RETRY_DELAY seconds before it is sent,
+#   so a concurrent task or sweep does not place it again - one left unplaced
+#   is placed by the first sweep after its claim lapses
+#   returns the number of experiments placed
+############################################################
+def place_proposed(experiments, now=None):
+    now = now or timezone.now()
+    schema = get_map_schema(experiments[0].campaign.for_map_id)
+    scheduler = FacilityScheduler.for_map(experiments[0].campaign.for_map_id)
+    stage_inputs = load_stage_inputs(experiments, schema)
+
+    placed = 0
+    for experiment in experiments:
+        # once every facility is full no further facility calls are made
+        if ( len(scheduler.candidates()) == 0 ):
+            break
+        if not ( claim_placement(experiment, now) ):
+            continue
+        if ( schedule_experiment(experiment, scheduler, schema, stage_inputs[experiment.id]) ):
+            placed += 1
 
-            url_queue = facility.location + 'queue/append/'
-            queue_data = { 'id': experiment.facility_expid }
+    return placed
 
-            queue_response = requests.post( url_queue, json=queue_data )
-            #if ( queue_response.status_code == sHTTP_200_OK ):
-                # trigger status monitoring
-            #else:
-                # respond to alternate status codes
+def claim_placement(experiment, now):
+    claim_until = now + timedelta(seconds=settings.MAP_PLACEMENT_RETRY_DELAY)
+    claimed = ( Experiment.objects.filter(pk=experiment.pk, status='P')
+                    .filter( Q(next_poll__isnull=True) | Q(next_poll__lte=now) ).update(next_poll=claim_until) )
+    return ( claimed == 1 )
 
+############################################################
+#   inputs of each experiment grouped by stage, as sent to a facility
+#   { experiment id: { map stage id: [ {input_name, input_value} ] } }
+############################################################
+def load_stage_inputs(experiments, schema):
+    stage_inputs = { experiment.id: {} for experiment in experiments }
 
-            # don't need to check additional facilities
-            break
+    for experiment_id, map_stage_id in ExpStage.objects.filter(experiment__in=experiments).values_list('experiment_id', 'map_stage_id'):
+        stage_inputs[experiment_id][map_stage_id] = []
 
-    if not placed:
-        self.retry()
+    for experiment_id, map_input_id, value_request in ExpInputVal.objects.filter(experiment__in=experiments).values_list('experiment_id', 'map_input_id', 'value_request'):
+        map_input = schema.input_by_id[map_input_id]
+        if map_input.for_stage_id in stage_inputs[experiment_id]:
+            stage_inputs[experiment_id][map_input.for_stage_id].append( {'input_name': map_input.name, 'input_value': value_request} )
+
+    return stage_inputs
+
+############################################################
+#   place an experiment at the first facility, in scheduler order, that accepts it
+############################################################
+def schedule_experiment(experiment, scheduler, schema, stage_inputs):
+    for facility in scheduler.candidates():
+        if ( send_experiment(experiment, facility, schema, stage_inputs) ):
+            scheduler.assign(facility)
+            return True
+
+    return False
+
+############################################################
+#   create, configure and queue an experiment at a facility
+#   returns True once the facility has queued the experiment
+############################################################
+def send_experiment(experiment, facility, schema, stage_inputs):
+    client = facility_client(facility)
+    exp_uid = { 'experiment_name': experiment.name, 'campaign_name': experiment.campaign.name }
+
+    try:
+        new_exp_response = client.post( 'experiment/new/', json=exp_uid )
+    except requests.RequestException:
+        # facility not reachable - try the next one
+        return False
+
+    if ( new_exp_response.status_code != HTTP_201_CREATED ):
+        return False
+
+    # facilty expects input values to be provided stage-by-stage
+    facility_expid = new_exp_response.json()['id']
+    if not ( configure_stages(client, facility_expid, schema, stage_inputs) ):
+        return False
+
+    try:
+        queue_response = client.post( 'queue/append/', json={ 'id': facility_expid } )
+    except requests.RequestException:
+        return False
+
+    if ( queue_response.status_code != HTTP_200_OK ):
+        return False
+
+    experiment.facility = facility
+    experiment.facility_expid = facility_expid
+    experiment.status = 'Q'
+    # clear the placement claim - the experiment is polled by the next sweep
+    experiment.next_poll = None
+    experiment.save(update_fields=['facility', 'facility_expid', 'status', 'next_poll'])
+    return True
+
+############################################################
+#   send the inputs of every stage of an experiment to its facility at once
+#   returns True only if every stage configuration was accepted
+############################################################
+def configure_stages(client, facility_expid, schema, stage_inputs):
+    def configure(map_stage_id):
+        url_inp = 'experiment/{}/config/{}/'.format(facility_expid, schema.stage_by_id[map_stage_id].name)
+        try:
+            return client.post( url_inp, json=stage_inputs[map_stage_id] ).status_code
+        except requests.RequestException:
+            return None
+
+    if ( len(stage_inputs) == 0 ):
+        return True
+
+    with ThreadPoolExecutor( max_workers=min( len(stage_inputs), settings.MAP_FACILITY_POOL_SIZE ) ) as executor:
+        status_codes = list( executor.map(configure, stage_inputs) )
+
+    return all( status_code == HTTP_200_OK for status_code in status_codes )
 
 ############################################################
 # if stage has completed
@@ -200,15 +370,75 @@ def experiment_complete_check_expected_returns(self, campaign_name, experiment_n
     if ( ask_again ):
         self.retry()
     else:
-        campaign = Campaign.objects.get(name=campaign_name)
-        campaign.ml_model_status = "O"
-        campaign.save()
+        experiment.campaign.ml_transition('data_changed')
+
+############################################################
+# place proposed experiments and poll facilities for the status
+# of every active experiment, then log the facility call times
+# seen by this worker process
+# run periodically by celery beat (CELERY_BEAT_SCHEDULE)
+############################################################
+@shared_task(bind=True, ignore_result=True)
+def monitor_experiments(self):
+    place_pending_experiments()
+    reschedule_model_updates()
+    experiment_transitions, stage_transitions = sweep_experiments()
+
+    for campaign_name, transitions in experiment_transitions.items():
+        completed = [ experiment_name for experiment_name, status in transitions if status == 'C' ]
+        if ( len(completed) > 0 ):
+            finalize_experiments(campaign_name, completed)
+
+    for campaign_name, experiment_name, stage_name, status in stage_transitions:
+        if ( status == 'C' ):
+            monitor_stage_status.apply_async( (campaign_name, experiment_name, stage_name, status), countdown=10 )
+
+    logger.info( "facility latency: %s", facility_latency_stats() )
+
+############################################################
+# collect the results of each completed experiment of a campaign,
+# then request a model update
+# each experiment is finalized by its own task so one awaiting its
+# results does not hold up the others - the last of the batch to be
+# finalized requests the model update
+############################################################
+def finalize_experiments(campaign_name, experiment_names):
+    for experiment_name in experiment_names:
+        monitor_experiment_status.apply_async( (campaign_name, experiment_name, 'C'), {'batch': experiment_names}, countdown=10 )
+
+############################################################
+# True if any experiment of the batch still awaits a real input value
+# or an output value
+############################################################
+def batch_awaiting_results(campaign_name, experiment_names):
+    experiments = Experiment.objects.filter(campaign__name=campaign_name, name__in=experiment_names)
+    return ( ExpInputVal.objects.filter(experiment__in=experiments, value_actual=None).exists() or
+                ExpOutputVal.objects.filter(experiment__in=experiments, value=None).exists() )
+
+############################################################
+# write received results into the awaited input actuals and outputs
+# returns True if every awaited value was received
+############################################################
+def apply_results(awaiting_real_inputs, awaiting_outputs, received_results):
+    received_inputs = [ real_input_ask for real_input_ask in awaiting_real_inputs if real_input_ask.map_input.name in received_results ]
+    for real_input_ask in received_inputs:
+        real_input_ask.value_actual = received_results[real_input_ask.map_input.name]
+
+    received_outputs = [ output_ask for output_ask in awaiting_outputs if output_ask.map_output.name in received_results ]
+    for output_ask in received_outputs:
+        output_ask.value = received_results[output_ask.map_output.name]
+
+    with transaction.atomic():
+        ExpInputVal.objects.bulk_update(received_inputs, ['value_actual'])
+        ExpOutputVal.objects.bulk_update(received_outputs, ['value'])
+
+    return ( len(received_inputs) == len(awaiting_real_inputs) and len(received_outputs) == len(awaiting_outputs) )
 
 ############################################################
 # monitor experiment for unusual time in status
 ############################################################
 @shared_task(bind=True, ignore_result=True, max_retries=None, throws=(RedundantTask,))
-def monitor_experiment_status(self, campaign_name, experiment_name, status):
+def monitor_experiment_status(self, campaign_name, experiment_name, status, batch=()):
     continue_monitoring = False
     experiment = Experiment.objects.get(campaign__name=campaign_name, name=experiment_name)
 
@@ -217,61 +447,30 @@ def monitor_experiment_status(self, campaign_name, experiment_name, status):
         # should be final status
         # monitor a Complete experiment until all inputs have real values and all outputs have values
         #
-        awaiting_real_inputs = ExpInputVal.objects.filter( experiment=experiment, value_actual=None )
-        awaiting_outputs = ExpOutputVal.objects.filter( experiment=experiment, value=None )
+        awaiting_real_inputs = list( ExpInputVal.objects.filter( experiment=experiment, value_actual=None ).select_related('map_input') )
+        awaiting_outputs = list( ExpOutputVal.objects.filter( experiment=experiment, value=None ).select_related('map_output') )
 
         if ( len(awaiting_real_inputs) > 0 or len(awaiting_outputs) > 0 ):
-            received_results = {}
-            for stage in experiment.stages.all():
-                url_results = stage.experiment.facility.location + 'experiment/{}/results/{}/'.format(experiment.facility_expid, stage.map_stage.name)
-                response = requests.get( url_results )
-                received_results.update( response.json() )
-
-        for real_input_ask in awaiting_real_inputs:
-            # request value from experiment.facility
-            # if ( fail to receive valid value ):
-            #   ask_again = True
-            if ( real_input_ask.map_input.name in received_results ):
-                real_input_ask.value_actual = received_results[real_input_ask.map_input.name]
-                real_input_ask.save()
-            else:
-                continue_monitoring = True
-
-        for output_ask in awaiting_outputs:
-            # request value from experiment.facility
-            # if ( fail to receive valid value ):
-            #   ask_again = True
-            if ( output_ask.map_output.name in received_results ):
-                output_ask.value = received_results[output_ask.map_output.name]
-                output_ask.save()
-            else:
-                continue_monitoring = True
+            stage_names = [ stage.map_stage.name for stage in experiment.stages.select_related('map_stage') ]
+            try:
+                received_results = fetch_results( facility_client(experiment.facility), experiment.facility_expid, stage_names )
+            except requests.RequestException:
+                raise self.retry()
+            continue_monitoring = not apply_results(awaiting_real_inputs, awaiting_outputs, received_results)
 
         if ( continue_monitoring ):
             raise self.retry()
         else:
-            campaign = Campaign.objects.get(name=campaign_name)
-            campaign.ml_model_status = "O"
-            campaign.save()
+            # a model being trained stays "R" - update_model flags it for retraining
+            experiment.campaign.ml_transition('data_changed')
 
-    else:
-        if ( experiment.status == status ):
-            # contact facility to check for change of status, possible problems
-            url_status = experiment.facility.location + 'experiment/{}/status/'.format(experiment.facility_expid)
-            response = requests.get( url_status )
-            if (response.status_code == HTTP_200_OK):
-                res_serializer = ExperimentStatusSerializer(experiment, data=response.json())
-                if res_serializer.is_valid():
-                    updated_experiment = res_serializer.save()
-
-                    if ( updated_experiment.status != status ):
-                        raise self.retry( (campaign_name, experiment_name, updated_experiment.status) )
+            if ( len(batch) > 0 and not batch_awaiting_results(campaign_name, batch) ):
+                # last experiment of the batch finalized - the model is updated once for the batch
+                update_model.delay(campaign_name)
 
-            raise self.retry()
-        else:
-            # if the experiment status was changed outside of this task, it should have triggered new monitoring
-            # to avoid duplication, let this one end
-            raise RedundantTask()
+    else:
+        # experiments in other statuses are polled by monitor_experiments
+        raise RedundantTask()
 
 ############################################################
 # monitor stage for unusual time in status
@@ -279,59 +478,30 @@ def monitor_experiment_status(self, campaign_name, experiment_name, status):
 @shared_task(bind=True, ignore_result=True, max_retries=None, throws=(RedundantTask,))
 def monitor_stage_status(self, campaign_name, experiment_name, stage_name, status):
     continue_monitoring = False
-    stage = ExpStage.objects.get(experiment__campaign__name=campaign_name, experiment__name=experiment_name, map_stage__name=stage_name)
+    stage = ( ExpStage.objects.select_related('experiment__facility', 'map_stage')
+                .get(experiment__campaign__name=campaign_name, experiment__name=experiment_name, map_stage__name=stage_name) )
 
     if ( status == 'C' ):
         #
         # should be final status
         # monitor a Complete stage until all inputs have real values and all outputs have values
         #
-        awaiting_real_inputs = ExpInputVal.objects.filter( map_input__for_stage=stage.map_stage, value_actual=None )
-        awaiting_outputs = ExpOutputVal.objects.filter( map_output__from_stage=stage.map_stage, value=None )
+        awaiting_real_inputs = list( ExpInputVal.objects.filter( experiment=stage.experiment, map_input__for_stage=stage.map_stage, value_actual=None )
+                                        .select_related('map_input') )
+        awaiting_outputs = list( ExpOutputVal.objects.filter( experiment=stage.experiment, map_output__from_stage=stage.map_stage, value=None )
+                                        .select_related('map_output') )
 
         if ( len(awaiting_real_inputs) > 0 or len(awaiting_outputs) > 0 ):
-            url_results = stage.experiment.facility.location + 'experiment/{}/results/{}/'.format(stage.experiment.facility_expid, stage_name)
-            response = requests.get( url_results )
-            received_results = response.json()
-
-        for real_input_ask in awaiting_real_inputs:
-            # request value from experiment.facility
-            # if ( fail to receive valid value ):
-            #   ask_again = True
-            if ( real_input_ask.map_input.name in received_results ):
-                real_input_ask.value_actual = received_results[real_input_ask.map_input.name]
-                real_input_ask.save()
-            else:
-                continue_monitoring = True
-
-        for output_ask in awaiting_outputs:
-            # request value from experiment.facility
-            # if ( fail to receive valid value ):
-            #   ask_again = True
-            if ( output_ask.map_output.name in received_results ):
-                output_ask.value = received_results[output_ask.map_output.name]
-                output_ask.save()
-            else:
-                continue_monitoring = True
+            url_results = 'experiment/{}/results/{}/'.format(stage.experiment.facility_expid, stage_name)
+            try:
+                response = facility_client(stage.experiment.facility).get( url_results )
+            except requests.RequestException:
+                raise self.retry()
+            continue_monitoring = not apply_results(awaiting_real_inputs, awaiting_outputs, response.json())
 
         if ( continue_monitoring ):
             raise self.retry()
 
     else:
-        if ( stage.status == status ):
-            # contact facility to check for change of status, possible problems
-            url_status = stage.experiment.facility.location + 'experiment/{}/status/{}/'.format(stage.experiment.facility_expid, stage_name)
-            response = requests.get( url_status )
-            if (response.status_code == HTTP_200_OK):
-                res_serializer = StageStatusSerializer(stage, data=response.json())
-                if res_serializer.is_valid():
-                    updated_stage = res_serializer.save()
-
-                    if ( updated_stage.status != status ):
-                        raise self.retry( (campaign_name, experiment_name, stage_name, updated_stage.status) )
-
-            raise self.retry()
-        else:
-            # if the stage status was changed outside of this task, it should have triggered new monitoring
-            # to avoid duplication, let this one end
-            raise RedundantTask()
+        # stages in other statuses are polled by monitor_experiments
+        raise RedundantTask()
@@ -1,6 +1,32 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipIf
+import numpy as np
 from rest_framework.test import APITestCase, APITransactionTestCase
-from map_base.models import MapBase, Campaign
+from map_base.models import MapBase, MapFacility, MLFacility, Campaign, Experiment, ExpStage, ExpInputVal, ExpOutputVal
+from map_base.models import MapStage, MapInput, MapOutput
+from map_base.models import CampaignConstraint, CampaignAtomicConstraint
+from map_base.constraints import CampaignConstraints
+from map_base import design
+from map_base.factory import create_experiment, create_experiments
+from map_base.schema import get_map_schema
+from map_base import tasks
+from map_base.ssh import SSHPool
+from map_base.facility import FacilityClient, facility_client
+from map_base.scheduler import FacilityScheduler
+from map_base.monitor import fetch_results
+from map_base.quantiles import StreamingQuantile
+from map_base.models import StageDuration
+from map_base import durations
+from map_base.serializers import StageStatusSerializer
+from datetime import timedelta
+from django.utils import timezone
+import requests
+from paramiko import SSHException
+from celery.exceptions import Retry
 
 class MapAPITestCase(APITestCase):
     def setUp(self):
@@ -33,3 +59,1123 @@ class MapAPITransactionTestCase(APITransactionTestCase):
 
         self.test_map = MapBase.objects.create(name=self.base_uid['map_name'], storage_location='localhost')
         self.campaign = Campaign.objects.create(for_map=self.test_map, name=self.base_uid['campaign_name'])
+
+############################################################
+#
+# test cached MAP schema
+#
+############################################################
+class MapSchemaTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.stage = MapStage.objects.create(for_map=self.test_map, name='measure')
+        self.inputs = [
+                    MapInput.objects.create(for_map=self.test_map, name='input1', min_val=0.0, max_val=10.0, for_stage=self.stage),
+                    MapInput.objects.create(for_map=self.test_map, name='input2', min_val=-1.0, max_val=1.0),
+                ]
+        self.output = MapOutput.objects.create(for_map=self.test_map, name='measure1', from_stage=self.stage)
+
+    def test_schema_contents(self):
+        schema = get_map_schema(self.test_map)
+
+        self.assertEqual( schema.input_by_name['input1'].id, self.inputs[0].id )
+        self.assertEqual( schema.output_by_name['measure1'].id, self.output.id )
+        self.assertEqual( schema.stage_by_name['measure'].id, self.stage.id )
+        self.assertEqual( list(schema.input_min), [0.0, -1.0] )
+        self.assertEqual( list(schema.input_max), [10.0, 1.0] )
+        self.assertEqual( [ inp.name for inp in schema.stage_inputs[self.stage.id] ], ['input1'] )
+        self.assertEqual( [ out.name for out in schema.stage_outputs[self.stage.id] ], ['measure1'] )
+
+    def test_cached_schema_no_queries(self):
+        get_map_schema(self.test_map)
+
+        with self.assertNumQueries(0):
+            schema = get_map_schema(self.test_map.id)
+        self.assertEqual( len(schema.inputs), 2 )
+
+    def test_invalidate_on_save(self):
+        get_map_schema(self.test_map)
+
+        MapInput.objects.create(for_map=self.test_map, name='input3', min_val=0.0, max_val=1.0)
+        self.inputs[0].max_val = 5.0
+        self.inputs[0].save()
+
+        schema = get_map_schema(self.test_map)
+        self.assertIn( 'input3', schema.input_by_name )
+        self.assertEqual( schema.input_by_name['input1'].max_val, 5.0 )
+
+    def test_change_seen_by_other_processes(self):
+        get_map_schema(self.test_map)
+
+        # another process adds an input - this process only sees the version in the database
+        with mock.patch('map_base.signals.invalidate_map_schema'):
+            MapInput.objects.create(for_map=self.test_map, name='input3', min_val=0.0, max_val=1.0)
+        MapBase.objects.filter(pk=self.test_map.pk).update( schema_version=1 )
+
+        self.assertNotIn( 'input3', get_map_schema(self.test_map).input_by_name )
+        with self.settings(MAP_SCHEMA_VERSION_CHECK=0):
+            self.assertIn( 'input3', get_map_schema(self.test_map).input_by_name )
+
+    def test_invalidate_on_delete(self):
+        get_map_schema(self.test_map)
+
+        self.output.delete()
+        self.stage.delete()
+
+        schema = get_map_schema(self.test_map)
+        self.assertNotIn( 'measure1', schema.output_by_name )
+        self.assertEqual( len(schema.stages), 0 )
+
+############################################################
+#
+# test debounced model updates
+#
+############################################################
+@mock.patch('map_base.tasks.train_model.apply_async')
+class ModelUpdateTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.ml = MLFacility.objects.create(name='ml', location='localhost', train_script='train', probe_script='probe')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing', with_ml=self.ml)
+
+        patcher = mock.patch('map_base.tasks.ssh_pool')
+        self.mock_ssh = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_triggers_collapse(self, mock_schedule):
+        for i in range(5):
+            tasks.update_model(self.campaign.name)
+
+        mock_schedule.assert_called_once()
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertTrue( campaign.ml_update_requested )
+        self.assertIsNotNone( campaign.ml_update_scheduled_at )
+
+    def test_train_launches_once(self, mock_schedule):
+        tasks.update_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+
+        self.mock_ssh.exec_command.assert_called_once()
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual( campaign.ml_model_status, 'R' )
+        self.assertFalse( campaign.ml_update_requested )
+        self.assertIsNone( campaign.ml_update_scheduled_at )
+
+    def test_lost_launch_rescheduled(self, mock_schedule):
+        tasks.update_model(self.campaign.name)
+        mock_schedule.assert_called_once()
+
+        # the delayed train_model task never runs
+        tasks.reschedule_model_updates()
+        mock_schedule.assert_called_once()
+
+        later = timezone.now() + timedelta(seconds=settings.MAP_ML_UPDATE_DEBOUNCE * settings.MAP_ML_UPDATE_STALE + 1)
+        with mock.patch('map_base.models.timezone.now', return_value=later):
+            tasks.reschedule_model_updates(later)
+        self.assertEqual( mock_schedule.call_count, 2 )
+
+    def test_stale_schedule_replaced_on_request(self, mock_schedule):
+        tasks.update_model(self.campaign.name)
+        stale = timezone.now() - timedelta(seconds=settings.MAP_ML_UPDATE_DEBOUNCE * settings.MAP_ML_UPDATE_STALE + 1)
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_update_scheduled_at=stale)
+
+        tasks.update_model(self.campaign.name)
+        self.assertEqual( mock_schedule.call_count, 2 )
+
+    def test_reset_clears_update(self, mock_schedule):
+        tasks.update_model(self.campaign.name)
+        self.assertTrue( self.campaign.ml_transition('reset') )
+
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertFalse( campaign.ml_update_requested )
+        self.assertIsNone( campaign.ml_update_scheduled_at )
+        tasks.reschedule_model_updates()
+        mock_schedule.assert_called_once()
+
+    def test_ssh_launch_failed(self, mock_schedule):
+        self.mock_ssh.exec_command.side_effect = SSHException('host unreachable')
+
+        tasks.update_model(self.campaign.name)
+        with self.assertRaises(SSHException):
+            tasks.train_model(self.campaign.name)
+
+        # not left as training - a later request trains again
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'E' )
+        self.mock_ssh.exec_command.side_effect = None
+        tasks.update_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'R' )
+
+    def test_request_during_training(self, mock_schedule):
+        tasks.update_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+
+        # data arriving while training is flagged, not launched
+        tasks.update_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+
+        self.mock_ssh.exec_command.assert_called_once()
+        self.assertEqual( mock_schedule.call_count, 2 )
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual( campaign.ml_model_status, 'R' )
+        self.assertTrue( campaign.ml_update_requested )
+
+    def test_train_data_source(self, mock_schedule):
+        tasks.update_model(self.campaign.name)
+        with self.settings(MAP_ML_DATA_SOURCE='api', MAP_ML_API_BASE='http://orchestrator:8000/ml-api/'):
+            tasks.train_model(self.campaign.name)
+
+        host, command = self.mock_ssh.exec_command.call_args.args
+        self.assertEqual( command.split()[3], 'api' )
+        self.assertEqual( command.split()[4], 'http://orchestrator:8000/ml-api/' )
+
+    @override_settings(MAP_ML_SERVER_KEY='shared')
+    @mock.patch('map_base.tasks.facility_client')
+    def test_train_on_server(self, mock_client, mock_schedule):
+        MLFacility.objects.filter(pk=self.ml.pk).update(server_url='http://mlhost:8500')
+        mock_client.return_value.post.return_value = mock.Mock(status_code=202)
+
+        tasks.update_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+
+        self.mock_ssh.exec_command.assert_not_called()
+        mock_client.assert_called_once_with('http://mlhost:8500/')
+        path = mock_client.return_value.post.call_args.args[0]
+        request = mock_client.return_value.post.call_args.kwargs['json']
+        self.assertEqual( path, 'train/' )
+        self.assertEqual( request['model'], self.campaign.uid_node )
+        # the server reports to its own configured ml-api, never to one named in the request
+        self.assertNotIn( 'api_base', request )
+        self.assertNotIn( 'data_source', request )
+        self.assertEqual( mock_client.return_value.post.call_args.kwargs['headers'], {'X-GP-Server-Key': 'shared'} )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'R' )
+
+    @mock.patch('map_base.tasks.facility_client')
+    def test_server_unreachable(self, mock_client, mock_schedule):
+        MLFacility.objects.filter(pk=self.ml.pk).update(server_url='http://mlhost:8500/')
+        mock_client.return_value.post.side_effect = requests.ConnectionError()
+
+        tasks.update_model(self.campaign.name)
+        tasks.train_model(self.campaign.name)
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'E' )
+
+        with self.assertRaises(Retry):
+            tasks.probe_model(self.campaign.name)
+        self.mock_ssh.exec_command.assert_not_called()
+
+############################################################
+#
+# test ML model status transitions
+#
+############################################################
+class MlStatusTransitionTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing', ml_model_status='R')
+
+    def test_transition_won(self):
+        self.assertTrue( self.campaign.ml_transition('finish_training') )
+        self.assertEqual( self.campaign.ml_model_status, 'T' )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'T' )
+
+    def test_transition_lost(self):
+        # another worker already moved the status on
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_model_status='E')
+
+        self.assertFalse( self.campaign.ml_transition('finish_training') )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'E' )
+
+    def test_transition_only_once(self):
+        stale_campaign = Campaign.objects.get(pk=self.campaign.pk)
+
+        self.assertTrue( self.campaign.ml_transition('finish_training') )
+        self.assertFalse( stale_campaign.ml_transition('finish_training') )
+
+    def test_data_changed_while_training(self):
+        self.assertFalse( self.campaign.ml_transition('data_changed') )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'R' )
+
+############################################################
+#
+# test naming of proposed experiments
+#
+############################################################
+class ExperimentNameTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+
+    def test_first_name(self):
+        experiment = Experiment.objects.new_proposed(self.campaign, 'random')
+        self.assertEqual( experiment.name, 'Experiment - random 1' )
+
+    def test_sequential_names(self):
+        names = [ Experiment.objects.new_proposed(self.campaign, 'random').name for i in range(3) ]
+        self.assertEqual( names, [ 'Experiment - random {}'.format(i) for i in range(1, 4) ] )
+
+    def test_continues_from_existing_names(self):
+        Experiment.objects.create(campaign=self.campaign, name='Experiment - random 7')
+        Experiment.objects.create(campaign=self.campaign, name='Experiment - Random 12')
+        Experiment.objects.create(campaign=self.campaign, name='Experiment - gp 20')
+
+        experiment = Experiment.objects.new_proposed(self.campaign, 'random')
+        self.assertEqual( experiment.name, 'Experiment - random 13' )
+
+    def test_allocate_several(self):
+        Experiment.objects.new_proposed(self.campaign, 'gp')
+
+        names = Experiment.objects.allocate_names(self.campaign, 'gp', 3)
+        self.assertEqual( names, [ 'Experiment - gp {}'.format(i) for i in range(2, 5) ] )
+        self.assertEqual( Experiment.objects.new_proposed(self.campaign, 'gp').name, 'Experiment - gp 5' )
+
+    def test_constant_queries(self):
+        for i in range(5):
+            Experiment.objects.new_proposed(self.campaign, 'random')
+
+        # numbering no longer depends on the number of experiments in the campaign
+        with CaptureQueriesContext(connection) as queries:
+            Experiment.objects.new_proposed(self.campaign, 'random')
+        self.assertFalse( any( 'REGEXP' in query['sql'] for query in queries.captured_queries ) )
+
+############################################################
+#
+# test creation of proposed experiments
+#
+############################################################
+class ExperimentFactoryTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+
+    def add_to_map(self, n):
+        start = MapInput.objects.filter(for_map=self.test_map).count()
+        for i in range(start, start + n):
+            MapStage.objects.create(for_map=self.test_map, name='stage{}'.format(i))
+            MapInput.objects.create(for_map=self.test_map, name='input{}'.format(i), min_val=0.0, max_val=1.0)
+            MapOutput.objects.create(for_map=self.test_map, name='output{}'.format(i))
+
+    def create_all_inputs(self):
+        schema = get_map_schema(self.test_map)
+        return create_experiment(self.campaign, 'user', { inp.name: 0.5 for inp in schema.inputs })
+
+    def test_experiment_rows(self):
+        self.add_to_map(2)
+
+        experiment = create_experiment(self.campaign, 'user', {'input1': 0.25})
+        self.assertEqual( experiment.name, 'Experiment - user 1' )
+        self.assertEqual( list( experiment.input_values.values_list('map_input__name', 'value_request') ), [('input1', 0.25)] )
+        self.assertEqual( experiment.stages.count(), 2 )
+        self.assertEqual( experiment.output_values.count(), 2 )
+
+    def test_several_experiments(self):
+        self.add_to_map(1)
+
+        experiments = create_experiments(self.campaign, 'gp', [ {'input0': 0.1}, {'input0': 0.2}, {} ])
+        self.assertEqual( [ exp.name for exp in experiments ], [ 'Experiment - gp {}'.format(i) for i in range(1, 4) ] )
+        self.assertEqual( [ exp.input_values.count() for exp in experiments ], [1, 1, 0] )
+        self.assertEqual( [ exp.stages.count() for exp in experiments ], [1, 1, 1] )
+
+    def test_constant_queries(self):
+        self.add_to_map(1)
+        self.create_all_inputs()
+        with CaptureQueriesContext(connection) as small:
+            self.create_all_inputs()
+
+        self.add_to_map(5)
+        self.create_all_inputs()
+        with CaptureQueriesContext(connection) as large:
+            self.create_all_inputs()
+
+        self.assertEqual( len(small), len(large) )
+
+    def test_random_experiment(self):
+        self.add_to_map(3)
+
+        experiment = self.campaign.propose_random_experiment()
+        values = experiment.input_values.values_list('value_request', flat=True)
+        self.assertEqual( len(values), 3 )
+        self.assertTrue( all( 0.0 <= value <= 1.0 for value in values ) )
+        self.assertEqual( experiment.output_values.count(), 3 )
+
+############################################################
+#
+# test space-filling initial designs
+#
+############################################################
+class DesignTests(TestCase):
+    def setUp(self):
+        self.lower = np.array([0.0, -1.0, 10.0])
+        self.upper = np.array([1.0, 1.0, 20.0])
+        self.rng = np.random.default_rng(1)
+
+    def check_bounds(self, points, n):
+        self.assertEqual( points.shape, (n, 3) )
+        self.assertTrue( np.all(points >= self.lower) and np.all(points <= self.upper) )
+
+    def test_random(self):
+        self.check_bounds( design.design_points('random', 7, self.lower, self.upper, self.rng), 7 )
+
+    def test_lhs_strata(self):
+        n = 8
+        points = design.design_points('lhs', n, self.lower, self.upper, self.rng)
+        self.check_bounds(points, n)
+
+        # every dimension has exactly one point in each of the n equal strata
+        strata = np.floor( (points - self.lower) / (self.upper - self.lower) * n )
+        for col in range(3):
+            self.assertEqual( sorted(strata[:, col]), list(range(n)) )
+
+    def test_halton(self):
+        n = 16
+        points = design.design_points('halton', n, self.lower, self.upper, self.rng)
+        self.check_bounds(points, n)
+
+        # base 2 sequence fills each of n strata of the first dimension once
+        strata = np.floor( (points[:, 0] - self.lower[0]) / (self.upper[0] - self.lower[0]) * n )
+        self.assertEqual( sorted(strata), list(range(n)) )
+
+    @skipIf(design.qmc is None, "scipy not installed")
+    def test_sobol(self):
+        self.check_bounds( design.design_points('sobol', 8, self.lower, self.upper, self.rng), 8 )
+
+    def test_no_inputs(self):
+        self.assertEqual( design.design_points('lhs', 4, [], []).shape, (4, 0) )
+
+    def test_initial_experiments(self):
+        test_map = MapBase.objects.create(name='test_map')
+        MapInput.objects.create(for_map=test_map, name='input1', min_val=0.0, max_val=10.0)
+        MapInput.objects.create(for_map=test_map, name='input2', min_val=-1.0, max_val=1.0)
+        campaign = Campaign.objects.create(for_map=test_map, name='api_testing', max_experiments=5, initial_experiments=4, initial_design='lhs')
+
+        experiments = campaign.propose_initial_experiments()
+        self.assertEqual( [ exp.name for exp in experiments ], [ 'Experiment - lhs {}'.format(i) for i in range(1, 5) ] )
+        self.assertEqual( Experiment.objects.filter(campaign=campaign).count(), 4 )
+
+        # never more than the campaign allows
+        campaign.initial_experiments = 10
+        self.assertEqual( len( campaign.propose_initial_experiments() ), 5 )
+
+############################################################
+#
+# test evaluation of campaign constraints
+#
+############################################################
+class CampaignConstraintTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.inputs = [
+                    MapInput.objects.create(for_map=self.test_map, name='input1', min_val=0.0, max_val=10.0),
+                    MapInput.objects.create(for_map=self.test_map, name='input2', min_val=0.0, max_val=10.0),
+                ]
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing', max_experiments=10)
+
+    def add_constraint(self, *atoms):
+        parent = CampaignConstraint.objects.create(campaign=self.campaign)
+        for inp, constraint_type, v1, v2 in atoms:
+            CampaignAtomicConstraint.objects.create(parent=parent, parameter=inp, constraint_type=constraint_type, v1=v1, v2=v2)
+        return parent
+
+    def test_no_constraints(self):
+        constraints = CampaignConstraints.load(self.campaign)
+        self.assertEqual( list( constraints.allowed([[1.0, 1.0], [9.0, 9.0]]) ), [True, True] )
+
+    def test_constraint_types(self):
+        points = np.array([ [2.0, 0.0], [5.0, 0.0], [8.0, 0.0] ])
+        expected = {
+                    'BTW': [False, True, False],
+                    'OUT': [True, False, True],
+                    'LTE': [True, True, False],
+                    'LT': [True, False, False],
+                    'GTE': [False, True, True],
+                    'GT': [False, False, True],
+                    'EQ': [False, True, False],
+                    'NEQ': [True, False, True],
+                }
+        for constraint_type, excluded in expected.items():
+            atoms = [ (1, self.inputs[0].id, constraint_type, 5.0, 6.0 if constraint_type in ('BTW', 'OUT') else None) ]
+            constraints = CampaignConstraints( get_map_schema(self.test_map), atoms )
+            self.assertEqual( list( constraints.excluded(points) ), excluded, constraint_type )
+
+    def test_groups(self):
+        # exclude input1 > 5 and input2 > 5, or input1 < 1
+        both = self.add_constraint( (self.inputs[0], 'GT', 5.0, None), (self.inputs[1], 'GT', 5.0, None) )
+        low = self.add_constraint( (self.inputs[0], 'LT', 1.0, None) )
+
+        get_map_schema(self.test_map)
+        with self.assertNumQueries(1):
+            constraints = CampaignConstraints.load(self.campaign)
+
+        points = np.array([ [6.0, 6.0], [6.0, 4.0], [0.5, 4.0], [3.0, 3.0] ])
+        self.assertEqual( list( constraints.allowed(points) ), [False, True, False, True] )
+        self.assertEqual( constraints.excluded_by(points), [ [both.id], [], [low.id], [] ] )
+
+    def test_missing_inputs_not_excluded(self):
+        self.add_constraint( (self.inputs[1], 'GT', 5.0, None) )
+        constraints = CampaignConstraints.load(self.campaign)
+        self.assertEqual( list( constraints.allowed([[1.0, np.nan]]) ), [True] )
+
+    def test_unknown_input_drops_group(self):
+        # exclude input1 > 5 and (an input not in the schema) > 5
+        atoms = [ (1, self.inputs[0].id, 'GT', 5.0, None), (1, self.inputs[1].id + 100, 'GT', 5.0, None), (2, self.inputs[1].id, 'LT', 1.0, None) ]
+
+        with self.assertLogs('map_base.constraints', 'WARNING') as logs:
+            constraints = CampaignConstraints( get_map_schema(self.test_map), atoms )
+        self.assertIn( '[1]', logs.output[0] )
+
+        self.assertEqual( len(constraints), 1 )
+        self.assertEqual( list( constraints.allowed([ [6.0, 6.0], [6.0, 0.5] ]) ), [True, False] )
+
+    def test_design_rejects_excluded(self):
+        self.add_constraint( (self.inputs[0], 'GT', 5.0, None) )
+
+        experiments = self.campaign.propose_design_experiments('random', 10)
+        self.assertEqual( len(experiments), 10 )
+        values = ExpInputVal.objects.filter(experiment__in=experiments, map_input=self.inputs[0]).values_list('value_request', flat=True)
+        self.assertTrue( all( value <= 5.0 for value in values ) )
+
+    def test_design_all_excluded(self):
+        self.add_constraint( (self.inputs[0], 'GTE', 0.0, None) )
+        self.assertEqual( self.campaign.propose_design_experiments('lhs', 3), [] )
+        self.assertIsNone( self.campaign.propose_random_experiment() )
+
+############################################################
+#
+# test reuse of ssh connections
+#
+############################################################
+@mock.patch('map_base.ssh.SSHClient')
+class SSHPoolTests(TestCase):
+    def setUp(self):
+        self.pool = SSHPool(idle_timeout=600, max_channels=2)
+        self.addCleanup(self.pool.close_all)
+
+    def setup_client(self, mock_client):
+        client = mock_client.return_value
+        client.exec_command.return_value = (mock.Mock(), mock.Mock(), mock.Mock())
+        client.get_transport.return_value.is_active.return_value = True
+        return client
+
+    def test_connection_reused(self, mock_client):
+        client = self.setup_client(mock_client)
+
+        self.pool.exec_command('host1', 'train')
+        self.pool.exec_command('host1', 'probe')
+        self.pool.exec_command('host2', 'train')
+
+        self.assertEqual( mock_client.call_count, 2 )
+        self.assertEqual( client.exec_command.call_count, 3 )
+        client.close.assert_not_called()
+
+    def test_dropped_connection_replaced(self, mock_client):
+        client = self.setup_client(mock_client)
+
+        self.pool.exec_command('host1', 'train')
+        client.get_transport.return_value.is_active.return_value = False
+        self.pool.exec_command('host1', 'train')
+
+        self.assertEqual( mock_client.call_count, 2 )
+        client.close.assert_called_once()
+
+    def test_failed_command_retried(self, mock_client):
+        client = self.setup_client(mock_client)
+        client.exec_command.side_effect = [ SSHException('channel closed'), (mock.Mock(), mock.Mock(), mock.Mock()) ]
+
+        self.pool.exec_command('host1', 'train')
+
+        self.assertEqual( mock_client.call_count, 2 )
+        self.assertEqual( client.exec_command.call_count, 2 )
+
+    def test_idle_reaped(self, mock_client):
+        client = self.setup_client(mock_client)
+
+        self.pool.exec_command('host1', 'train')
+        self.pool.reap()
+        client.close.assert_not_called()
+
+        self.pool.connections['host1'].last_used -= 601
+        self.pool.reap()
+        client.close.assert_called_once()
+        self.assertEqual( self.pool.connections, {} )
+
+    def test_connect_timeout(self, mock_client):
+        client = self.setup_client(mock_client)
+
+        pool = SSHPool(connect_timeout=5)
+        self.addCleanup(pool.close_all)
+        pool.exec_command('host1', 'train')
+        self.assertEqual( client.connect.call_args.kwargs['timeout'], 5 )
+
+    def test_discarded_closed_when_unused(self, mock_client):
+        client = self.setup_client(mock_client)
+
+        first = self.pool.acquire('host1')
+        second = self.pool.acquire('host1')
+        self.assertIs( first, second )
+
+        # a failed command drops the connection while another task still uses it
+        self.pool.release(first, discard=True)
+        self.assertNotIn( 'host1', self.pool.connections )
+        client.close.assert_not_called()
+
+        self.pool.release(second)
+        client.close.assert_called_once()
+
+    def test_unhealthy_checked_outside_lock(self, mock_client):
+        client = self.setup_client(mock_client)
+        self.pool.release( self.pool.acquire('host1') )
+
+        def inactive():
+            # the pool stays usable while a connection is checked
+            self.assertTrue( self.pool.lock.acquire(blocking=False) )
+            self.pool.lock.release()
+            return False
+        client.get_transport.return_value.is_active.side_effect = inactive
+
+        connection = self.pool.acquire('host1')
+        self.assertIs( self.pool.connections['host1'], connection )
+        self.assertEqual( mock_client.call_count, 2 )
+        client.close.assert_called_once()
+
+    def test_channel_limit(self, mock_client):
+        self.setup_client(mock_client)
+
+        connection = self.pool.acquire('host1')
+        self.pool.release(connection)
+        self.assertTrue( connection.channels.acquire(blocking=False) )
+        self.assertTrue( connection.channels.acquire(blocking=False) )
+        self.assertFalse( connection.channels.acquire(blocking=False) )
+
+############################################################
+#
+# test http calls to facilities
+#
+############################################################
+class FacilityClientTests(TestCase):
+    def setUp(self):
+        self.client = FacilityClient('http://facility/', pool_size=2, timeout=(1, 2))
+        patcher = mock.patch.object(self.client.session, 'request')
+        self.mock_request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_timeout_and_url(self):
+        self.mock_request.return_value = mock.Mock(status_code=200)
+
+        response = self.client.get('experiment/1/status/')
+        self.assertEqual( response.status_code, 200 )
+        self.mock_request.assert_called_once_with('GET', 'http://facility/experiment/1/status/', timeout=(1, 2))
+
+    def test_latency_recorded(self):
+        self.mock_request.return_value = mock.Mock(status_code=201)
+        self.client.post('experiment/new/', json={})
+        self.client.post('experiment/new/', json={})
+
+        self.mock_request.side_effect = requests.ConnectTimeout()
+        with self.assertRaises(requests.RequestException):
+            self.client.get('queue/')
+
+        stats = self.client.latency_stats()
+        self.assertEqual( stats['POST experiment']['calls'], 2 )
+        self.assertEqual( stats['POST experiment']['errors'], 0 )
+        self.assertEqual( stats['GET queue']['errors'], 1 )
+
+    def test_shared_per_location(self):
+        self.assertIs( facility_client('http://shared/'), facility_client('http://shared/') )
+        self.assertIsNot( facility_client('http://shared/'), facility_client('http://other/') )
+
+    def test_bulk_get(self):
+        self.mock_request.return_value = mock.Mock(status_code=200, json=mock.Mock(return_value={'1': {'status': 'R'}}))
+
+        self.assertEqual( self.client.bulk_get('status', [1, 2]), {'1': {'status': 'R'}} )
+        self.mock_request.assert_called_once_with('GET', 'http://facility/experiments/status/', params={'ids': '1,2'}, timeout=(1, 2))
+        self.assertTrue( self.client.bulk )
+
+    def test_bulk_unsupported(self):
+        self.mock_request.return_value = mock.Mock(status_code=404)
+
+        self.assertIsNone( self.client.bulk_get('status', [1]) )
+        self.assertIsNone( self.client.bulk_get('results', [1]) )
+        # the facility is not asked again
+        self.assertEqual( self.mock_request.call_count, 1 )
+
+    @override_settings(MAP_FACILITY_BULK_RECHECK=600)
+    def test_bulk_rechecked(self):
+        self.mock_request.return_value = mock.Mock(status_code=405)
+        with mock.patch('map_base.facility.time.monotonic', return_value=1000.0):
+            self.assertIsNone( self.client.bulk_get('status', [1]) )
+
+        self.mock_request.return_value = mock.Mock(status_code=200, json=mock.Mock(return_value={}))
+        with mock.patch('map_base.facility.time.monotonic', return_value=1599.0):
+            self.assertIsNone( self.client.bulk_get('status', [1]) )
+        self.assertEqual( self.mock_request.call_count, 1 )
+
+        # asked again once the recheck interval has passed
+        with mock.patch('map_base.facility.time.monotonic', return_value=1600.0):
+            self.assertEqual( self.client.bulk_get('status', [1]), {} )
+        self.assertEqual( self.mock_request.call_count, 2 )
+        self.assertTrue( self.client.bulk )
+
+@mock.patch('map_base.tasks.facility_client')
+class PlaceExperimentTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.facilities = [ MapFacility.objects.create(for_map=self.test_map, name=name, location='http://{}/'.format(name)) for name in ['down', 'up'] ]
+        self.stages = [ MapStage.objects.create(for_map=self.test_map, name='stage{}'.format(i)) for i in range(3) ]
+        for i, stage in enumerate(self.stages):
+            MapInput.objects.create(for_map=self.test_map, name='input{}'.format(i), min_val=0.0, max_val=1.0, for_stage=stage)
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+        self.experiment = create_experiment(self.campaign, 'user', { 'input{}'.format(i): 0.5 for i in range(3) })
+
+    def facility_responses(self, mock_client, config_status=200):
+        def post(path, json=None):
+            if ( path == 'experiment/new/' ):
+                return mock.Mock(status_code=201, json=mock.Mock(return_value={'id': 7}))
+            elif ( path.startswith('experiment/7/config/') ):
+                return mock.Mock(status_code=config_status)
+            return mock.Mock(status_code=200)
+
+        clients = { facility.location: mock.Mock() for facility in self.facilities }
+        clients['http://down/'].post.side_effect = requests.ConnectionError()
+        clients['http://up/'].post.side_effect = post
+        mock_client.side_effect = lambda facility: clients[facility.location]
+        return clients['http://up/']
+
+    def test_unreachable_facility_skipped(self, mock_client):
+        client = self.facility_responses(mock_client)
+
+        tasks.place_experiment(self.campaign.name, self.experiment.name)
+
+        experiment = Experiment.objects.get(pk=self.experiment.pk)
+        self.assertEqual( experiment.facility, self.facilities[1] )
+        self.assertEqual( experiment.facility_expid, 7 )
+        self.assertEqual( experiment.status, 'Q' )
+
+        # every stage configured with its own inputs before queueing
+        calls = { call.args[0]: call.kwargs['json'] for call in client.post.call_args_list }
+        for i in range(3):
+            self.assertEqual( calls['experiment/7/config/stage{}/'.format(i)], [ {'input_name': 'input{}'.format(i), 'input_value': 0.5} ] )
+        self.assertEqual( client.post.call_args_list[-1].args[0], 'queue/append/' )
+
+    def test_not_queued_on_config_failure(self, mock_client):
+        client = self.facility_responses(mock_client, config_status=400)
+
+        tasks.place_experiment(self.campaign.name, self.experiment.name)
+
+        self.assertNotIn( 'queue/append/', [ call.args[0] for call in client.post.call_args_list ] )
+        experiment = Experiment.objects.get(pk=self.experiment.pk)
+        self.assertIsNone( experiment.facility )
+        self.assertEqual( experiment.status, 'P' )
+        # claimed until the sweep offers it to the facilities again
+        self.assertIsNotNone( experiment.next_poll )
+
+    def test_input_queries_independent_of_stages(self, mock_client):
+        self.facility_responses(mock_client)
+        get_map_schema(self.test_map)
+
+        with CaptureQueriesContext(connection) as queries:
+            tasks.place_experiment(self.campaign.name, self.experiment.name)
+        self.assertEqual( sum( 'map_base_expinputval' in query['sql'] for query in queries.captured_queries ), 1 )
+
+############################################################
+#
+# test choice of facilities for new experiments
+#
+############################################################
+@mock.patch('map_base.tasks.facility_client')
+class FacilitySchedulerTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        other_map = MapBase.objects.create(name='other_map')
+        self.facilities = [
+                    MapFacility.objects.create(for_map=self.test_map, name='small', location='http://small/', capacity=1),
+                    MapFacility.objects.create(for_map=self.test_map, name='large', location='http://large/', capacity=3),
+                ]
+        self.other = MapFacility.objects.create(for_map=other_map, name='other', location='http://other/')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+
+    def facility_responses(self, mock_client):
+        def post(path, json=None):
+            if ( path == 'experiment/new/' ):
+                return mock.Mock(status_code=201, json=mock.Mock(return_value={'id': 1}))
+            return mock.Mock(status_code=200)
+
+        client = mock.Mock()
+        client.post.side_effect = post
+        mock_client.return_value = client
+
+    def test_loads(self, mock_client):
+        experiments = create_experiments(self.campaign, 'user', [ {} for i in range(5) ])
+        Experiment.objects.filter(pk__in=[ exp.pk for exp in experiments[:2] ]).update(facility=self.facilities[1], status='R')
+        Experiment.objects.filter(pk=experiments[2].pk).update(facility=self.facilities[1], status='C')
+        # a suspended experiment keeps its place at the facility
+        Experiment.objects.filter(pk=experiments[3].pk).update(facility=self.facilities[1], status='H')
+
+        scheduler = FacilityScheduler.for_map(self.test_map)
+        self.assertEqual( [ facility.name for facility in scheduler.facilities ], ['small', 'large'] )
+        self.assertEqual( scheduler.loads, { self.facilities[0].id: 0, self.facilities[1].id: 3 } )
+        self.assertEqual( [ facility.name for facility in scheduler.candidates() ], ['small'] )
+
+        scheduler.assign(self.facilities[0])
+        self.assertEqual( scheduler.candidates(), [] )
+
+    def test_batch_spread_by_capacity(self, mock_client):
+        self.facility_responses(mock_client)
+        experiments = create_experiments(self.campaign, 'user', [ {} for i in range(4) ])
+
+        tasks.place_experiments(self.campaign.name, [ exp.name for exp in experiments ])
+
+        placed = Experiment.objects.filter(campaign=self.campaign, status='Q')
+        self.assertEqual( placed.filter(facility=self.facilities[0]).count(), 1 )
+        self.assertEqual( placed.filter(facility=self.facilities[1]).count(), 3 )
+        self.assertNotIn( self.other, [ call.args[0] for call in mock_client.call_args_list ] )
+
+    def test_batch_placed_by_sweep_when_full(self, mock_client):
+        self.facility_responses(mock_client)
+        experiments = create_experiments(self.campaign, 'user', [ {} for i in range(6) ])
+        names = [ exp.name for exp in experiments ]
+
+        tasks.place_experiments(self.campaign.name, names)
+        self.assertEqual( Experiment.objects.filter(campaign=self.campaign, status='Q').count(), 4 )
+        self.assertEqual( list( Experiment.objects.filter(campaign=self.campaign, status='P').order_by('id').values_list('name', flat=True) ), names[4:] )
+
+        # facilities free up - the rest are placed by the sweep
+        Experiment.objects.filter(campaign=self.campaign, status='Q').update(status='C')
+        tasks.place_pending_experiments()
+        self.assertEqual( Experiment.objects.filter(campaign=self.campaign, status='Q').count(), 2 )
+        self.assertFalse( Experiment.objects.filter(campaign=self.campaign, status='P').exists() )
+
+    def test_sweep_skips_claimed(self, mock_client):
+        self.facility_responses(mock_client)
+        experiment = create_experiment(self.campaign, 'user', {})
+        now = timezone.now()
+        Experiment.objects.filter(pk=experiment.pk).update( next_poll=now + timedelta(seconds=60) )
+
+        tasks.place_pending_experiments(now)
+        self.assertEqual( Experiment.objects.get(pk=experiment.pk).status, 'P' )
+
+        tasks.place_pending_experiments( now + timedelta(seconds=61) )
+        experiment = Experiment.objects.get(pk=experiment.pk)
+        self.assertEqual( experiment.status, 'Q' )
+        self.assertIsNone( experiment.next_poll )
+
+############################################################
+#
+# test periodic polling of active experiments
+#
+############################################################
+@mock.patch('map_base.tasks.monitor_stage_status.apply_async')
+@mock.patch('map_base.tasks.finalize_experiments')
+@mock.patch('map_base.monitor.facility_client')
+class MonitorExperimentsTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.map_stage = MapStage.objects.create(for_map=self.test_map, name='measure')
+        self.facilities = [ MapFacility.objects.create(for_map=self.test_map, name=name, location='http://{}/'.format(name)) for name in ['fac1', 'fac2'] ]
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+
+        # two running experiments at each facility, facility ids 1 and 2
+        self.experiments = create_experiments(self.campaign, 'user', [ {} for i in range(4) ])
+        for i, experiment in enumerate(self.experiments):
+            Experiment.objects.filter(pk=experiment.pk).update(facility=self.facilities[i % 2], facility_expid=i // 2 + 1, status='R')
+            ExpStage.objects.filter(experiment=experiment).update(status='R')
+
+        # finished experiments are not polled
+        done = create_experiment(self.campaign, 'user', {})
+        Experiment.objects.filter(pk=done.pk).update(facility=self.facilities[0], facility_expid=9, status='C')
+
+    def facility_responses(self, mock_client, statuses):
+        # statuses: { location: { path: status } }, unreachable facilities map to None
+        clients = {}
+        for location, paths in statuses.items():
+            client = mock.Mock()
+            if paths is None:
+                client.get.side_effect = requests.ConnectionError()
+            else:
+                client.get.side_effect = lambda path, paths=paths: mock.Mock(status_code=200, json=mock.Mock(return_value={'status': paths.get(path, 'R')}))
+            client.bulk_get.return_value = None
+            clients[location] = client
+        mock_client.side_effect = lambda facility: clients[facility.location]
+        return clients
+
+    def test_latency_logged(self, mock_client, mock_finalize, mock_stage_monitor):
+        self.facility_responses(mock_client, { 'http://fac1/': {}, 'http://fac2/': {} })
+
+        stats = { 'http://fac1/': { 'GET experiment': {'calls': 2, 'errors': 0, 'mean': 0.01, 'max': 0.02, 'last': 0.01} } }
+        with mock.patch('map_base.tasks.facility_latency_stats', return_value=stats):
+            with self.assertLogs('map_base.tasks', 'INFO') as logs:
+                tasks.monitor_experiments()
+        self.assertEqual( logs.output, [ 'INFO:map_base.tasks:facility latency: {}'.format(stats) ] )
+
+    def test_status_changes_applied(self, mock_client, mock_finalize, mock_stage_monitor):
+        clients = self.facility_responses(mock_client, {
+                    'http://fac1/': { 'experiment/1/status/': 'C', 'experiment/1/status/measure/': 'C' },
+                    'http://fac2/': { 'experiment/2/status/': 'H' },
+                })
+
+        tasks.monitor_experiments()
+
+        statuses = [ Experiment.objects.get(pk=experiment.pk) for experiment in self.experiments ]
+        self.assertEqual( [ experiment.status for experiment in statuses ], ['C', 'R', 'R', 'H'] )
+        self.assertIsNotNone( statuses[0].end_time )
+
+        # one client per facility, each asked about its own experiments and stages only
+        self.assertEqual( mock_client.call_count, 2 )
+        self.assertEqual( clients['http://fac1/'].get.call_count, 4 )
+        self.assertNotIn( mock.call('experiment/9/status/'), clients['http://fac1/'].get.call_args_list )
+
+        mock_finalize.assert_called_once_with( self.campaign.name, [self.experiments[0].name] )
+        mock_stage_monitor.assert_called_once_with( (self.campaign.name, self.experiments[0].name, 'measure', 'C'), countdown=10 )
+
+    def test_unreachable_facility(self, mock_client, mock_finalize, mock_stage_monitor):
+        self.facility_responses(mock_client, {
+                    'http://fac1/': None,
+                    'http://fac2/': { 'experiment/1/status/': 'C' },
+                })
+
+        tasks.monitor_experiments()
+
+        self.assertEqual( [ Experiment.objects.get(pk=experiment.pk).status for experiment in self.experiments ], ['R', 'C', 'R', 'R'] )
+        mock_finalize.assert_called_once_with( self.campaign.name, [self.experiments[1].name] )
+
+    def test_no_changes(self, mock_client, mock_finalize, mock_stage_monitor):
+        self.facility_responses(mock_client, { 'http://fac1/': {}, 'http://fac2/': {} })
+
+        tasks.monitor_experiments()
+
+        mock_finalize.assert_not_called()
+        mock_stage_monitor.assert_not_called()
+
+        # unchanged experiments and stages back off before the next poll
+        for experiment in Experiment.objects.filter(pk__in=[ experiment.pk for experiment in self.experiments ]):
+            self.assertIsNotNone( experiment.next_poll )
+            self.assertIsNotNone( experiment.poll_interval )
+        self.assertFalse( ExpStage.objects.filter(status='R', next_poll__isnull=True).exists() )
+
+    def test_bulk_status(self, mock_client, mock_finalize, mock_stage_monitor):
+        clients = self.facility_responses(mock_client, { 'http://fac1/': {}, 'http://fac2/': {} })
+        clients['http://fac1/'].bulk_get.return_value = {
+                    '1': {'status': 'C', 'modules': {'measure': 'C'}},
+                    '2': {'status': 'R', 'modules': {'measure': 'R'}},
+                }
+
+        tasks.monitor_experiments()
+
+        # one call for every experiment and stage at the facility
+        clients['http://fac1/'].bulk_get.assert_called_once_with('status', [1, 2])
+        clients['http://fac1/'].get.assert_not_called()
+        self.assertEqual( clients['http://fac2/'].get.call_count, 4 )
+
+        self.assertEqual( Experiment.objects.get(pk=self.experiments[0].pk).status, 'C' )
+        mock_finalize.assert_called_once_with( self.campaign.name, [self.experiments[0].name] )
+        mock_stage_monitor.assert_called_once_with( (self.campaign.name, self.experiments[0].name, 'measure', 'C'), countdown=10 )
+
+    def test_not_due_skipped(self, mock_client, mock_finalize, mock_stage_monitor):
+        clients = self.facility_responses(mock_client, { 'http://fac1/': {}, 'http://fac2/': {} })
+        later = timezone.now() + timedelta(hours=1)
+        Experiment.objects.filter(pk=self.experiments[0].pk).update(next_poll=later)
+        ExpStage.objects.filter(experiment=self.experiments[0]).update(next_poll=later)
+
+        tasks.monitor_experiments()
+
+        polled = [ c.args[0] for c in clients['http://fac1/'].get.call_args_list ]
+        self.assertNotIn( 'experiment/1/status/', polled )
+        self.assertNotIn( 'experiment/1/status/measure/', polled )
+        self.assertIn( 'experiment/2/status/', polled )
+
+        # a second sweep finds nothing due
+        mock_client.reset_mock()
+        tasks.monitor_experiments()
+        mock_client.assert_not_called()
+
+@mock.patch('map_base.tasks.facility_client')
+class StageResultsTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.map_stage = MapStage.objects.create(for_map=self.test_map, name='measure')
+        MapInput.objects.create(for_map=self.test_map, name='x', min_val=0.0, max_val=1.0, for_stage=self.map_stage)
+        MapOutput.objects.create(for_map=self.test_map, name='y', from_stage=self.map_stage)
+        self.facility = MapFacility.objects.create(for_map=self.test_map, name='fac1', location='http://fac1/')
+
+        # experiments of two campaigns on the same MAP, both awaiting results
+        self.experiments = []
+        for campaign_name in ['api_testing', 'other']:
+            campaign = Campaign.objects.create(for_map=self.test_map, name=campaign_name)
+            experiment = create_experiment(campaign, 'user', {'x': 0.5})
+            Experiment.objects.filter(pk=experiment.pk).update(facility=self.facility, facility_expid=1, status='R')
+            self.experiments.append(experiment)
+
+    def test_scoped_to_experiment(self, mock_client):
+        mock_client.return_value.get.return_value = mock.Mock(status_code=200, json=mock.Mock(return_value={'x': 0.6, 'y': 2.0}))
+
+        with CaptureQueriesContext(connection) as queries:
+            tasks.monitor_stage_status('api_testing', self.experiments[0].name, 'measure', 'C')
+
+        self.assertEqual( ExpInputVal.objects.get(experiment=self.experiments[0]).value_actual, 0.6 )
+        self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiments[0]).value, 2.0 )
+        self.assertIsNone( ExpInputVal.objects.get(experiment=self.experiments[1]).value_actual )
+        self.assertIsNone( ExpOutputVal.objects.get(experiment=self.experiments[1]).value )
+
+        # stage, awaited inputs, awaited outputs and one update of each inside a savepoint
+        self.assertEqual( len(queries), 7 )
+
+    def test_missing_results_retry(self, mock_client):
+        mock_client.return_value.get.return_value = mock.Mock(status_code=200, json=mock.Mock(return_value={'x': 0.6}))
+
+        with self.assertRaises(Retry):
+            tasks.monitor_stage_status('api_testing', self.experiments[0].name, 'measure', 'C')
+
+        # values received are kept
+        self.assertEqual( ExpInputVal.objects.get(experiment=self.experiments[0]).value_actual, 0.6 )
+
+@mock.patch('map_base.tasks.facility_client')
+class FinalizeExperimentsTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.map_stage = MapStage.objects.create(for_map=self.test_map, name='measure')
+        MapInput.objects.create(for_map=self.test_map, name='x', min_val=0.0, max_val=1.0, for_stage=self.map_stage)
+        MapOutput.objects.create(for_map=self.test_map, name='y', from_stage=self.map_stage)
+        self.facility = MapFacility.objects.create(for_map=self.test_map, name='fac1', location='http://fac1/')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+
+        self.experiment_names = []
+        for expid in [1, 2]:
+            experiment = create_experiment(self.campaign, 'user', {'x': 0.5})
+            Experiment.objects.filter(pk=experiment.pk).update(facility=self.facility, facility_expid=expid, status='C')
+            self.experiment_names.append(experiment.name)
+
+    def test_task_per_experiment(self, mock_client):
+        with mock.patch('map_base.tasks.monitor_experiment_status.apply_async') as mock_finalize:
+            tasks.finalize_experiments('api_testing', self.experiment_names)
+
+        self.assertEqual( mock_finalize.call_args_list,
+                            [ mock.call( ('api_testing', experiment_name, 'C'), {'batch': self.experiment_names}, countdown=10 )
+                                for experiment_name in self.experiment_names ] )
+
+    def test_last_finalized_updates_model(self, mock_client):
+        mock_client.return_value.bulk_get.side_effect = lambda kind, expids: { str(expid): {'x': 0.6, 'y': 2.0} for expid in expids }
+
+        with mock.patch('map_base.tasks.update_model.delay') as mock_update:
+            tasks.monitor_experiment_status('api_testing', self.experiment_names[1], 'C', batch=self.experiment_names)
+            # the other experiment still awaits its results
+            mock_update.assert_not_called()
+
+            tasks.monitor_experiment_status('api_testing', self.experiment_names[0], 'C', batch=self.experiment_names)
+        mock_update.assert_called_once_with('api_testing')
+
+    def test_model_update_requested_once(self, mock_client):
+        with mock.patch('map_base.tasks.train_model.apply_async') as mock_train:
+            tasks.update_model('api_testing')
+            tasks.update_model('api_testing')
+        mock_train.assert_called_once()
+
+class StreamingQuantileTests(TestCase):
+    def test_few_observations(self):
+        estimate = StreamingQuantile(0.5)
+        self.assertIsNone( estimate.value() )
+        for x in [3.0, 1.0, 2.0]:
+            estimate.add(x)
+        self.assertEqual( estimate.value(), 2.0 )
+        self.assertEqual( estimate.count, 3 )
+
+    def test_estimate(self):
+        rng = np.random.default_rng(7)
+        samples = rng.lognormal(mean=6.0, sigma=0.5, size=5000)
+        for p in (0.5, 0.9):
+            estimate = StreamingQuantile(p)
+            for x in samples:
+                estimate.add(x)
+            self.assertEqual( estimate.count, len(samples) )
+            self.assertAlmostEqual( estimate.value() / np.quantile(samples, p), 1.0, delta=0.05 )
+
+    def test_state_round_trip(self):
+        estimate = StreamingQuantile(0.9)
+        for x in range(20):
+            estimate.add(float(x))
+        restored = StreamingQuantile(0.9, estimate.state())
+        estimate.add(25.0)
+        restored.add(25.0)
+        self.assertEqual( restored.value(), estimate.value() )
+
+class StageDurationTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.map_stage = MapStage.objects.create(for_map=self.test_map, name='measure')
+        self.facility = MapFacility.objects.create(for_map=self.test_map, name='fac1', location='http://fac1/')
+        self.campaign = Campaign.objects.create(for_map=self.test_map, name='api_testing')
+        self.experiment = create_experiment(self.campaign, 'user', {})
+        Experiment.objects.filter(pk=self.experiment.pk).update(facility=self.facility, status='R')
+        self.stage = ExpStage.objects.select_related('experiment').get(experiment=self.experiment)
+
+    def set_status(self, status, time):
+        serializer = StageStatusSerializer(self.stage, data={'status': status, 'time': time})
+        self.assertTrue( serializer.is_valid() )
+        serializer.save()
+
+    def test_recorded_on_completion(self):
+        start = timezone.now() - timedelta(seconds=600)
+        self.set_status('R', start)
+        self.assertFalse( StageDuration.objects.exists() )
+
+        self.set_status('C', start + timedelta(seconds=500))
+        duration = StageDuration.objects.get(map_stage=self.map_stage, facility=self.facility)
+        self.assertEqual( duration.count, 1 )
+        self.assertAlmostEqual( duration.quantile(0.5), 500.0 )
+
+    def test_first_poll_without_history(self):
+        now = timezone.now()
+        self.set_status('R', now)
+        self.assertIsNone( self.stage.poll_interval )
+        self.assertAlmostEqual( (self.stage.next_poll - now).total_seconds(), 60, delta=5 )
+
+    def test_first_poll_from_history(self):
+        duration = StageDuration.objects.create(map_stage=self.map_stage, facility=self.facility)
+        for seconds in [400, 500, 600, 700, 800, 900]:
+            duration.add(seconds)
+        duration.save()
+
+        start = timezone.now()
+        self.set_status('R', start)
+        expected = durations.expected_stage_duration(self.stage, self.facility.id)
+        self.assertEqual( self.stage.next_poll, start + timedelta(seconds=expected[0]) )
+
+    @override_settings(MAP_MONITOR_DEFAULT_DELAY=60, MAP_MONITOR_BACKOFF=2.0, MAP_MONITOR_MIN_DELAY=30, MAP_MONITOR_MAX_DELAY=300)
+    def test_next_poll_backs_off(self):
+        now = timezone.now()
+        self.stage.status = 'Q'
+        intervals = []
+        for i in range(5):
+            durations.next_poll(self.stage, None, now)
+            intervals.append( self.stage.poll_interval )
+        self.assertEqual( intervals, [60, 120, 240, 300, 300] )
+
+    @override_settings(MAP_MONITOR_MIN_DELAY=30, MAP_MONITOR_MAX_DELAY=1800)
+    def test_next_poll_from_history(self):
+        start = timezone.now()
+        self.stage.status = 'R'
+        self.stage.start_time = start
+        self.stage.poll_interval = None
+
+        # polled at the median and unchanged - wait until the 90th percentile
+        durations.next_poll(self.stage, (500.0, 1000.0), start + timedelta(seconds=500))
+        self.assertEqual( self.stage.next_poll, start + timedelta(seconds=1000) )
+        self.assertIsNone( self.stage.poll_interval )
+
+        # overdue - poll at a tenth of the 90th percentile
+        durations.next_poll(self.stage, (500.0, 1000.0), start + timedelta(seconds=1000))
+        self.assertEqual( self.stage.poll_interval, 100.0 )
+
+class FetchResultsTests(TestCase):
+    def test_bulk(self):
+        client = mock.Mock()
+        client.bulk_get.return_value = { '3': {'y': 1.0} }
+
+        self.assertEqual( fetch_results(client, 3, ['s1', 's2']), {'y': 1.0} )
+        client.get.assert_not_called()
+
+    def test_per_stage_fallback(self):
+        client = mock.Mock()
+        client.bulk_get.return_value = None
+        client.get.side_effect = lambda path: mock.Mock(json=mock.Mock(return_value={ path: 1.0 }))
+
+        results = fetch_results(client, 3, ['s1', 's2'])
+        self.assertEqual( list(results), ['experiment/3/results/s1/', 'experiment/3/results/s2/'] )
@@ -0,0 +1,111 @@
+import json
+
+from map_base.models import ExpOutputVal
+from map_base.schema import get_map_schema
+from map_exp_comm.serializers import OutputStreamRecordSerializer
+
+############################################################
+# request_lines
+# iterate over the lines of a request body without reading it all
+############################################################
+def request_lines(request):
+    # chunked bodies carry no content length
+    # servers that de-chunk the body mark the raw input as terminated so it can be read to the end
+    if ( request.META.get('wsgi.input_terminated') and not request.META.get('CONTENT_LENGTH') ):
+        stream = request.META['wsgi.input']
+    else:
+        stream = request
+
+    return iter(stream.readline, b'')
+
+############################################################
+# ingest_output_stream
+# store newline-delimited JSON output records in bounded batches
+#
+#   yields one JSON acknowledgement line per committed batch
+#   { "batch": n, "records": count, "line": last line committed }
+#   so a disconnected client can resend from the line after the last acknowledgement
+#
+#   processing stops at the first bad record, after committing the records before it
+############################################################
+def ingest_output_stream(campaign, lines, batch_size):
+    schema = get_map_schema(campaign.for_map_id)
+    experiment_ids = {}
+    pending = []
+    n_batch = 0
+
+    def ack(content):
+        return json.dumps(content) + '\n'
+
+    def flush(pending):
+        # resolve experiment names not seen earlier in the stream with one query
+        unseen = set( record[1] for record in pending ).difference(experiment_ids)
+        if ( len(unseen) > 0 ):
+            experiment_ids.update( campaign.experiments.filter(name__in=unseen).values_list('name', 'id') )
+
+        n_valid = len(pending)
+        for i, record in enumerate(pending):
+            if record[1] not in experiment_ids:
+                n_valid = i
+                break
+
+        # keep the latest value per experiment output, using record times where given
+        values = {}
+        times = {}
+        for line_no, experiment_name, output_name, value, time in pending[:n_valid]:
+            key = ( experiment_ids[experiment_name], schema.output_by_name[output_name].id )
+            if ( key in times and time is not None and times[key] is not None and time < times[key] ):
+                continue
+            values[key] = value
+            times[key] = time
+
+        if ( len(values) > 0 ):
+            ExpOutputVal.objects.set_values(values)
+
+        return n_valid
+
+    def commit(pending):
+        nonlocal n_batch
+
+        n_valid = flush(pending)
+        if ( n_valid > 0 ):
+            n_batch += 1
+            yield ack( { 'batch': n_batch, 'records': n_valid, 'line': pending[n_valid-1][0] } )
+
+        if ( n_valid < len(pending) ):
+            bad = pending[n_valid]
+            yield ack( { 'error': { 'experiment': [ "'{}' is not a known experiment for campaign".format(bad[1]) ] }, 'line': bad[0] } )
+            return False
+
+        return True
+
+    line_no = 0
+    for line in lines:
+        line_no += 1
+        if ( len(line.strip()) == 0 ):
+            continue
+
+        error = None
+        try:
+            record_serializer = OutputStreamRecordSerializer(data=json.loads(line), context={'for_map': campaign.for_map_id})
+            if record_serializer.is_valid():
+                record = record_serializer.validated_data
+                pending.append( (line_no, record['experiment'], record['output'], record['value'], record.get('time')) )
+            else:
+                error = record_serializer.errors
+        except ValueError:
+            error = 'line is not valid JSON'
+
+        if ( error is None and len(pending) < batch_size ):
+            continue
+
+        if not ( yield from commit(pending) ):
+            return
+        pending = []
+
+        if ( error is not None ):
+            yield ack( { 'error': error, 'line': line_no } )
+            return
+
+    if ( len(pending) > 0 ):
+        yield from commit(pending)
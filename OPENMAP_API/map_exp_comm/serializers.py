@@ -1,7 +1,13 @@
+from django.db import transaction
+
 from rest_framework import serializers
-from map_base.models import MapInput, MapOutput
 from map_base.models import Experiment, ExpStage
 from map_base.models import ExpInputVal, ExpOutputVal
+from map_base.schema import get_map_schema
+from map_base.serializers import ExperimentStatusSerializer, StageStatusSerializer
+
+class ExperimentStatusRecordSerializer(ExperimentStatusSerializer):
+    experiment = serializers.CharField(max_length=255)
 
 class ExpInputSerializer(serializers.Serializer):
     value = serializers.FloatField(allow_null=True, source='value_actual')
@@ -11,21 +17,35 @@ class ExpInputSerializer(serializers.Serializer):
         instance.save()
         return instance
 
+class ExpOutputListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        experiment = self.context.get('experiment')
+        map_outputs = self.child.get_map_outputs()
+
+        # later entries for the same output overwrite earlier ones
+        values = { (experiment.id, map_outputs[out['map_output']['name']].id): out.get('value') for out in validated_data }
+        return ExpOutputVal.objects.set_values(values)
+
 class ExpOutputSerializer(serializers.Serializer):
     name = serializers.CharField(source='map_output.name')
     value = serializers.FloatField(allow_null=True)
 
+    class Meta:
+        list_serializer_class = ExpOutputListSerializer
+
+    def get_map_outputs(self):
+        # outputs of the MAP by name, from the cached MAP schema
+        return get_map_schema(self.context.get('for_map')).output_by_name
+
     def validate_name(self, name):
-        try:
-            map_output = MapOutput.objects.get(for_map=self.context.get('for_map'), name=name)
-        except MapOutput.DoesNotExist:
+        if name not in self.get_map_outputs():
             message = "'{}' is not a known output for MAP".format(name)
             raise serializers.ValidationError(message)
 
         return name
 
     def create(self, validated_data):
-        map_output = MapOutput.objects.get(for_map=self.context.get('for_map'), name=validated_data.get('map_output')['name'])
+        map_output = self.get_map_outputs()[validated_data.get('map_output')['name']]
         exp_out, created = ExpOutputVal.objects.get_or_create(experiment=self.context.get('experiment'), map_output=map_output)
         exp_out.value = validated_data.get('value', exp_out.value)
         exp_out.save()
@@ -35,3 +55,70 @@ class ExpOutputSerializer(serializers.Serializer):
         instance.value = validated_data.get('value', instance.value)
         instance.save()
         return instance
+
+class ExpInputReportSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    value = serializers.FloatField(allow_null=True)
+
+class StageReportSerializer(StageStatusSerializer):
+    inputs = ExpInputReportSerializer(many=True, required=False)
+    outputs = ExpOutputSerializer(many=True, required=False)
+
+    def stage_name(self):
+        return get_map_schema(self.context.get('for_map')).stage_by_id[self.instance.map_stage_id].name
+
+    def validate_inputs(self, inputs):
+        # only the inputs of the reported stage
+        names = set( inp['name'] for inp in inputs )
+        known_names = set( ExpInputVal.objects.filter(experiment=self.context.get('experiment'), map_input__name__in=names, map_input__for_stage=self.instance.map_stage_id)
+                                .values_list('map_input__name', flat=True) )
+
+        unknown_names = names.difference(known_names)
+        if ( len(unknown_names) > 0 ):
+            message = "{} not known inputs for experiment stage '{}'".format( ", ".join("'{}'".format(name) for name in sorted(unknown_names)), self.stage_name() )
+            raise serializers.ValidationError(message)
+
+        return inputs
+
+    def validate_outputs(self, outputs):
+        # only the outputs of the reported stage - names are known outputs of the MAP (ExpOutputSerializer)
+        map_outputs = get_map_schema(self.context.get('for_map')).output_by_name
+        names = set( out['map_output']['name'] for out in outputs )
+
+        other_names = [ name for name in names if map_outputs[name].from_stage_id != self.instance.map_stage_id ]
+        if ( len(other_names) > 0 ):
+            message = "{} not outputs of experiment stage '{}'".format( ", ".join("'{}'".format(name) for name in sorted(other_names)), self.stage_name() )
+            raise serializers.ValidationError(message)
+
+        return outputs
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            super().update(instance, validated_data)
+
+            input_values = { inp['name']: inp['value'] for inp in validated_data.get('inputs', []) }
+            if ( len(input_values) > 0 ):
+                exp_inps = list( ExpInputVal.objects.filter(experiment=instance.experiment, map_input__name__in=input_values, map_input__for_stage=instance.map_stage_id)
+                                    .select_related('map_input') )
+                for exp_inp in exp_inps:
+                    exp_inp.value_actual = input_values[exp_inp.map_input.name]
+                ExpInputVal.objects.bulk_update(exp_inps, ['value_actual'])
+
+            outputs_data = validated_data.get('outputs', [])
+            if ( len(outputs_data) > 0 ):
+                self.fields['outputs'].create(outputs_data)
+
+        return instance
+
+class OutputStreamRecordSerializer(serializers.Serializer):
+    experiment = serializers.CharField(max_length=255)
+    output = serializers.CharField()
+    value = serializers.FloatField(allow_null=True)
+    time = serializers.DateTimeField(required=False)
+
+    def validate_output(self, name):
+        if name not in get_map_schema(self.context.get('for_map')).output_by_name:
+            message = "'{}' is not a known output for MAP".format(name)
+            raise serializers.ValidationError(message)
+
+        return name
@@ -1,14 +1,19 @@
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APITestCase
 from rest_framework import status
 
 from unittest import mock
+import json
 
 from map_exp_comm import views
 from map_base.models import MapStage, MapInput, MapOutput
 from map_base.models import Campaign, Experiment, ExpStage, ExpInputVal, ExpOutputVal
+from map_base.schema import get_map_schema
 from map_base.tests import MapAPITestCase
 
 ############################################################
@@ -35,7 +40,7 @@ class ExperimentStatusTests(MapAPITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
 
-        mock_task.monitor_experiment_status.signature.assert_not_called()
+        mock_task.finalize_experiments.assert_not_called()
 
     def test_experiment_status_by_display(self, mock_task):
         url = reverse( views.experiment_status, kwargs = self.uid_use )
@@ -48,7 +53,8 @@ class ExperimentStatusTests(MapAPITestCase):
         self.assertEqual( experiment.status, 'R' )
         self.assertEqual( experiment.get_status_display(), 'Running' )
 
-        mock_task.monitor_experiment_status.signature.assert_called_once()
+        # running experiments are left to the periodic monitor
+        mock_task.finalize_experiments.assert_not_called()
 
     def test_experiment_status_by_value(self, mock_task):
         url = reverse( views.experiment_status, kwargs = self.uid_use )
@@ -61,7 +67,8 @@ class ExperimentStatusTests(MapAPITestCase):
         self.assertEqual( experiment.status, 'R' )
         self.assertEqual( experiment.get_status_display(), 'Running' )
 
-        mock_task.monitor_experiment_status.signature.assert_called_once()
+        # running experiments are left to the periodic monitor
+        mock_task.finalize_experiments.assert_not_called()
 
     def test_experiment_status_bad_display(self, mock_task):
         url = reverse( views.experiment_status, kwargs = self.uid_use )
@@ -74,7 +81,7 @@ class ExperimentStatusTests(MapAPITestCase):
         self.assertEqual( experiment.status, 'P' )
         self.assertEqual( experiment.get_status_display(), 'Proposed' )
 
-        mock_task.monitor_experiment_status.signature.assert_not_called()
+        mock_task.finalize_experiments.assert_not_called()
 
     def test_experiment_status_bad_value(self, mock_task):
         url = reverse( views.experiment_status, kwargs = self.uid_use )
@@ -87,7 +94,7 @@ class ExperimentStatusTests(MapAPITestCase):
         self.assertEqual( experiment.status, 'P' )
         self.assertEqual( experiment.get_status_display(), 'Proposed' )
 
-        mock_task.monitor_experiment_status.signature.assert_not_called()
+        mock_task.finalize_experiments.assert_not_called()
 
     def test_experiment_completed(self, mock_task):
         self.experiment.status = 'R'
@@ -103,10 +110,90 @@ class ExperimentStatusTests(MapAPITestCase):
         self.assertEqual( experiment.status, 'C' )
         self.assertEqual( experiment.get_status_display(), 'Completed' )
 
-        mock_task.monitor_experiment_status.signature.assert_called_once_with( (self.uid_use['campaign_name'], self.uid_use['experiment_name'], data['status']), ignore_result=False, immutable=True )
-        mock_task.update_model.si.assert_called_once_with(self.uid_use['campaign_name'])
+        mock_task.finalize_experiments.assert_called_once_with( self.uid_use['campaign_name'], [self.uid_use['experiment_name']] )
 
 
+############################################################
+#
+# test updating status of several experiments at once
+#
+############################################################
+@mock.patch('map_exp_comm.views.celery_task')
+class ExperimentStatusBatchTests(MapAPITestCase):
+
+    def setUp(self):
+        MapAPITestCase.setUp(self)
+        self.experiment_names = [ 'Experiment - test {}'.format(i) for i in range(1, 4) ]
+        self.experiments = [ Experiment.objects.create( campaign=self.campaign, name=name, status='R' ) for name in self.experiment_names ]
+
+        self.uid_use = { 'campaign_name': self.base_uid['campaign_name'] }
+
+    ##############################
+    # POST
+    ##############################
+    def test_campaign_does_not_exist(self, mock_task):
+        url = reverse( views.experiment_status_batch, kwargs = {'campaign_name': 'noCampaign'} )
+        data = [ { 'experiment': self.experiment_names[0], 'status': 'C' } ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
+
+        mock_task.finalize_experiments.assert_not_called()
+
+    def test_experiment_does_not_exist(self, mock_task):
+        url = reverse( views.experiment_status_batch, kwargs = self.uid_use )
+        data = [ { 'experiment': self.experiment_names[0], 'status': 'C' }, { 'experiment': 'noExperiment', 'status': 'C' } ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
+
+        # nothing applied when any record is unknown
+        self.assertEqual( Experiment.objects.get(campaign=self.campaign, name=self.experiment_names[0]).status, 'R' )
+        mock_task.finalize_experiments.assert_not_called()
+
+    def test_bad_status(self, mock_task):
+        url = reverse( views.experiment_status_batch, kwargs = self.uid_use )
+        data = [ { 'experiment': self.experiment_names[0], 'status': 'C' }, { 'experiment': self.experiment_names[1], 'status': 'Garbage' } ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+        self.assertEqual( Experiment.objects.get(campaign=self.campaign, name=self.experiment_names[0]).status, 'R' )
+        mock_task.finalize_experiments.assert_not_called()
+
+    def test_nonlist(self, mock_task):
+        url = reverse( views.experiment_status_batch, kwargs = self.uid_use )
+        data = { 'experiment': self.experiment_names[0], 'status': 'C' }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+    def test_completed(self, mock_task):
+        url = reverse( views.experiment_status_batch, kwargs = self.uid_use )
+        data = [ { 'experiment': name, 'status': 'Completed' } for name in self.experiment_names ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        for experiment in Experiment.objects.filter(campaign=self.campaign):
+            self.assertEqual( experiment.status, 'C' )
+            self.assertIsNotNone( experiment.end_time )
+
+        # experiments finalized together for the campaign, not once per experiment
+        mock_task.finalize_experiments.assert_called_once()
+        self.assertEqual( mock_task.finalize_experiments.call_args.args[0], self.uid_use['campaign_name'] )
+        self.assertEqual( sorted(mock_task.finalize_experiments.call_args.args[1]), self.experiment_names )
+
+    def test_unchanged_status(self, mock_task):
+        url = reverse( views.experiment_status_batch, kwargs = self.uid_use )
+        data = [ { 'experiment': name, 'status': 'R' } for name in self.experiment_names ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        mock_task.finalize_experiments.assert_not_called()
+        mock_task.finalize_experiments.assert_not_called()
+
 ############################################################
 #
 # test updating stage status
@@ -159,7 +246,8 @@ class StageStatusTests(MapAPITestCase):
         self.assertEqual( stage.status, 'R' )
         self.assertEqual( stage.get_status_display(), 'Running' )
 
-        mock_task.monitor_stage_status.apply_async.assert_called_once()
+        # running stages are left to the periodic monitor
+        mock_task.monitor_stage_status.apply_async.assert_not_called()
 
     def test_stage_status_by_value(self, mock_task):
         url = reverse( views.stage_status, kwargs = self.uid_use )
@@ -175,7 +263,8 @@ class StageStatusTests(MapAPITestCase):
         self.assertEqual( stage.status, 'R' )
         self.assertEqual( stage.get_status_display(), 'Running' )
 
-        mock_task.monitor_stage_status.apply_async.assert_called_once()
+        # running stages are left to the periodic monitor
+        mock_task.monitor_stage_status.apply_async.assert_not_called()
 
     def test_stage_status_bad_display(self, mock_task):
         url = reverse( views.stage_status, kwargs = self.uid_use )
@@ -230,6 +319,129 @@ class StageStatusTests(MapAPITestCase):
                     (self.uid_use['campaign_name'], self.uid_use['experiment_name'], self.uid_use['stage_name'], data['status']), countdown=10
                 )
 
+############################################################
+#
+# test reporting stage status with input actuals and outputs
+#
+############################################################
+@mock.patch('map_exp_comm.views.celery_task')
+class StageReportTests(MapAPITestCase):
+
+    def setUp(self):
+        MapAPITestCase.setUp(self)
+        map_stg = MapStage.objects.create( for_map=self.test_map, name=self.base_uid['stage_name'] )
+        self.map_input = MapInput.objects.create( for_map=self.test_map, name=self.base_uid['input_name'], min_val=0.0, max_val=10.0, for_stage=map_stg )
+        self.map_output = MapOutput.objects.create( for_map=self.test_map, name=self.base_uid['output_name'], from_stage=map_stg )
+        self.experiment = Experiment.objects.create( campaign=self.campaign, name=self.base_uid['experiment_name'] )
+        self.stage = ExpStage.objects.create( experiment=self.experiment, map_stage=map_stg, status='R' )
+        self.input = ExpInputVal.objects.create( experiment=self.experiment, map_input=self.map_input, value_request=3.14 )
+        self.output = ExpOutputVal.objects.create( experiment=self.experiment, map_output=self.map_output )
+
+        self.uid_use = {
+                    'campaign_name': self.base_uid['campaign_name'],
+                    'experiment_name': self.base_uid['experiment_name'],
+                    'stage_name': self.base_uid['stage_name']
+                }
+
+    ##############################
+    # POST
+    ##############################
+    def test_stage_does_not_exist(self, mock_task):
+        url = reverse( views.stage_report,
+                        kwargs = {
+                            'campaign_name': self.uid_use['campaign_name'],
+                            'experiment_name': self.uid_use['experiment_name'],
+                            'stage_name': 'noStage'
+                            }
+                        )
+        data = { 'status': 'C' }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
+
+        mock_task.monitor_stage_status.apply_async.assert_not_called()
+
+    def test_stage_report(self, mock_task):
+        url = reverse( views.stage_report, kwargs = self.uid_use )
+        data = {
+                'status': 'C',
+                'inputs': [ { 'name': self.base_uid['input_name'], 'value': 3.0 } ],
+                'outputs': [ { 'name': self.base_uid['output_name'], 'value': 9.0 } ],
+                }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        stage = ExpStage.objects.get( pk=self.stage.pk )
+        self.assertEqual( stage.status, 'C' )
+        self.assertIsNotNone( stage.end_time )
+        self.assertEqual( ExpInputVal.objects.get(pk=self.input.pk).value_actual, 3.0 )
+        self.assertEqual( ExpOutputVal.objects.get(pk=self.output.pk).value, 9.0 )
+
+        mock_task.monitor_stage_status.apply_async.assert_called_once_with(
+                    (self.uid_use['campaign_name'], self.uid_use['experiment_name'], self.uid_use['stage_name'], data['status']), countdown=10
+                )
+
+    def test_stage_report_status_only(self, mock_task):
+        url = reverse( views.stage_report, kwargs = self.uid_use )
+        data = { 'status': 'C' }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        self.assertEqual( ExpStage.objects.get(pk=self.stage.pk).status, 'C' )
+        self.assertIsNone( ExpOutputVal.objects.get(pk=self.output.pk).value )
+
+    def test_stage_report_unknown_input(self, mock_task):
+        url = reverse( views.stage_report, kwargs = self.uid_use )
+        data = {
+                'status': 'C',
+                'inputs': [ { 'name': 'garbage', 'value': 3.0 } ],
+                'outputs': [ { 'name': self.base_uid['output_name'], 'value': 9.0 } ],
+                }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+        # report is rejected as a whole
+        self.assertEqual( ExpStage.objects.get(pk=self.stage.pk).status, 'R' )
+        self.assertIsNone( ExpOutputVal.objects.get(pk=self.output.pk).value )
+        mock_task.monitor_stage_status.apply_async.assert_not_called()
+
+    def test_stage_report_unknown_output(self, mock_task):
+        url = reverse( views.stage_report, kwargs = self.uid_use )
+        data = {
+                'status': 'C',
+                'inputs': [ { 'name': self.base_uid['input_name'], 'value': 3.0 } ],
+                'outputs': [ { 'name': 'garbage', 'value': 9.0 } ],
+                }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+        self.assertEqual( ExpStage.objects.get(pk=self.stage.pk).status, 'R' )
+        self.assertIsNone( ExpInputVal.objects.get(pk=self.input.pk).value_actual )
+        mock_task.monitor_stage_status.apply_async.assert_not_called()
+
+    def test_stage_report_other_stage(self, mock_task):
+        other_stg = MapStage.objects.create( for_map=self.test_map, name='other_stage' )
+        other_input = MapInput.objects.create( for_map=self.test_map, name='other_input', min_val=0.0, max_val=10.0, for_stage=other_stg )
+        other_output = MapOutput.objects.create( for_map=self.test_map, name='other_output', from_stage=other_stg )
+        ExpInputVal.objects.create( experiment=self.experiment, map_input=other_input, value_request=1.0 )
+
+        url = reverse( views.stage_report, kwargs = self.uid_use )
+        for data in [
+                    { 'status': 'C', 'inputs': [ { 'name': 'other_input', 'value': 3.0 } ] },
+                    { 'status': 'C', 'outputs': [ { 'name': 'other_output', 'value': 9.0 } ] },
+                ]:
+            response = self.client.post(url, data, format='json')
+            self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+        self.assertEqual( ExpStage.objects.get(pk=self.stage.pk).status, 'R' )
+        self.assertIsNone( ExpInputVal.objects.get(experiment=self.experiment, map_input=other_input).value_actual )
+        self.assertFalse( ExpOutputVal.objects.filter(map_output=other_output).exists() )
+        mock_task.monitor_stage_status.apply_async.assert_not_called()
+
 ############################################################
 #
 # test input values
@@ -366,6 +578,30 @@ class ExpOutputValTests(MapAPITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
 
+        self.assertFalse( ExpOutputVal.objects.filter(experiment=self.experiment).exists() )
+
+    def test_post_experiment_queries_independent_of_outputs(self):
+        map_outputs = [ MapOutput.objects.create( for_map=self.test_map, name='spectrum{}'.format(i) ) for i in range(20) ]
+        url = reverse( views.output_values, kwargs = self.uid_use )
+
+        ExpOutputVal.objects.create(experiment=self.experiment, map_output=self.map_output1, value=6.28318)
+        ExpOutputVal.objects.create(experiment=self.experiment, map_output=map_outputs[0], value=6.28318)
+        data_small = [ { 'name': 'measure1', 'value': 3.14159 }, { 'name': 'measure2', 'value': 3.14159 } ]
+        get_map_schema(self.test_map)
+        with CaptureQueriesContext(connection) as small_queries:
+            response = self.client.post(url, data_small, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        data_large = [ { 'name': out.name, 'value': float(i) } for i, out in enumerate(map_outputs) ]
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.post(url, data_large, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        self.assertEqual( len(large_queries), len(small_queries) )
+        self.assertEqual( ExpOutputVal.objects.filter(experiment=self.experiment).count(), 2 + len(map_outputs) )
+        for i, out in enumerate(map_outputs):
+            self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiment, map_output=out).value, float(i) )
+
 class ExpSingleOutputValTests(APITestCase):
 
     def setUp(self):
@@ -412,3 +648,100 @@ class ExpSingleOutputValTests(APITestCase):
 
         response = self.client.put(url, data, format='json')
         self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+############################################################
+#
+# test streaming output values
+#
+############################################################
+@override_settings(MAP_STREAM_BATCH_SIZE=2)
+class OutputStreamTests(MapAPITestCase):
+
+    def setUp(self):
+        MapAPITestCase.setUp(self)
+        self.map_output1 = MapOutput.objects.create( for_map=self.test_map, name=self.base_uid['output_name'] )
+        self.map_output2 = MapOutput.objects.create( for_map=self.test_map, name='measure2' )
+        self.experiment = Experiment.objects.create( campaign=self.campaign, name=self.base_uid['experiment_name'] )
+
+        self.uid_use = { 'campaign_name': self.base_uid['campaign_name'] }
+
+    def post_stream(self, url, records):
+        body = ''.join( (record if isinstance(record, str) else json.dumps(record)) + '\n' for record in records )
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        acks = []
+        if ( response.status_code == status.HTTP_200_OK ):
+            acks = [ json.loads(line) for line in b''.join(response.streaming_content).splitlines() ]
+        return response, acks
+
+    ##############################
+    # POST
+    ##############################
+    def test_campaign_does_not_exist(self):
+        url = reverse( views.output_stream, kwargs = {'campaign_name': 'noCampaign'} )
+        response, acks = self.post_stream( url, [ { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 1.0 } ] )
+        self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
+
+    def test_stream_batches(self):
+        url = reverse( views.output_stream, kwargs = self.uid_use )
+        records = [
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 1.0 },
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure2', 'value': 2.0 },
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 3.0 },
+                ]
+
+        response, acks = self.post_stream(url, records)
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( acks, [ {'batch': 1, 'records': 2, 'line': 2}, {'batch': 2, 'records': 1, 'line': 3} ] )
+
+        self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiment, map_output=self.map_output1).value, 3.0 )
+        self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiment, map_output=self.map_output2).value, 2.0 )
+
+    def test_stream_keeps_latest_time(self):
+        url = reverse( views.output_stream, kwargs = self.uid_use )
+        records = [
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 2.0, 'time': '2020-01-01T00:00:02Z' },
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 1.0, 'time': '2020-01-01T00:00:01Z' },
+                ]
+
+        response, acks = self.post_stream(url, records)
+        self.assertEqual( acks, [ {'batch': 1, 'records': 2, 'line': 2} ] )
+        self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiment, map_output=self.map_output1).value, 2.0 )
+
+    def test_stream_stops_at_bad_line(self):
+        url = reverse( views.output_stream, kwargs = self.uid_use )
+        records = [
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 1.0 },
+                    'not json',
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure2', 'value': 2.0 },
+                ]
+
+        response, acks = self.post_stream(url, records)
+        self.assertEqual( acks[0], {'batch': 1, 'records': 1, 'line': 1} )
+        self.assertEqual( acks[1]['line'], 2 )
+        self.assertIn( 'error', acks[1] )
+
+        # records before the bad line are kept, records after it are not applied
+        self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiment, map_output=self.map_output1).value, 1.0 )
+        self.assertFalse( ExpOutputVal.objects.filter(experiment=self.experiment, map_output=self.map_output2).exists() )
+
+    def test_stream_unknown_output(self):
+        url = reverse( views.output_stream, kwargs = self.uid_use )
+        records = [ { 'experiment': self.base_uid['experiment_name'], 'output': 'garbage', 'value': 1.0 } ]
+
+        response, acks = self.post_stream(url, records)
+        self.assertEqual( len(acks), 1 )
+        self.assertEqual( acks[0]['line'], 1 )
+        self.assertIn( 'output', acks[0]['error'] )
+
+    def test_stream_unknown_experiment(self):
+        url = reverse( views.output_stream, kwargs = self.uid_use )
+        records = [
+                    { 'experiment': self.base_uid['experiment_name'], 'output': 'measure1', 'value': 1.0 },
+                    { 'experiment': 'noExperiment', 'output': 'measure2', 'value': 2.0 },
+                ]
+
+        response, acks = self.post_stream(url, records)
+        self.assertEqual( acks[0], {'batch': 1, 'records': 1, 'line': 1} )
+        self.assertEqual( acks[1]['line'], 2 )
+        self.assertIn( 'experiment', acks[1]['error'] )
+        self.assertEqual( ExpOutputVal.objects.get(experiment=self.experiment, map_output=self.map_output1).value, 1.0 )
@@ -3,8 +3,11 @@ from map_exp_comm import views
 
 urlpatterns = [
         re_path(r'experimentStatus/(?P<campaign_name>[-:\w\ ]+)/(?P<experiment_name>[-:\w\ ]+)/', views.experiment_status),
+        re_path(r'experimentStatus/(?P<campaign_name>[-:\w\ ]+)/', views.experiment_status_batch),
         re_path(r'stageStatus/(?P<campaign_name>[-:\w\ ]+)/(?P<experiment_name>[-:\w\ ]+)/(?P<stage_name>[-:\w\ ]+)/', views.stage_status),
+        re_path(r'stageReport/(?P<campaign_name>[-:\w\ ]+)/(?P<experiment_name>[-:\w\ ]+)/(?P<stage_name>[-:\w\ ]+)/', views.stage_report),
         re_path(r'input/(?P<campaign_name>[-:\w\ ]+)/(?P<experiment_name>[-:\w\ ]+)/(?P<input_name>[\w]+)/', views.input_value),
         re_path(r'output/(?P<campaign_name>[-:\w\ ]+)/(?P<experiment_name>[-:\w\ ]+)/(?P<output_name>[\w]+)/', views.output_value),
         re_path(r'output/(?P<campaign_name>[-:\w\ ]+)/(?P<experiment_name>[-:\w\ ]+)/', views.output_values),
+        re_path(r'outputStream/(?P<campaign_name>[-:\w\ ]+)/', views.output_stream),
         ]
@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.shortcuts import render
+from django.db import transaction
+from django.http import StreamingHttpResponse
 
 from rest_framework import status
 from rest_framework.decorators import api_view
@@ -8,16 +11,30 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from celery import chain
-
-from map_base.models import Experiment, ExpStage
+from map_base.models import Campaign, Experiment, ExpStage
 from map_base.models import ExpInputVal, ExpOutputVal
 
 from map_base.serializers import ExperimentStatusSerializer, StageStatusSerializer
+from map_exp_comm.serializers import ExperimentStatusRecordSerializer
 from map_exp_comm.serializers import ExpInputSerializer, ExpOutputSerializer
+from map_exp_comm.serializers import StageReportSerializer
+from map_exp_comm.ingest import request_lines, ingest_output_stream
 
 import map_base.tasks as celery_task
 
+############################################################
+# trigger_experiment_monitoring
+# respond to experiments of a campaign that changed status
+#   transitions: list of (experiment_name, new_status)
+#   running experiments are polled by the periodic monitor_experiments task
+############################################################
+def trigger_experiment_monitoring(campaign_name, transitions):
+    completed = [ experiment_name for experiment_name, new_status in transitions if new_status == "C" ]
+
+    if ( len(completed) > 0 ):
+        # completed experiments of the campaign are finalized independently - the last one finalized updates the model once
+        celery_task.finalize_experiments(campaign_name, completed)
+
 ############################################################
 # experiment_status
 # update experiment status
@@ -39,25 +56,51 @@ def experiment_status(request, campaign_name, experiment_name):
 
         # check to trigger monitoring
         if ( new_status != old_status ):
-            if ( new_status == "R" ):
-                # should calculate an estimated experiment length for countdown instead
-                # chained in case monitoring picks up complete status before map facility offers the update
-                exp_monitor = chain(
-                                    celery_task.monitor_experiment_status.signature( (campaign_name, experiment_name, new_status), ignore_result=False, immutable=True),
-                                    celery_task.update_model.si(campaign_name)
-                                   )
-                exp_monitor.apply_async( countdown=60 )
-            elif ( new_status == "C" ):
-                exp_finalize = chain(
-                                    celery_task.monitor_experiment_status.signature( (campaign_name, experiment_name, new_status), ignore_result=False, immutable=True),
-                                    celery_task.update_model.si(campaign_name)
-                                    )
-                exp_finalize.apply_async( countdown=10 )
+            trigger_experiment_monitoring(campaign_name, [ (experiment_name, new_status) ])
 
         return Response(req_serializer.data, status=status.HTTP_200_OK)
     else:
         return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+############################################################
+# experiment_status_batch
+# update status of several experiments in a campaign
+############################################################
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def experiment_status_batch(request, campaign_name):
+    try:
+        campaign = Campaign.objects.get(name=campaign_name)
+    except Campaign.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    req_serializer = ExperimentStatusRecordSerializer(data=request.data, many=True)
+    if not req_serializer.is_valid():
+        return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    records = req_serializer.validated_data
+    experiment_names = set( record['experiment'] for record in records )
+    experiments = { experiment.name: experiment for experiment in campaign.experiments.filter(name__in=experiment_names) }
+
+    unknown_names = experiment_names.difference(experiments)
+    if ( len(unknown_names) > 0 ):
+        content = { 'experiment': [ "'{}' is not a known experiment for campaign".format(name) for name in sorted(unknown_names) ] }
+        return Response(content, status=status.HTTP_404_NOT_FOUND)
+
+    old_status = { name: experiment.status for name, experiment in experiments.items() }
+
+    # records are applied in the order given, so a later record for the same experiment wins
+    with transaction.atomic():
+        for record in records:
+            req_serializer.child.update(experiments[record['experiment']], record)
+
+    transitions = [ (name, experiment.status) for name, experiment in experiments.items() if experiment.status != old_status[name] ]
+    trigger_experiment_monitoring(campaign_name, transitions)
+
+    ret_serializer = ExperimentStatusRecordSerializer(records, many=True)
+    return Response(ret_serializer.data, status=status.HTTP_200_OK)
+
 ############################################################
 # stage_status
 # update stage status
@@ -79,14 +122,44 @@ def stage_status(request, campaign_name, experiment_name, stage_name):
 
         # check to trigger monitoring
         if ( new_status != old_status ):
-            if ( new_status in ("R", "C") ):
-                # should calculate an estimated stage length for countdown instead
+            if ( new_status == "C" ):
+                # running stages are polled by the periodic monitor_experiments task
                 celery_task.monitor_stage_status.apply_async( (campaign_name, experiment_name, stage_name, new_status), countdown=10)
 
         return Response(req_serializer.data, status=status.HTTP_200_OK)
     else:
         return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+############################################################
+# stage_report
+# update stage status together with the stage's input actuals and outputs
+############################################################
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def stage_report(request, campaign_name, experiment_name, stage_name):
+    try:
+        stage = ExpStage.objects.select_related('experiment__campaign__for_map').get(experiment__campaign__name=campaign_name, experiment__name=experiment_name, map_stage__name=stage_name)
+        old_status = stage.status
+    except ExpStage.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    req_serializer = StageReportSerializer(stage, data=request.data, context={'experiment': stage.experiment, 'for_map': stage.experiment.campaign.for_map})
+    if req_serializer.is_valid():
+        updated_stage = req_serializer.save()
+        new_status = updated_stage.status
+
+        # check to trigger monitoring
+        if ( new_status != old_status ):
+            if ( new_status == "C" ):
+                # running stages are polled by the periodic monitor_experiments task
+                celery_task.monitor_stage_status.apply_async( (campaign_name, experiment_name, stage_name, new_status), countdown=10)
+
+        ret_serializer = StageStatusSerializer(updated_stage)
+        return Response(ret_serializer.data, status=status.HTTP_200_OK)
+    else:
+        return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 ############################################################
 # input_value
 # 
@@ -116,7 +189,7 @@ def input_value(request, campaign_name, experiment_name, input_name):
 @permission_classes([IsAuthenticated])
 def output_values(request, campaign_name, experiment_name):
     try:
-        experiment = Experiment.objects.get(campaign__name=campaign_name, name=experiment_name)
+        experiment = Experiment.objects.select_related('campaign__for_map').get(campaign__name=campaign_name, name=experiment_name)
     except Experiment.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -143,3 +216,22 @@ def output_value(request, campaign_name, experiment_name, output_name):
         return Response(req_serializer.data, status=status.HTTP_200_OK)
     else:
         return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+############################################################
+# output_stream
+# newline-delimited JSON stream of output values for a campaign
+#   one record per line: {"experiment": ..., "output": ..., "value": ..., "time": ...}
+#   responds with one acknowledgement line per committed batch
+############################################################
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def output_stream(request, campaign_name):
+    try:
+        campaign = Campaign.objects.get(name=campaign_name)
+    except Campaign.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    # read the raw body line by line rather than letting a parser buffer it
+    acks = ingest_output_stream(campaign, request_lines(request._request), settings.MAP_STREAM_BATCH_SIZE)
+    return StreamingHttpResponse(acks, content_type='application/x-ndjson')
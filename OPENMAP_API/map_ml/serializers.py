@@ -1,45 +1,96 @@
+import numpy as np
+
 from rest_framework import serializers
-from map_base.models import MapStage, MapInput, MapOutput
-from map_base.models import Experiment, ExpStage, ExpInputVal, ExpOutputVal
+from map_base.constraints import CampaignConstraints, input_matrix
+from map_base.factory import create_experiment, create_experiments
+from map_base.schema import get_map_schema
 
 class ProposedExpInputSerializer(serializers.Serializer):
     name = serializers.CharField()
     value = serializers.FloatField()
 
     def validate(self, data):
-        try:
-            map_input = MapInput.objects.get(for_map=self.context.get('for_map'), name=data['name'])
-            if ( data['value'] < map_input.min_val or data['value'] > map_input.max_val ):
-                message = "value for '{}' must be between min ({}) and max ({})".format(data['name'], map_input.min_val, map_input.max_val)
-                raise serializers.ValidationError(message)
-        except MapInput.DoesNotExist:
+        map_input = get_map_schema(self.context.get('for_map')).input_by_name.get(data['name'])
+        if map_input is None:
             message = "'{}' is not a known input for MAP".format(data['name'])
             raise serializers.ValidationError(message)
 
+        if ( data['value'] < map_input.min_val or data['value'] > map_input.max_val ):
+            message = "value for '{}' must be between min ({}) and max ({})".format(data['name'], map_input.min_val, map_input.max_val)
+            raise serializers.ValidationError(message)
+
         return data
 
 class ProposeExperimentSerializer(serializers.Serializer):
     mode = serializers.CharField()
     inputs = ProposedExpInputSerializer(many=True)
 
-    def create(self, validated_data):
-        inputs_data = validated_data.pop('inputs')
-        experiment = Experiment.objects.new_proposed(campaign=self.context.get('campaign'), mode=validated_data.get('mode'))
-
-        for proposed_input in inputs_data:
-            map_input = MapInput.objects.get(for_map=self.context.get('for_map'), name=proposed_input['name'])
-            ExpInputVal.objects.create(experiment=experiment, map_input=map_input, value_request=proposed_input['value'])
+    def validate(self, data):
+        schema = get_map_schema(self.context.get('for_map'))
+        point = input_matrix( schema, [ { inp['name']: inp['value'] for inp in data['inputs'] } ] )
 
-        map_stages = MapStage.objects.filter(for_map=self.context.get('for_map'))
-        for map_stg in map_stages:
-            new_exp_stg = ExpStage.objects.create(experiment=experiment, map_stage=map_stg)
+        excluded_by = CampaignConstraints.load(self.context.get('campaign')).excluded_by(point)[0]
+        if ( len(excluded_by) > 0 ):
+            message = "inputs are excluded by campaign constraints {}".format(excluded_by)
+            raise serializers.ValidationError( { 'inputs': [message] } )
 
-        map_outputs = MapOutput.objects.filter(for_map=self.context.get('for_map'))
-        for map_out in map_outputs:
-            new_exp_out = ExpOutputVal.objects.create(experiment=experiment, map_output=map_out)
+        return data
 
-        return experiment
+    def create(self, validated_data):
+        input_values = { proposed_input['name']: proposed_input['value'] for proposed_input in validated_data['inputs'] }
+        return create_experiment(self.context.get('campaign'), validated_data.get('mode'), input_values)
 
 class NewExperimentSerializer(serializers.Serializer):
     campaign_name = serializers.CharField(source='campaign.name')
     experiment_name = serializers.CharField(source='name')
+
+class ProposedValueSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    value = serializers.FloatField()
+
+class ProposedInputsSerializer(serializers.Serializer):
+    inputs = ProposedValueSerializer(many=True)
+
+class ProposeExperimentsSerializer(serializers.Serializer):
+    mode = serializers.CharField()
+    experiments = ProposedInputsSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        schema = get_map_schema(self.context.get('for_map'))
+
+        # requested values as an experiments x inputs matrix, nan where an input is not given
+        values = np.full( (len(data['experiments']), len(schema.inputs)), np.nan )
+        errors = {}
+        for i, proposed in enumerate(data['experiments']):
+            for inp in proposed['inputs']:
+                col = schema.input_index.get(inp['name'])
+                if col is None:
+                    errors.setdefault(i, []).append( "'{}' is not a known input for MAP".format(inp['name']) )
+                else:
+                    values[i, col] = inp['value']
+
+        out_of_bounds = np.argwhere( (values < schema.input_min) | (values > schema.input_max) )
+        for i, col in out_of_bounds:
+            map_input = schema.inputs[col]
+            errors.setdefault(int(i), []).append( "value for '{}' must be between min ({}) and max ({})".format(map_input.name, map_input.min_val, map_input.max_val) )
+
+        constraints = CampaignConstraints.load(self.context.get('campaign'))
+        for i, excluded_by in enumerate( constraints.excluded_by(values) ):
+            if ( len(excluded_by) > 0 ):
+                errors.setdefault(i, []).append( "inputs are excluded by campaign constraints {}".format(excluded_by) )
+
+        if ( len(errors) > 0 ):
+            raise serializers.ValidationError( { 'experiments': { i: messages for i, messages in sorted(errors.items()) } } )
+
+        data['values'] = values
+        return data
+
+    def create(self, validated_data):
+        schema = get_map_schema(self.context.get('for_map'))
+        values = validated_data['values']
+
+        input_values = [ {} for i in range(values.shape[0]) ]
+        for i, col in np.argwhere( ~np.isnan(values) ):
+            input_values[i][schema.inputs[col].name] = float(values[i, col])
+
+        return create_experiments(self.context.get('campaign'), validated_data.get('mode'), input_values)
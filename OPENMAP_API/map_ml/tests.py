@@ -1,4 +1,6 @@
 from django.urls import reverse
+import io
+import numpy as np
 from django.contrib.auth.models import User
 
 from rest_framework.test import APITransactionTestCase
@@ -11,7 +13,9 @@ from time import sleep
 from map_api.celery import app
 from map_ml import views
 from map_base.models import MapStage, MapInput, MapOutput
-from map_base.models import Campaign, Experiment, ExpInputVal
+from map_base.models import Campaign, Experiment, ExpInputVal, ExpOutputVal
+from map_base.factory import create_experiments
+from map_base.models import CampaignConstraint, CampaignAtomicConstraint
 from map_base.tests import MapAPITestCase, MapAPITransactionTestCase
 
 ############################################################
@@ -43,6 +47,24 @@ class MlStatusTests(MapAPITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual( response.status_code, status.HTTP_200_OK )
 
+    def test_trained_while_training(self):
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_model_status='R')
+        url = reverse( views.ml_trained, kwargs = self.uid_use )
+        data = {}
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'T' )
+
+    def test_trained_not_training(self):
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_model_status='E')
+        url = reverse( views.ml_trained, kwargs = self.uid_use )
+        data = {}
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'E' )
+
     def test_traininig_failed_campaign_does_not_exist(self):
         url = reverse( views.ml_training_failed, kwargs = {'campaign_name': 'noCampaign'} )
         data = {}
@@ -57,6 +79,38 @@ class MlStatusTests(MapAPITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual( response.status_code, status.HTTP_200_OK )
 
+    def test_traininig_failed_while_training(self):
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_model_status='R')
+        url = reverse( views.ml_training_failed, kwargs = self.uid_use )
+        data = {}
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'E' )
+
+    def test_probe_failed_campaign_does_not_exist(self):
+        url = reverse( views.ml_probe_failed, kwargs = {'campaign_name': 'noCampaign'} )
+
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
+
+    def test_probe_failed(self):
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_model_status='T')
+        url = reverse( views.ml_probe_failed, kwargs = self.uid_use )
+
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'E' )
+
+    def test_probe_failed_while_training(self):
+        # a probe of the previous model failing does not affect training
+        Campaign.objects.filter(pk=self.campaign.pk).update(ml_model_status='R')
+        url = reverse( views.ml_probe_failed, kwargs = self.uid_use )
+
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( Campaign.objects.get(pk=self.campaign.pk).ml_model_status, 'R' )
+
 ############################################################
 #
 # test sending new proposed experiment
@@ -133,6 +187,22 @@ class ProposeExperimentTests(MapAPITransactionTestCase):
         mock_task.place_experiment.delay.assert_not_called()
         mock_task.place_experiment.apply_async.assert_not_called()
 
+    def test_excluded_by_constraint(self, mock_task):
+        parent = CampaignConstraint.objects.create(campaign=self.campaign)
+        CampaignAtomicConstraint.objects.create(parent=parent, parameter=self.map_inputs[0], constraint_type='LT', v1=5.0)
+
+        url = reverse( views.propose_experiment, kwargs = self.uid_use )
+        data = {
+                'mode': 'random',
+                'inputs': self.input_dicts,
+                }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+        self.assertEqual( Experiment.objects.filter(campaign=self.campaign).count(), 0 )
+
+        mock_task.place_experiment.delay.assert_not_called()
+
 #    def test_celery_new_experiment(self):
 #        url = reverse( views.propose_experiment, kwargs = self.uid_use )
 #        data = {
@@ -147,3 +217,149 @@ class ProposeExperimentTests(MapAPITransactionTestCase):
 #
 #        # pause to give time for celery task to run before database destroyed
 #        sleep(30)
+
+############################################################
+#
+# test sending several new proposed experiments
+#
+############################################################
+@mock.patch('map_ml.views.celery_task')
+class ProposeExperimentsTests(MapAPITransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.map_inputs = [ MapInput.objects.create(for_map=self.test_map, name=name, min_val=0.0, max_val=10.0) for name in ['parameter_1', 'parameter_2'] ]
+        self.map_stage = MapStage.objects.create(for_map=self.test_map, name=self.base_uid['stage_name'])
+        self.map_output = MapOutput.objects.create(for_map=self.test_map, name=self.base_uid['output_name'])
+
+        self.uid_use = { 'campaign_name': self.base_uid['campaign_name'] }
+
+    def proposal(self, values):
+        return {
+                'mode': 'gp',
+                'experiments': [ { 'inputs': [ {'name': inp.name, 'value': v} for inp, v in zip(self.map_inputs, row) ] } for row in values ],
+                }
+
+    ##############################
+    # POST
+    ##############################
+    def test_campaign_does_not_exist(self, mock_task):
+        url = reverse( views.propose_experiments, kwargs = {'campaign_name': 'noCampaign'} )
+
+        response = self.client.post(url, self.proposal([[1.0, 2.0]]), format='json')
+        self.assertEqual( response.status_code, status.HTTP_404_NOT_FOUND )
+
+        mock_task.place_experiments.delay.assert_not_called()
+
+    def test_new_experiments(self, mock_task):
+        url = reverse( views.propose_experiments, kwargs = self.uid_use )
+        values = [ [1.0, 2.0], [3.0, 4.0], [5.0, 6.0] ]
+
+        response = self.client.post(url, self.proposal(values), format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        names = [ exp['experiment_name'] for exp in response.data ]
+        self.assertEqual( names, [ 'Experiment - gp {}'.format(i) for i in range(1, len(values)+1) ] )
+
+        for name, row in zip(names, values):
+            experiment = Experiment.objects.get(campaign=self.campaign, name=name)
+            requested = dict( experiment.input_values.values_list('map_input__name', 'value_request') )
+            self.assertEqual( requested, { inp.name: v for inp, v in zip(self.map_inputs, row) } )
+            self.assertEqual( experiment.stages.count(), 1 )
+            self.assertEqual( experiment.output_values.count(), 1 )
+
+        # asyncronous task not called, but verify arguments
+        mock_task.place_experiments.delay.assert_called_once_with(self.campaign.name, names)
+
+    def test_partial_inputs(self, mock_task):
+        url = reverse( views.propose_experiments, kwargs = self.uid_use )
+        data = { 'mode': 'gp', 'experiments': [ { 'inputs': [ {'name': self.map_inputs[1].name, 'value': 1.0} ] } ] }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( ExpInputVal.objects.filter(experiment__campaign=self.campaign).count(), 1 )
+
+    def test_unknown_input_name(self, mock_task):
+        url = reverse( views.propose_experiments, kwargs = self.uid_use )
+        data = self.proposal([[1.0, 2.0], [3.0, 4.0]])
+        data['experiments'][1]['inputs'].append( {'name': 'mystery_parameter', 'value': 1.0} )
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+        self.assertEqual( Experiment.objects.filter(campaign=self.campaign).count(), 0 )
+
+        mock_task.place_experiments.delay.assert_not_called()
+
+    def test_value_out_of_bounds(self, mock_task):
+        url = reverse( views.propose_experiments, kwargs = self.uid_use )
+
+        response = self.client.post(url, self.proposal([[1.0, 2.0], [3.0, 11.0]]), format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+        self.assertEqual( Experiment.objects.filter(campaign=self.campaign).count(), 0 )
+
+        mock_task.place_experiments.delay.assert_not_called()
+
+    def test_excluded_by_constraint(self, mock_task):
+        parent = CampaignConstraint.objects.create(campaign=self.campaign)
+        CampaignAtomicConstraint.objects.create(parent=parent, parameter=self.map_inputs[0], constraint_type='GT', v1=4.0)
+        CampaignAtomicConstraint.objects.create(parent=parent, parameter=self.map_inputs[1], constraint_type='GT', v1=4.0)
+        url = reverse( views.propose_experiments, kwargs = self.uid_use )
+
+        response = self.client.post(url, self.proposal([[1.0, 6.0], [5.0, 6.0]]), format='json')
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+        self.assertEqual( list( response.data['experiments'].keys() ), [1] )
+        self.assertEqual( Experiment.objects.filter(campaign=self.campaign).count(), 0 )
+
+        mock_task.place_experiments.delay.assert_not_called()
+
+############################################################
+#
+# test training data export
+#
+############################################################
+class TrainingDataTests(MapAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.map_inputs = [ MapInput.objects.create(for_map=self.test_map, name=name, min_val=0.0, max_val=10.0) for name in ['parameter_1', 'parameter_2'] ]
+        self.map_output = MapOutput.objects.create(for_map=self.test_map, name=self.base_uid['output_name'])
+
+        values = [ [1.0, 2.0], [3.0, 4.0], [5.0, 6.0] ]
+        self.experiments = create_experiments(self.campaign, 'gp', [ { inp.name: v for inp, v in zip(self.map_inputs, row) } for row in values ])
+        # the last experiment has no result yet, the first ran at a different value
+        for experiment, y in zip(self.experiments[:2], [10.0, 20.0]):
+            ExpOutputVal.objects.filter(experiment=experiment).update(value=y)
+        ExpInputVal.objects.filter(experiment=self.experiments[0], map_input=self.map_inputs[0]).update(value_actual=1.5)
+
+        self.url = reverse( views.ml_training_data, kwargs = {'campaign_name': self.base_uid['campaign_name']} )
+
+    def test_campaign_does_not_exist(self):
+        url = reverse( views.ml_training_data, kwargs = {'campaign_name': 'noCampaign'} )
+        self.assertEqual( self.client.get(url).status_code, status.HTTP_404_NOT_FOUND )
+
+    def test_not_authenticated(self):
+        self.client.logout()
+        self.assertIn( self.client.get(self.url).status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN) )
+
+    def test_training_data(self):
+        response = self.client.get(self.url)
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+        with np.load( io.BytesIO(response.content) ) as data:
+            np.testing.assert_array_equal( data['X'], [ [1.5, 2.0], [3.0, 4.0] ] )
+            np.testing.assert_array_equal( data['Y'], [ [10.0], [20.0] ] )
+            self.assertEqual( list(data['input_names']), ['parameter_1', 'parameter_2'] )
+            self.assertEqual( list(data['output_names']), [self.base_uid['output_name']] )
+            np.testing.assert_array_equal( data['lower'], [0.0, 0.0] )
+            np.testing.assert_array_equal( data['upper'], [10.0, 10.0] )
+
+    def test_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual( response.status_code, status.HTTP_304_NOT_MODIFIED )
+        self.assertEqual( len(response.content), 0 )
+
+        # a new result changes the data
+        ExpOutputVal.objects.filter(experiment=self.experiments[2]).update(value=30.0)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertNotEqual( response['ETag'], etag )
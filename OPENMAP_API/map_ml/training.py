@@ -0,0 +1,64 @@
+import hashlib
+import io
+
+import numpy as np
+
+from map_base.models import ExpInputVal, ExpOutputVal
+from map_base.schema import get_map_schema
+
+############################################################
+# training data
+#
+# the inputs (X) and outputs (Y) of a campaign's experiments as
+# float64 matrices, one row per experiment in experiment order,
+# columns in the order of the MAP schema (input_names, output_names)
+#   an input's value is its actual value, else the requested value
+#   experiments missing any input or output value are left out
+############################################################
+def training_data(campaign):
+    schema = get_map_schema(campaign.for_map_id)
+    input_col = { map_input.id: i for i, map_input in enumerate(schema.inputs) }
+    output_col = { map_output.id: o for o, map_output in enumerate(schema.outputs) }
+
+    input_rows = list( ExpInputVal.objects.filter(experiment__campaign=campaign)
+                        .values_list('experiment_id', 'map_input_id', 'value_actual', 'value_request').order_by() )
+    output_rows = list( ExpOutputVal.objects.filter(experiment__campaign=campaign)
+                        .values_list('experiment_id', 'map_output_id', 'value').order_by() )
+
+    experiment_ids = sorted( { r[0] for r in input_rows } | { r[0] for r in output_rows } )
+    row = { experiment_id: r for r, experiment_id in enumerate(experiment_ids) }
+
+    X = np.full( (len(experiment_ids), len(input_col)), np.nan, dtype=np.float64 )
+    Y = np.full( (len(experiment_ids), len(output_col)), np.nan, dtype=np.float64 )
+    for experiment_id, map_input_id, value_actual, value_request in input_rows:
+        value = value_actual if value_actual is not None else value_request
+        if ( value is not None and map_input_id in input_col ):
+            X[ row[experiment_id], input_col[map_input_id] ] = value
+    for experiment_id, map_output_id, value in output_rows:
+        if ( value is not None and map_output_id in output_col ):
+            Y[ row[experiment_id], output_col[map_output_id] ] = value
+
+    complete = ~( np.isnan(X).any(axis=1) | np.isnan(Y).any(axis=1) )
+
+    return {
+            'X': X[complete],
+            'Y': Y[complete],
+            'input_names': np.array( [ map_input.name for map_input in schema.inputs ], dtype=str ),
+            'output_names': np.array( [ map_output.name for map_output in schema.outputs ], dtype=str ),
+            'lower': schema.input_min,
+            'upper': schema.input_max,
+        }
+
+def training_etag(data):
+    # changes whenever any array of the training data changes
+    digest = hashlib.sha1()
+    for key in sorted(data):
+        digest.update( key.encode() )
+        digest.update( str(data[key].shape).encode() )
+        digest.update( data[key].tobytes() )
+    return '"{}"'.format( digest.hexdigest() )
+
+def training_npz(data):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **data)
+    return buffer.getvalue()
@@ -4,5 +4,8 @@ from map_ml import views
 urlpatterns = [
         re_path(r'trained/(?P<campaign_name>[-:\w\ ]+)/', views.ml_trained),
         re_path(r'failed/(?P<campaign_name>[-:\w\ ]+)/', views.ml_training_failed),
+        re_path(r'probeFailed/(?P<campaign_name>[-:\w\ ]+)/', views.ml_probe_failed),
         re_path(r'proposeExperiment/(?P<campaign_name>[-:\w\ ]+)/', views.propose_experiment),
+        re_path(r'proposeExperiments/(?P<campaign_name>[-:\w\ ]+)/', views.propose_experiments),
+        re_path(r'trainingData/(?P<campaign_name>[-:\w\ ]+)/', views.ml_training_data),
         ]
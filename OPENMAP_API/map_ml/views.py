@@ -1,6 +1,9 @@
 from django.shortcuts import render
+from django.http import HttpResponse
 from django.db import transaction
 
+from celery import chain
+
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.decorators import authentication_classes, permission_classes
@@ -10,6 +13,8 @@ from rest_framework.authentication import SessionAuthentication, BasicAuthentica
 from rest_framework.permissions import IsAuthenticated
 from map_base.models import Campaign, Experiment
 from map_ml.serializers import ProposeExperimentSerializer, NewExperimentSerializer
+from map_ml.serializers import ProposeExperimentsSerializer
+from map_ml.training import training_data, training_etag, training_npz
 
 import map_base.tasks as celery_task
 
@@ -26,21 +31,25 @@ def ml_trained(request, campaign_name):
     except Campaign.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    old_ml_model_status = campaign.ml_model_status
+    if not ( campaign.ml_transition('finish_training') ):
+        # not training (duplicate report or model reset meanwhile) - nothing to follow up
+        return Response(status=status.HTTP_200_OK)
 
-    campaign.ml_model_status = "T"
-    campaign.save()
+    # an update requested while ML was running gets exactly one follow-up training run
+    update_requested = Campaign.objects.filter(pk=campaign.pk, ml_update_requested=True).exists()
 
-    if ( len(campaign.experiments.all()) < campaign.max_experiments ):
-        if ( old_ml_model_status == "R" ):
+    if ( campaign.experiments.count() < campaign.max_experiments ):
+        if not ( update_requested ):
             transaction.on_commit( lambda: celery_task.probe_model.apply_async( (campaign_name,) ) )
-        elif ( old_ml_model_status in [ "U", "O" ] ):
+        else:
             # if new results came in while ML was running, update again after proposing new experiments
             probe_then_update = chain(
                                         celery_task.probe_model.signature( (campaign_name,), ignore_result=False, immutable=True ),
                                         celery_task.update_model.si( campaign_name )
                                      )
             transaction.on_commit( lambda: probe_then_update.apply_async() )
+    elif ( update_requested ):
+        transaction.on_commit( lambda: celery_task.update_model.apply_async( (campaign_name,) ) )
 
     return Response(status=status.HTTP_200_OK)
 
@@ -57,8 +66,25 @@ def ml_training_failed(request, campaign_name):
     except Campaign.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    campaign.ml_model_status = "E"
-    campaign.save()
+    campaign.ml_transition('fail_training')
+
+    return Response(status=status.HTTP_200_OK)
+
+############################################################
+# ml_probe_failed
+# notify probing the trained model failed - no experiments will be proposed
+# the model is marked in error and is retrained once new data arrives
+############################################################
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def ml_probe_failed(request, campaign_name):
+    try:
+        campaign = Campaign.objects.get(name=campaign_name)
+    except Campaign.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    campaign.ml_transition('fail_probing')
 
     return Response(status=status.HTTP_200_OK)
 
@@ -83,3 +109,51 @@ def propose_experiment(request, campaign_name):
         return Response(ret_serializer.data, status=status.HTTP_200_OK)
     else:
         return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+############################################################
+# propose_experiments
+# provide input parameters for several new experiments
+############################################################
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def propose_experiments(request, campaign_name):
+    try:
+        campaign = Campaign.objects.get(name=campaign_name)
+    except Campaign.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    req_serializer = ProposeExperimentsSerializer(data=request.data, context={'campaign': campaign, 'for_map': campaign.for_map_id})
+    if req_serializer.is_valid():
+        experiments = req_serializer.save()
+        experiment_names = [ experiment.name for experiment in experiments ]
+        transaction.on_commit( lambda: celery_task.place_experiments.delay(campaign_name, experiment_names) )
+        ret_serializer = NewExperimentSerializer(experiments, many=True)
+        return Response(ret_serializer.data, status=status.HTTP_200_OK)
+    else:
+        return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+############################################################
+# ml_training_data
+# campaign inputs (X), outputs (Y) and input domain as an npz file
+# a request with a matching If-None-Match gets 304 Not Modified
+############################################################
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication, SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def ml_training_data(request, campaign_name):
+    try:
+        campaign = Campaign.objects.get(name=campaign_name)
+    except Campaign.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    data = training_data(campaign)
+    etag = training_etag(data)
+
+    if ( etag in [ tag.strip() for tag in request.headers.get('If-None-Match', '').split(',') ] ):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(training_npz(data), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="training_data.npz"'
+    response['ETag'] = etag
+    return response
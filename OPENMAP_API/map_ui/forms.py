@@ -1,7 +1,10 @@
 from django import forms
 from django.core.exceptions import ValidationError
 
-from map_base.models import Campaign, MapInput
+from map_base.constraints import CampaignConstraints, input_matrix
+from map_base.design import available_design_choices
+from map_base.models import Campaign
+from map_base.schema import get_map_schema
 
 class CampaignForm(forms.ModelForm):
     class Meta:
@@ -10,8 +13,15 @@ class CampaignForm(forms.ModelForm):
                     'for_map',
                     'with_ml',
                     'max_experiments',
+                    'initial_experiments',
+                    'initial_design',
                     ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # designs needing packages that are not installed are not offered
+        self.fields['initial_design'].choices = available_design_choices()
+
 class ExperimentForm(forms.Form):
     label = forms.CharField()
 
@@ -29,10 +39,11 @@ class ExpInputForm(forms.Form):
         if campaign_name and input_name and input_value:
             try:
                 campaign = Campaign.objects.get(name=campaign_name)
-                map_input = MapInput.objects.get(for_map=campaign.for_map, name=input_name)
             except Campaign.DoesNotExist:
                 raise ValidationError( "Form not associated with a valid campaign.", code='invalid' )
-            except MapInput.DoesNotExist:
+
+            map_input = get_map_schema(campaign.for_map_id).input_by_name.get(input_name)
+            if map_input is None:
                 raise ValidationError( "Invalid input name.", code='invalid' )
 
             if input_value < map_input.min_val or input_value > map_input.max_val:
@@ -52,3 +63,15 @@ class BaseInputFormSet(forms.BaseFormSet):
             if input_name in names:
                 raise ValidationError('Do not specify the same input variable twice.', code='invalid')
             names.append(input_name)
+
+        campaign = Campaign.objects.filter(name__in=[ form.cleaned_data.get('campaign_name') for form in self.forms ]).first()
+        if campaign is not None:
+            schema = get_map_schema(campaign.for_map_id)
+            input_values = { form.cleaned_data.get('input_name'): form.cleaned_data.get('input_value') for form in self.forms
+                                if form.cleaned_data.get('input_name') in schema.input_index and form.cleaned_data.get('input_value') is not None }
+            point = input_matrix( schema, [input_values] )
+
+            excluded_by = CampaignConstraints.load(campaign).excluded_by(point)[0]
+            if ( len(excluded_by) > 0 ):
+                raise ValidationError( 'Inputs are excluded by campaign constraints %(constraints)s.', code='invalid',
+                                        params={ 'constraints': excluded_by })
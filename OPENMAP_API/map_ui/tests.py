@@ -1,3 +1,32 @@
 from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from map_base.models import MapBase, MLFacility
+from map_ui.forms import CampaignForm
+
+############################################################
+#
+# test campaign form
+#
+############################################################
+class CampaignFormTests(TestCase):
+    def setUp(self):
+        self.test_map = MapBase.objects.create(name='test_map')
+        self.ml = MLFacility.objects.create(name='ml', location='mlhost', train_script='train', probe_script='probe')
+
+    def form(self, initial_design):
+        return CampaignForm( data={ 'name': 'api_testing', 'for_map': self.test_map.pk, 'with_ml': self.ml.pk,
+                                    'max_experiments': 10, 'initial_experiments': 4, 'initial_design': initial_design } )
+
+    def test_sobol_needs_scipy(self):
+        with mock.patch('map_base.design.qmc', None):
+            form = self.form('sobol')
+            self.assertNotIn( 'sobol', [ value for value, label in form.fields['initial_design'].choices ] )
+            self.assertFalse( form.is_valid() )
+            self.assertIn( 'initial_design', form.errors )
+
+            self.assertTrue( self.form('lhs').is_valid() )
+
+    def test_sobol_with_scipy(self):
+        with mock.patch('map_base.design.qmc', mock.Mock()):
+            self.assertTrue( self.form('sobol').is_valid() )
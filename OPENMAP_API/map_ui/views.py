@@ -5,8 +5,9 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 
-from map_base.models import MapBase, Campaign, Experiment, ExpStage, ExpInputVal, ExpOutputVal
-from map_base.models import MapInput, MapStage, MapOutput
+from map_base.factory import create_experiment
+from map_base.models import MapBase, Campaign, Experiment
+from map_base.models import MapInput
 from map_ui.forms import CampaignForm
 from map_ui.forms import ExperimentForm, ExpInputForm, BaseInputFormSet
 from map_ui.tables import CampaignExperimentsTable
@@ -14,6 +15,8 @@ from map_ui.tables import ExperimentInputsTable, ExperimentOutputsTable
 
 import map_base.tasks as celery_task
 
+CAMPAIGN_FORM_SAVE_FIELDS = [ field for field in CampaignForm.Meta.fields if field != 'for_map' ]
+
 ############################################################
 #
 # map_index
@@ -68,11 +71,12 @@ def campaign_detail(request, campaign_name):
             form.fields['for_map'].disabled = True
             if form.is_valid():
                 campaign = form.save(commit=False)
+                # only write form fields so ML status and update flags set by tasks are not overwritten
+                campaign.save(update_fields=CAMPAIGN_FORM_SAVE_FIELDS)
                 if 'with_ml' in form.changed_data:
                     # if changing ML system, safest to assume untrained
                     # consider probing status as alternative
-                    campaign.ml_model_status = 'U'
-                campaign.save()
+                    campaign.ml_transition('reset')
 
                 return HttpResponseRedirect(
                         reverse( 'ui:campaign_detail',
@@ -82,15 +86,18 @@ def campaign_detail(request, campaign_name):
             form = CampaignForm(request.POST, instance=campaign, prefix='campaign')
             form.fields['for_map'].disabled = True
             if form.is_valid():
-                campaign = form.save()
+                campaign = form.save(commit=False)
+                # only write form fields so ML status and update flags set by tasks are not overwritten
+                campaign.save(update_fields=CAMPAIGN_FORM_SAVE_FIELDS)
                 if 'with_ml' in form.changed_data:
                     # if changing ML system, safest to assume untrained
                     # consider probing status as alternative
-                    campaign.ml_model_status = 'U'
-                campaign.save()
+                    campaign.ml_transition('reset')
 
                 n_experiment = len(campaign.experiments.all()) # consider filtering by status to exclude failed/cancelled experiments
                 if ( n_experiment > 0 ):
+                    # act on the current status - tasks may have changed it since the page was loaded
+                    campaign.refresh_from_db(fields=['ml_model_status'])
 
                     if ( campaign.ml_model_status == "U" ):
                         # ML model hasn't been trained on all available data - updating model will lead to probing if not at max experiments
@@ -113,10 +120,10 @@ def campaign_detail(request, campaign_name):
                         # ML model error reported - appropriate handling TBD
                         pass
                 else:
-                    # generate random experiment
+                    # generate initial experiments from the campaign's space-filling design
                     if campaign.max_experiments > 0:
-                        experiment = campaign.propose_random_experiment()
-                        transaction.on_commit( lambda: celery_task.place_experiment.delay(campaign_name, experiment.name) )
+                        experiment_names = [ experiment.name for experiment in campaign.propose_initial_experiments() ]
+                        transaction.on_commit( lambda: celery_task.place_experiments.delay(campaign.name, experiment_names) )
                 
                 return HttpResponseRedirect(
                         reverse( 'ui:campaign_detail',
@@ -125,7 +132,8 @@ def campaign_detail(request, campaign_name):
 
         elif "propose_random" in request.POST:
             experiment = campaign.propose_random_experiment()
-            transaction.on_commit( lambda: celery_task.place_experiment.delay(campaign_name, experiment.name) )
+            if experiment is not None:
+                transaction.on_commit( lambda: celery_task.place_experiment.delay(campaign_name, experiment.name) )
 
             form = CampaignForm(instance=campaign, prefix='campaign')
 
@@ -208,19 +216,8 @@ def propose_user_experiment(request, campaign_name):
             inp_forms = InputFormset(request.POST, prefix='expinp')
 
             if exp_form.is_valid() and inp_forms.is_valid():
-                experiment = Experiment.objects.new_proposed(campaign=campaign, mode=exp_form.cleaned_data['label'])
-
-                for inp_form in inp_forms.forms:
-                    map_input = MapInput.objects.get(for_map=campaign.for_map, name=inp_form.cleaned_data['input_name'])
-                    ExpInputVal.objects.create(experiment=experiment, map_input=map_input, value_request=inp_form.cleaned_data['input_value'])
-
-                map_stages = MapStage.objects.filter(for_map=campaign.for_map)
-                for map_stg in map_stages:
-                    new_exp_stg = ExpStage.objects.create(experiment=experiment, map_stage=map_stg)
-
-                map_outputs = MapOutput.objects.filter(for_map=campaign.for_map)
-                for map_out in map_outputs:
-                    new_exp_out = ExpOutputVal.objects.create(experiment=experiment, map_output=map_out)
+                input_values = { inp_form.cleaned_data['input_name']: inp_form.cleaned_data['input_value'] for inp_form in inp_forms.forms }
+                experiment = create_experiment(campaign, exp_form.cleaned_data['label'], input_values)
 
                 transaction.on_commit( lambda: celery_task.place_experiment.delay(campaign_name, experiment.name) )
 
@@ -234,15 +231,7 @@ def propose_user_experiment(request, campaign_name):
         else:
             # experiment doesn't take inputs
             if exp_form.is_valid():
-                experiment = Experiment.objects.new_proposed(campaign=campaign, mode=exp_form.cleaned_data['label'])
-
-                map_stages = MapStage.objects.filter(for_map=campaign.for_map)
-                for map_stg in map_stages:
-                    new_exp_stg = ExpStage.objects.create(experiment=experiment, map_stage=map_stg)
-
-                map_outputs = MapOutput.objects.filter(for_map=campaign.for_map)
-                for map_out in map_outputs:
-                    new_exp_out = ExpOutVal.objects.create(experiment=experiment, map_output=map_out)
+                experiment = create_experiment(campaign, exp_form.cleaned_data['label'], {})
 
                 transaction.on_commit( lambda: celery_task.place_experiment.delay(campaign_name, experiment.name) )
 
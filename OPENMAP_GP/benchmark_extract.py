@@ -0,0 +1,87 @@
+from training_data import extract_from_db, extract_from_db_joins
+import numpy as np
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+############################################################
+# time extract_from_db against campaign size and dimensionality
+#
+#   python benchmark_extract.py [n_experiments ...]
+#
+# builds a synthetic database holding only the tables read by
+# extract_from_db, with a second campaign of the same size on the
+# same MAP, and compares against the previous self-join query
+############################################################
+def process_inputs():
+    argList = sys.argv
+    if ( len(argList) > 1 ):
+        return [ int(n) for n in argList[1:] ]
+    return [100, 1000, 10000]
+
+def build_db(dbname, n_exp, n_in, n_out, seed=0):
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(dbname)
+    c = conn.cursor()
+
+    c.execute('CREATE TABLE map_base_mapbase (id INTEGER PRIMARY KEY, name TEXT)')
+    c.execute('CREATE TABLE map_base_campaign (id INTEGER PRIMARY KEY, name TEXT, for_map_id INTEGER REFERENCES map_base_mapbase(id))')
+    c.execute('CREATE TABLE map_base_mapinput (id INTEGER PRIMARY KEY, name TEXT, for_map_id INTEGER REFERENCES map_base_mapbase(id))')
+    c.execute('CREATE TABLE map_base_mapoutput (id INTEGER PRIMARY KEY, name TEXT, for_map_id INTEGER REFERENCES map_base_mapbase(id))')
+    c.execute('CREATE TABLE map_base_experiment (id INTEGER PRIMARY KEY, campaign_id INTEGER REFERENCES map_base_campaign(id))')
+    c.execute('CREATE TABLE map_base_expinputval (id INTEGER PRIMARY KEY, experiment_id INTEGER, map_input_id INTEGER, value_request REAL, value_actual REAL)')
+    c.execute('CREATE TABLE map_base_expoutputval (id INTEGER PRIMARY KEY, experiment_id INTEGER, map_output_id INTEGER, value REAL)')
+    # the foreign key indexes django creates
+    c.execute('CREATE INDEX expinputval_experiment ON map_base_expinputval (experiment_id)')
+    c.execute('CREATE INDEX expinputval_map_input ON map_base_expinputval (map_input_id)')
+    c.execute('CREATE INDEX expoutputval_experiment ON map_base_expoutputval (experiment_id)')
+    c.execute('CREATE INDEX expoutputval_map_output ON map_base_expoutputval (map_output_id)')
+    c.execute('CREATE INDEX experiment_campaign ON map_base_experiment (campaign_id)')
+
+    c.execute("INSERT INTO map_base_mapbase VALUES (1, 'bench')")
+    c.executemany('INSERT INTO map_base_campaign VALUES (?, ?, 1)', [ (1, 'bench'), (2, 'other') ])
+    c.executemany('INSERT INTO map_base_mapinput VALUES (?, ?, 1)', [ (i+1, 'x{}'.format(i)) for i in range(n_in) ])
+    c.executemany('INSERT INTO map_base_mapoutput VALUES (?, ?, 1)', [ (o+1, 'y{}'.format(o)) for o in range(n_out) ])
+    c.executemany('INSERT INTO map_base_experiment VALUES (?, ?)', [ (e+1, 1 + e % 2) for e in range(2*n_exp) ])
+
+    inputs = rng.random( (2*n_exp, n_in) )
+    outputs = rng.random( (2*n_exp, n_out) )
+    c.executemany('INSERT INTO map_base_expinputval (experiment_id, map_input_id, value_request, value_actual) VALUES (?, ?, ?, ?)',
+                  [ (e+1, i+1, inputs[e,i], inputs[e,i] if e % 3 else None) for e in range(2*n_exp) for i in range(n_in) ])
+    c.executemany('INSERT INTO map_base_expoutputval (experiment_id, map_output_id, value) VALUES (?, ?, ?)',
+                  [ (e+1, o+1, outputs[e,o]) for e in range(2*n_exp) for o in range(n_out) ])
+    conn.commit()
+    conn.close()
+
+def best_time(func, *args, repeat=3):
+    times = []
+    for r in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append( time.perf_counter() - start )
+    return min(times), result
+
+if __name__ == "__main__":
+    sizes = process_inputs()
+    dims = [ (2, 1), (10, 2), (20, 4), (30, 5) ]
+
+    print('{:>8} {:>4} {:>4} {:>12} {:>12}'.format('n_exp', 'n_in', 'n_out', 'pivot (s)', 'joins (s)'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_in, n_out in dims:
+            for n_exp in sizes:
+                dbname = os.path.join(tmpdir, 'bench_{}_{}_{}.sqlite3'.format(n_exp, n_in, n_out))
+                build_db(dbname, n_exp, n_in, n_out)
+
+                t_pivot, (inpar, loss) = best_time(extract_from_db, dbname, 'bench')
+                try:
+                    t_joins, (inpar_joins, loss_joins) = best_time(extract_from_db_joins, dbname, 'bench')
+                except sqlite3.OperationalError as err:
+                    # sqlite allows at most 64 tables in a join
+                    print('{:>8} {:>4} {:>4} {:>12.4f} {:>12}  ({})'.format(n_exp, n_in, n_out, t_pivot, 'failed', err))
+                    continue
+
+                # both extractions must agree (rows are in experiment order)
+                assert np.array_equal(inpar, inpar_joins) and np.array_equal(loss, loss_joins)
+                print('{:>8} {:>4} {:>4} {:>12.4f} {:>12.4f}'.format(n_exp, n_in, n_out, t_pivot, t_joins))
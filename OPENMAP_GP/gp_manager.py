@@ -1,7 +1,11 @@
+import json
 import numpy as np
+import os
 
 from GPy import kern
+from GPy.inference.latent_function_inference.posterior import Posterior
 from GPy.models import GPRegression
+from paramz import ObsAr
 
 from GPyOpt import Design_space
 from GPyOpt.acquisitions import AcquisitionLCB
@@ -11,25 +15,134 @@ from GPyOpt.methods import ModularBayesianOptimization
 from GPyOpt.models import GPModel
 from GPyOpt.optimization.acquisition_optimizer import AcquisitionOptimizer
 
+from gp_posterior import CholeskyPosterior
+
+
+############################################################
+# gp_manager
+#
+# update_model() starts from the saved model:
+#   new observations extending its data are appended to the posterior
+#   with fixed kernel parameters (O(n^2) Cholesky update, no optimisation)
+#   until refit_every appends have been made or the log likelihood per
+#   observation has dropped by more than ll_drift since the last fit
+#
+#   a refit warm starts: the data is set on the model and optimisation
+#   continues from its kernel parameters for a few iterations
+#
+#   a full optimisation from default parameters is run every full_every
+#   refits, or once the data has grown by full_growth since the last one,
+#   so the warm started parameters do not drift
+#
+# The history of updates is saved next to the model.
+############################################################
+class FittedGPModel(GPModel):
+    # GPyOpt model around the fitted GPy model, for suggestions only
+    # GPModel.updateModel sets the data again (refactorising K) and
+    # optimises - the model already holds the data and is not refit
+    def __init__(self, model):
+        super().__init__(max_iters=0, optimize_restarts=1, verbose=False)
+        self.model = model
+
+    def updateModel(self, X_all, Y_all, X_new, Y_new):
+        if not ( np.array_equal(X_all, self.model.X) and np.array_equal(Y_all, self.model.Y) ):
+            super().updateModel(X_all, Y_all, X_new, Y_new)
 
 class gp_manager:
+    full_every = 10
+    full_growth = 1.5
+    incremental_iters = 10
+    refit_every = 5
+    ll_drift = 0.5
+
+    def __init__(self):
+        self.model = None
+        self.history = { 'updates_since_full': 0, 'n_at_full': 0, 'appends_since_fit': 0, 'll_per_point': None }
 
     def save_model(self, output_filename):
         self.model.save_model(output_filename)
+        with open(output_filename + ".history.json", 'w') as f:
+            json.dump(self.history, f)
 
     def load_model(self, output_filename):
         zip_filename = output_filename + ".zip"
         self.model = GPRegression.load_model(zip_filename)
 
+        history_filename = output_filename + ".history.json"
+        if ( os.path.exists(history_filename) ):
+            with open(history_filename) as f:
+                self.history.update( json.load(f) )
+
     def train_model(self, inpar, loss, max_iters=100):
         self.kernel = kern.RBF(input_dim = inpar.shape[1])
         self.model = GPRegression(inpar, loss, self.kernel)
         self.model.optimize('bfgs', max_iters=max_iters)
-
-    def retrain_model(self, inpar, loss, max_iters=100):
-        raise( Exception("use train_model instead") )
-#        self.model.set_XY(inpar, loss)
-#        self.model.optimize('bfgs', max_iters=max_iters)
+        self.history = { 'updates_since_full': 0, 'n_at_full': inpar.shape[0] }
+        self.fitted()
+
+    def retrain_model(self, inpar, loss, max_iters=None):
+        # continue optimising from the current kernel parameters
+        if ( max_iters is None ):
+            max_iters = self.incremental_iters
+        self.model.set_XY(inpar, loss)
+        self.model.optimize('bfgs', max_iters=max_iters)
+        self.history['updates_since_full'] += 1
+        self.fitted()
+
+    def fitted(self):
+        self.history['appends_since_fit'] = 0
+        self.history['ll_per_point'] = float( self.model.log_likelihood() ) / self.model.X.shape[0]
+
+    def append_observations(self, inpar, loss):
+        # append the rows of inpar/loss beyond the model's data without refitting
+        # returns False (model unchanged) if the data does not extend the model's,
+        # or the kernel parameters no longer fit it well enough
+        n = self.model.X.shape[0]
+        if ( inpar.shape[0] < n or not np.array_equal(inpar[:n], self.model.X) or not np.array_equal(loss[:n], self.model.Y) ):
+            return False
+        if ( inpar.shape[0] == n ):
+            return True
+
+        posterior = CholeskyPosterior.from_gpy(self.model)
+        posterior.append(inpar[n:], loss[n:])
+
+        log_likelihood = posterior.log_likelihood()
+        if ( self.history['ll_per_point'] is not None and self.history['ll_per_point'] - log_likelihood / posterior.n > self.ll_drift ):
+            return False
+
+        # install the updated posterior - set_XY would refactorise
+        self.model.X = ObsAr(posterior.X)
+        self.model.Y = ObsAr(posterior.Y)
+        self.model.Y_normalized = self.model.Y
+        self.model.posterior = Posterior( woodbury_chol=posterior.L, woodbury_vector=posterior.alpha, K=self.model.kern.K(posterior.X) )
+        self.model._log_marginal_likelihood = log_likelihood
+        self.history['appends_since_fit'] += 1
+        return True
+
+    def needs_full_train(self, inpar, loss):
+        if ( self.model is None ):
+            return True
+        if ( self.model.X.shape[1] != inpar.shape[1] or self.model.Y.shape[1] != loss.shape[1] ):
+            return True
+        if ( self.history['updates_since_full'] + 1 >= self.full_every ):
+            return True
+        return ( inpar.shape[0] >= self.full_growth * max(self.history['n_at_full'], 1) )
+
+    def update_model(self, model_filename, inpar, loss):
+        # returns how the model was updated - 'full', 'refit' or 'append'
+        # a model already held (gp_server) is used in place of the saved one
+        if ( self.model is None and os.path.exists(model_filename + ".zip") ):
+            self.load_model(model_filename)
+
+        if ( self.needs_full_train(inpar, loss) ):
+            self.train_model(inpar, loss)
+            return 'full'
+
+        if ( self.history['appends_since_fit'] < self.refit_every and self.append_observations(inpar, loss) ):
+            return 'append'
+
+        self.retrain_model(inpar, loss)
+        return 'refit'
 
     def pre_suggest(self, domain):
         self.space = Design_space( domain )
@@ -37,8 +150,7 @@ class gp_manager:
         self.acq_opt = AcquisitionOptimizer(self.space)
 
     def suggest_single(self, exploration_weight=2):
-        opt_model = GPModel(optimize_restarts=1, verbose=False)
-        opt_model.model = self.model
+        opt_model = FittedGPModel(self.model)
 
         acquisition = AcquisitionLCB(opt_model, self.space, self.acq_opt, exploration_weight=exploration_weight)
         evaluator = evaluators.Sequential(acquisition)
@@ -53,8 +165,7 @@ class gp_manager:
         return bo.suggest_next_locations()
 
     def suggest_multi(self, batch_size, exploration_weight=2):
-        opt_model = GPModel(optimize_restarts=1, verbose=False)
-        opt_model.model = self.model
+        opt_model = FittedGPModel(self.model)
 
         acquisition = AcquisitionLCB(opt_model, self.space, self.acq_opt, exploration_weight=exploration_weight)
         evaluator = evaluators.ThompsonBatch(acquisition, batch_size=batch_size)
@@ -0,0 +1,70 @@
+import numpy as np
+from scipy.linalg import cho_solve, cholesky, solve_triangular
+
+############################################################
+# CholeskyPosterior
+#
+# exact GP posterior with fixed hyperparameters, kept as the lower
+# Cholesky factor L of K(X,X) + noise*I and alpha = (K + noise*I)^-1 Y
+#   append() adds observations in O(n^2) per observation by extending
+#   L with one block, instead of refactorising in O(n^3)
+#
+#   kernel(A, B) returns the covariance matrix between the rows of A and B
+############################################################
+class CholeskyPosterior:
+    def __init__(self, kernel, noise, X, Y, L=None):
+        self.kernel = kernel
+        self.noise = float(noise)
+        self.X = np.asarray(X, dtype=np.float64)
+        self.Y = np.asarray(Y, dtype=np.float64)
+
+        if ( L is None ):
+            L = cholesky( self.kernel(self.X, self.X) + self.noise * np.eye(self.X.shape[0]), lower=True )
+        self.L = L
+        self.alpha = cho_solve( (self.L, True), self.Y )
+
+    @classmethod
+    def from_gpy(cls, model):
+        # reuses the factor GPy computed for its own posterior
+        return cls( model.kern.K, float(model.likelihood.variance), model.X, model.Y, L=np.array(model.posterior.woodbury_chol) )
+
+    @property
+    def n(self):
+        return self.X.shape[0]
+
+    def append(self, X_new, Y_new):
+        X_new = np.atleast_2d( np.asarray(X_new, dtype=np.float64) )
+        Y_new = np.atleast_2d( np.asarray(Y_new, dtype=np.float64) )
+        m = X_new.shape[0]
+        if ( m == 0 ):
+            return
+
+        #   [ L    0  ]   L21 = K(X_new, X) L^-T
+        #   [ L21  L22]   L22 = chol( K(X_new, X_new) + noise*I - L21 L21^T )
+        L21 = solve_triangular( self.L, self.kernel(self.X, X_new), lower=True ).T
+        S = self.kernel(X_new, X_new) + self.noise * np.eye(m) - L21 @ L21.T
+        L22 = cholesky( S, lower=True )
+
+        L = np.zeros( (self.n + m, self.n + m) )
+        L[:self.n, :self.n] = self.L
+        L[self.n:, :self.n] = L21
+        L[self.n:, self.n:] = L22
+
+        self.L = L
+        self.X = np.vstack( (self.X, X_new) )
+        self.Y = np.vstack( (self.Y, Y_new) )
+        self.alpha = cho_solve( (self.L, True), self.Y )
+
+    def predict(self, X_star):
+        X_star = np.atleast_2d( np.asarray(X_star, dtype=np.float64) )
+        K_star = self.kernel(self.X, X_star)
+        mean = K_star.T @ self.alpha
+        v = solve_triangular( self.L, K_star, lower=True )
+        var = np.diag( self.kernel(X_star, X_star) ) - np.sum(v**2, axis=0) + self.noise
+        return mean, var[:, None]
+
+    def log_likelihood(self):
+        n, d = self.Y.shape
+        return ( -0.5 * np.sum(self.Y * self.alpha)
+                 - d * np.sum( np.log( np.diag(self.L) ) )
+                 - 0.5 * n * d * np.log(2.0 * np.pi) )
@@ -0,0 +1,262 @@
+from gp_manager import gp_manager
+from probe_gp import probe
+from train_gp import train
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hmac
+import json
+import logging
+import numpy as np
+import os
+import requests
+import threading
+
+logger = logging.getLogger('gp_server')
+
+############################################################
+# gp_server
+#
+# keeps GP models in memory between requests instead of starting
+# train_gp.py / probe_gp.py (and importing GPy) for every request
+#
+#   POST /train/    {campaign_name, model}
+#   POST /probe/    {campaign_name, model, num_samples}
+#       run in the background (202 Accepted) and report to the
+#       ml-api (--api-base) as the scripts do
+#       training data comes from the ml-api, or from the database
+#       file given by --database - never from a path in a request
+#   POST /predict/  {model, points: [[x, ...], ...]}
+#       mean and variance of the model at the points
+#   GET  /models/
+#       models held and their estimated memory
+#
+#   every request must carry the shared key (--key) in the
+#   X-GP-Server-Key header, else 403 Forbidden
+#   model names are file names in --model-dir, without any path
+#
+#   python gp_server.py --port 8500 --memory-mb 1024
+############################################################
+def process_inputs():
+    parser = argparse.ArgumentParser(description='GP model server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--workers', type=int, default=2, help='train/probe requests run at once')
+    parser.add_argument('--memory-mb', type=float, default=1024, help='memory budget of the models held')
+    parser.add_argument('--model-dir', default='.', help='directory of the model files')
+    parser.add_argument('--database', default='', help='orchestrator database file to read training data from (shared filesystem only), instead of the ml-api')
+    parser.add_argument('--api-base', default=os.environ.get('OPENMAP_ML_API_BASE', 'http://localhost:8000/ml-api/'), help='orchestrator ml-api address')
+    parser.add_argument('--token', default=os.environ.get('OPENMAP_API_TOKEN', ''), help='token for the orchestrator ml-api')
+    parser.add_argument('--key', default=os.environ.get('GP_SERVER_KEY', ''), help='shared key requests must carry (MAP_ML_SERVER_KEY of the orchestrator)')
+    args = parser.parse_args()
+    if ( args.key == '' ):
+        parser.error('a shared key is required: --key or GP_SERVER_KEY')
+    if not ( args.api_base.endswith('/') ):
+        args.api_base += '/'
+    return args
+
+############################################################
+# ModelCache
+#
+# gp_managers by model name (campaign uid_node), least recently used
+# first. Models are dropped, least recently used first, while the
+# estimated memory of those held is over budget. Models in use are
+# never dropped, and a dropped model is reloaded from its file.
+############################################################
+MODEL_OVERHEAD = 1024*1024
+
+def model_bytes(gp):
+    # data, kernel matrix and its Cholesky factor
+    if ( gp.model is None ):
+        return 0
+    n = gp.model.X.shape[0]
+    return gp.model.X.nbytes + gp.model.Y.nbytes + 2*n*n*8 + MODEL_OVERHEAD
+
+class ModelCache:
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, model):
+        # (gp_manager, lock) of a model - hold the lock while using the gp_manager
+        with self.lock:
+            if ( model not in self.entries ):
+                self.entries[model] = ( gp_manager(), threading.Lock() )
+            self.entries.move_to_end(model)
+            return self.entries[model]
+
+    def discard(self, model):
+        with self.lock:
+            self.entries.pop(model, None)
+
+    def trim(self):
+        with self.lock:
+            total = sum( model_bytes(gp) for gp, lock in self.entries.values() )
+            for model in list(self.entries):
+                if ( total <= self.memory_budget ):
+                    break
+                gp, lock = self.entries[model]
+                if not ( lock.acquire(blocking=False) ):
+                    continue
+                try:
+                    total -= model_bytes(gp)
+                    del self.entries[model]
+                    logger.info("dropped model %s", model)
+                finally:
+                    lock.release()
+
+    def stats(self):
+        with self.lock:
+            return { model: { 'bytes': model_bytes(gp), 'loaded': gp.model is not None } for model, (gp, lock) in self.entries.items() }
+
+############################################################
+# requests
+############################################################
+def valid_model_name(model):
+    # a plain file name - no directories, no '..'
+    return ( isinstance(model, str) and model not in ('', '.', '..') and os.path.basename(model) == model
+                and ( os.path.altsep is None or os.path.altsep not in model ) and '\0' not in model )
+
+class GPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache, workers, model_dir, api_base, header, key, database=''):
+        super().__init__(address, GPRequestHandler)
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.model_dir = model_dir
+        self.api_base = api_base
+        # train_gp / probe_gp data_source: 'api' or the database file
+        self.data_source = database if database else 'api'
+        self.header = header
+        self.key = key
+
+    def authorized(self, key):
+        return ( key is not None and hmac.compare_digest( key.encode(), self.key.encode() ) )
+
+    def model_file(self, model):
+        if not ( valid_model_name(model) ):
+            raise ValueError("invalid model name '{}'".format(model))
+        return os.path.join(self.model_dir, model)
+
+    def report_failure(self, endpoint, campaign_name):
+        try:
+            requests.post( '{}{}/{}/'.format(self.api_base, endpoint, campaign_name), headers=self.header, timeout=30 )
+        except requests.RequestException:
+            logger.exception("reporting %s for %s failed", endpoint, campaign_name)
+
+    def run_train(self, req):
+        gp, lock = self.cache.get(req['model'])
+        try:
+            with lock:
+                train(req['campaign_name'], self.model_file(req['model']), self.data_source, self.api_base, self.header, gp=gp)
+        except Exception:
+            logger.exception("training %s failed", req['model'])
+            # the model may be part way through an update - reload it from its file next time
+            self.cache.discard(req['model'])
+            self.report_failure('failed', req['campaign_name'])
+        self.cache.trim()
+
+    def run_probe(self, req):
+        gp, lock = self.cache.get(req['model'])
+        try:
+            with lock:
+                probe(req['campaign_name'], self.model_file(req['model']), self.data_source, int(req['num_samples']), self.api_base, self.header, gp=gp)
+        except Exception:
+            logger.exception("probing %s failed", req['model'])
+            # as for training - reload the model from its file next time, and tell the
+            # orchestrator no experiments are coming
+            self.cache.discard(req['model'])
+            self.report_failure('probeFailed', req['campaign_name'])
+        self.cache.trim()
+
+    def predict(self, req):
+        gp, lock = self.cache.get(req['model'])
+        with lock:
+            if ( gp.model is None ):
+                gp.load_model( self.model_file(req['model']) )
+            mean, variance = gp.model.predict( np.array(req['points'], dtype=np.float64) )
+        self.cache.trim()
+        return { 'mean': mean.tolist(), 'variance': variance.tolist() }
+
+class GPRequestHandler(BaseHTTPRequestHandler):
+    TASK_FIELDS = {
+                'train': ('campaign_name', 'model'),
+                'probe': ('campaign_name', 'model', 'num_samples'),
+                'predict': ('model', 'points'),
+            }
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if ( self.server.authorized( self.headers.get('X-GP-Server-Key') ) ):
+            return True
+        self.send_json(403, {'error': 'forbidden'})
+        return False
+
+    def do_GET(self):
+        if not ( self.authorized() ):
+            return
+        if ( self.path.strip('/') == 'models' ):
+            self.send_json(200, self.server.cache.stats())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if not ( self.authorized() ):
+            return
+        task = self.path.strip('/')
+        if ( task not in self.TASK_FIELDS ):
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            req = json.loads( self.rfile.read( int(self.headers.get('Content-Length', 0)) ) )
+        except ValueError:
+            self.send_json(400, {'error': 'request is not valid JSON'})
+            return
+        missing = [ field for field in self.TASK_FIELDS[task] if field not in req ]
+        if ( len(missing) > 0 ):
+            self.send_json(400, {'error': 'missing fields: {}'.format(', '.join(missing))})
+            return
+        if not ( valid_model_name(req['model']) ):
+            self.send_json(400, {'error': 'model must be a file name without a path'})
+            return
+
+        if ( task == 'train' ):
+            self.server.executor.submit(self.server.run_train, req)
+            self.send_json(202, {})
+        elif ( task == 'probe' ):
+            self.server.executor.submit(self.server.run_probe, req)
+            self.send_json(202, {})
+        else:
+            try:
+                self.send_json(200, self.server.predict(req))
+            except (OSError, IOError):
+                self.server.cache.discard(req['model'])
+                self.send_json(404, {'error': "no model '{}'".format(req['model'])})
+            except ValueError as err:
+                self.send_json(400, {'error': str(err)})
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+if __name__ == "__main__":
+    args = process_inputs()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    header = { 'Authorization': 'token {}'.format(args.token) }
+    cache = ModelCache( int(args.memory_mb * 1024*1024) )
+    server = GPServer( (args.host, args.port), cache, args.workers, args.model_dir, args.api_base, header, args.key, args.database )
+
+    logger.info("serving GP models on %s:%d", args.host, args.port)
+    server.serve_forever()
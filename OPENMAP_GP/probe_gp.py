@@ -1,6 +1,5 @@
 from gp_manager import gp_manager
-import numpy as np
-import sqlite3
+from training_data import domain_from_data, extract_var_limits, fetch_training_data
 import requests
 import sys
 
@@ -8,35 +7,25 @@ def process_inputs():
     argList = sys.argv
     argc = len(argList)
 
-    # campaign_name, model_filename, dbname, num_samples, api_base
+    # campaign_name, model_filename, data_source, num_samples, api_base
+    # data_source is 'api' to fetch the input domain from api_base, otherwise the database file
 
     if (argc-1 != 5):
         raise Exception("run with incorrect number of arguments ({} != 5)".format(argc-1))
 
     return (argList[1], argList[2], argList[3], int(argList[4]), argList[5])
 
-def extract_var_limits(dbname, campaign_name):
-    conn = sqlite3.connect(dbname)
-    c = conn.cursor()
+def probe(campaign_name, model_file, data_source, n_probes, api_base, header, gp=None):
+    # gp: a manager already holding the campaign's model, else it is loaded from model_file
+    if ( gp is None ):
+        gp = gp_manager()
+    if ( gp.model is None ):
+        gp.load_model(model_file)
 
-    domain = []
-
-    select_invar = 'SELECT i.name, i.min_val, i.max_val FROM map_base_mapinput AS i'
-    select_invar = select_invar + ' JOIN map_base_mapbase AS m ON i.for_map_id=m.id'
-    select_invar = select_invar + ' JOIN map_base_campaign AS c ON c.for_map_id=m.id'
-    select_invar = select_invar + ' WHERE c.name=?'
-    for row in c.execute(select_invar, (campaign_name,)):
-        domain.append( { 'name': row[0], 'type': 'continuous', 'domain': (row[1],row[2]) } )
-
-    return domain
-
-if __name__ == "__main__":
-    campaign_name, model_file, dbname, n_probes, api_base = process_inputs()
-
-    gp = gp_manager()
-    gp.load_model(model_file)
-
-    domain = extract_var_limits(dbname, campaign_name)
+    if ( data_source == 'api' ):
+        domain = domain_from_data( fetch_training_data(api_base, campaign_name, header, '{}.training.npz'.format(model_file)) )
+    else:
+        domain = extract_var_limits(data_source, campaign_name)
     gp.pre_suggest(domain)
 
     if (n_probes > 1):
@@ -44,11 +33,17 @@ if __name__ == "__main__":
     else:
         points = gp.suggest_single(n_probes)
 
-    url_propose = '{}proposeExperiment/{}/'.format(api_base, campaign_name)
+    url_propose = '{}proposeExperiments/{}/'.format(api_base, campaign_name)
+    data_propose = {
+            'mode': 'gp',
+            'experiments': [ { 'inputs': [ {'name': d['name'], 'value': p} for d, p in zip(domain,pt) ] } for pt in points ]
+            }
+    requests.post( url_propose, json=data_propose, headers=header )
+
+    return gp
+
+if __name__ == "__main__":
+    campaign_name, model_file, data_source, n_probes, api_base = process_inputs()
     header = { 'Authorization': 'token ****************************************' } # generate a client token and place here
-    for pt in points:
-        data_propose = {
-                'mode': 'gp',
-                'inputs': [ {'name': d['name'], 'value': p} for d, p in zip(domain,pt)  ]
-                }
-        requests.post( url_propose, json=data_propose, headers=header )
+
+    probe(campaign_name, model_file, data_source, n_probes, api_base, header)
@@ -0,0 +1,195 @@
+import json
+import numpy as np
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+############################################################
+# gp_manager update policy - full train, warm refit or append
+#
+# GPy and GPyOpt are stubbed and the model is a small numpy GP, so
+# the policy and its saved history are checked without the ML
+# packages. Appends use gp_posterior, which needs scipy.
+#
+#   python -m unittest test_gp_manager
+############################################################
+NOISE = 0.01
+
+def rbf(A, B=None):
+    B = A if B is None else B
+    sq_dist = np.sum(A**2, axis=1)[:, None] + np.sum(B**2, axis=1)[None, :] - 2.0 * A @ B.T
+    return np.exp( -0.5 * np.maximum(sq_dist, 0.0) / 0.3**2 )
+
+class FakeModel:
+    # the parts of GPy's GPRegression used by gp_manager, with fixed kernel parameters
+    saved = {}
+
+    def __init__(self, X, Y, kernel=None):
+        self.kern = types.SimpleNamespace(K=rbf)
+        self.likelihood = types.SimpleNamespace(variance=NOISE)
+        self.optimized = []
+        self.set_XY(X, Y)
+
+    def set_XY(self, X, Y):
+        self.X = np.array(X)
+        self.Y = np.array(Y)
+        L = np.linalg.cholesky( rbf(self.X, self.X) + NOISE * np.eye(self.X.shape[0]) )
+        self.posterior = types.SimpleNamespace(woodbury_chol=L)
+
+    def optimize(self, optimizer, max_iters):
+        self.optimized.append(max_iters)
+
+    def log_likelihood(self):
+        K = rbf(self.X, self.X) + NOISE * np.eye(self.X.shape[0])
+        sign, logdet = np.linalg.slogdet(K)
+        return -0.5 * ( self.Y.T @ np.linalg.solve(K, self.Y) ).item() - 0.5 * logdet - 0.5 * self.X.shape[0] * np.log(2.0 * np.pi)
+
+    def save_model(self, filename):
+        FakeModel.saved[filename + '.zip'] = self
+        open(filename + '.zip', 'w').close()
+
+    @classmethod
+    def load_model(cls, zip_filename):
+        return cls.saved[zip_filename]
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+class _GPModel:
+    def __init__(self, **kwargs):
+        pass
+
+_stubs = {
+            'GPy': _module('GPy', kern=types.SimpleNamespace(RBF=lambda input_dim: None)),
+            'GPy.inference': _module('GPy.inference'),
+            'GPy.inference.latent_function_inference': _module('GPy.inference.latent_function_inference'),
+            'GPy.inference.latent_function_inference.posterior': _module('GPy.inference.latent_function_inference.posterior', Posterior=lambda **kwargs: types.SimpleNamespace(**kwargs)),
+            'GPy.models': _module('GPy.models', GPRegression=FakeModel),
+            'paramz': _module('paramz', ObsAr=np.asarray),
+            'GPyOpt': _module('GPyOpt', Design_space=None),
+            'GPyOpt.acquisitions': _module('GPyOpt.acquisitions', AcquisitionLCB=None),
+            'GPyOpt.core': _module('GPyOpt.core', evaluators=None),
+            'GPyOpt.core.task': _module('GPyOpt.core.task', objective=None),
+            'GPyOpt.methods': _module('GPyOpt.methods', ModularBayesianOptimization=None),
+            'GPyOpt.models': _module('GPyOpt.models', GPModel=_GPModel),
+            'GPyOpt.optimization': _module('GPyOpt.optimization'),
+            'GPyOpt.optimization.acquisition_optimizer': _module('GPyOpt.optimization.acquisition_optimizer', AcquisitionOptimizer=None),
+        }
+try:
+    import gp_posterior
+    have_scipy = True
+except ImportError:
+    _stubs['gp_posterior'] = _module('gp_posterior', CholeskyPosterior=None)
+    have_scipy = False
+
+with mock.patch.dict(sys.modules, _stubs):
+    import gp_manager
+
+class GPManagerTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.X = rng.random( (40, 2) )
+        self.Y = np.sin( 3.0 * self.X ).sum(axis=1, keepdims=True)
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.model_file = os.path.join(tmpdir.name, 'model')
+
+    def trained(self, n):
+        gp = gp_manager.gp_manager()
+        self.assertEqual( gp.update_model(self.model_file, self.X[:n], self.Y[:n]), 'full' )
+        return gp
+
+    def test_needs_full_train(self):
+        gp = gp_manager.gp_manager()
+        self.assertTrue( gp.needs_full_train(self.X[:10], self.Y[:10]) )
+
+        gp = self.trained(10)
+        self.assertFalse( gp.needs_full_train(self.X[:12], self.Y[:12]) )
+        # new input dimension
+        self.assertTrue( gp.needs_full_train( np.hstack( (self.X[:12], self.X[:12, :1]) ), self.Y[:12] ) )
+        # data grown by full_growth since the last full train
+        self.assertFalse( gp.needs_full_train(self.X[:14], self.Y[:14]) )
+        self.assertTrue( gp.needs_full_train(self.X[:15], self.Y[:15]) )
+        # full_every updates since the last full train
+        gp.history['updates_since_full'] = gp.full_every - 2
+        self.assertFalse( gp.needs_full_train(self.X[:12], self.Y[:12]) )
+        gp.history['updates_since_full'] = gp.full_every - 1
+        self.assertTrue( gp.needs_full_train(self.X[:12], self.Y[:12]) )
+
+    def test_full_train_history(self):
+        gp = self.trained(10)
+        self.assertEqual( gp.model.optimized, [100] )
+        self.assertEqual( gp.history['updates_since_full'], 0 )
+        self.assertEqual( gp.history['n_at_full'], 10 )
+        self.assertEqual( gp.history['appends_since_fit'], 0 )
+        self.assertAlmostEqual( gp.history['ll_per_point'], gp.model.log_likelihood() / 10 )
+
+    def test_refit_when_data_replaced(self):
+        gp = self.trained(10)
+        Y = self.Y[:12].copy()
+        Y[0] += 1.0
+
+        self.assertEqual( gp.update_model(self.model_file, self.X[:12], Y), 'refit' )
+        self.assertEqual( gp.model.optimized, [100, gp.incremental_iters] )
+        self.assertEqual( gp.history['updates_since_full'], 1 )
+        np.testing.assert_array_equal( gp.model.Y, Y )
+
+    def test_refit_after_refit_every_appends(self):
+        gp = self.trained(10)
+        gp.history['appends_since_fit'] = gp.refit_every
+
+        with mock.patch.object(gp, 'append_observations') as mock_append:
+            self.assertEqual( gp.update_model(self.model_file, self.X[:12], self.Y[:12]), 'refit' )
+        mock_append.assert_not_called()
+        self.assertEqual( gp.history['appends_since_fit'], 0 )
+
+    @unittest.skipIf(not have_scipy, "scipy not installed")
+    def test_append(self):
+        gp = self.trained(10)
+
+        for n in (11, 12):
+            self.assertEqual( gp.update_model(self.model_file, self.X[:n], self.Y[:n]), 'append' )
+        self.assertEqual( gp.model.optimized, [100] )
+        self.assertEqual( gp.history['appends_since_fit'], 2 )
+        self.assertEqual( gp.history['updates_since_full'], 0 )
+
+        # the installed posterior is the one a full factorisation gives
+        full = FakeModel(self.X[:12], self.Y[:12])
+        np.testing.assert_allclose( gp.model.posterior.woodbury_chol, full.posterior.woodbury_chol, atol=1e-8 )
+        self.assertAlmostEqual( gp.model._log_marginal_likelihood, full.log_likelihood(), places=6 )
+
+    @unittest.skipIf(not have_scipy, "scipy not installed")
+    def test_append_falls_back_on_likelihood_drift(self):
+        gp = self.trained(10)
+        gp.ll_drift = 0.0
+        # observations the kernel parameters explain badly
+        Y = np.vstack( (self.Y[:10], [[25.0], [-25.0]]) )
+
+        self.assertEqual( gp.update_model(self.model_file, self.X[:12], Y), 'refit' )
+        self.assertEqual( gp.model.optimized, [100, gp.incremental_iters] )
+
+    def test_history_saved_with_model(self):
+        gp = self.trained(10)
+        gp.history['updates_since_full'] = 3
+        gp.save_model(self.model_file)
+
+        with open(self.model_file + '.history.json') as f:
+            self.assertEqual( json.load(f)['updates_since_full'], 3 )
+
+        # a new manager starts from the saved model and history
+        loaded = gp_manager.gp_manager()
+        # unchanged data leaves the model as it is
+        self.assertEqual( loaded.update_model(self.model_file, self.X[:10], self.Y[:10]), 'append' )
+        self.assertIs( loaded.model, gp.model )
+        self.assertEqual( loaded.history['updates_since_full'], 3 )
+        self.assertEqual( loaded.history['n_at_full'], 10 )
+
+
+if __name__ == "__main__":
+    unittest.main()
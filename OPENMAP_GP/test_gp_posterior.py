@@ -0,0 +1,71 @@
+import numpy as np
+import unittest
+
+try:
+    from gp_posterior import CholeskyPosterior
+except ImportError:
+    CholeskyPosterior = None
+
+############################################################
+# CholeskyPosterior appends compared with a posterior
+# factorised from all of the data at once
+#
+#   python -m unittest test_gp_posterior
+############################################################
+def rbf(A, B, variance=1.3, lengthscale=0.4):
+    sq_dist = np.sum(A**2, axis=1)[:, None] + np.sum(B**2, axis=1)[None, :] - 2.0 * A @ B.T
+    return variance * np.exp( -0.5 * np.maximum(sq_dist, 0.0) / lengthscale**2 )
+
+@unittest.skipIf(CholeskyPosterior is None, "scipy not installed")
+class CholeskyPosteriorTests(unittest.TestCase):
+    noise = 0.01
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.X = rng.random( (30, 3) )
+        self.Y = np.sin( 3.0 * self.X ).sum(axis=1, keepdims=True) + 0.1 * rng.standard_normal( (30, 1) )
+        self.X_star = rng.random( (5, 3) )
+
+    def assertMatchesFull(self, posterior, n):
+        full = CholeskyPosterior(rbf, self.noise, self.X[:n], self.Y[:n])
+
+        np.testing.assert_allclose( posterior.X, full.X )
+        np.testing.assert_allclose( posterior.L, full.L, atol=1e-10 )
+        np.testing.assert_allclose( posterior.alpha, full.alpha, rtol=1e-8, atol=1e-8 )
+        self.assertAlmostEqual( posterior.log_likelihood(), full.log_likelihood(), places=8 )
+
+        mean, var = posterior.predict(self.X_star)
+        full_mean, full_var = full.predict(self.X_star)
+        np.testing.assert_allclose( mean, full_mean, rtol=1e-8, atol=1e-10 )
+        np.testing.assert_allclose( var, full_var, rtol=1e-8, atol=1e-10 )
+
+    def test_append_one(self):
+        posterior = CholeskyPosterior(rbf, self.noise, self.X[:20], self.Y[:20])
+        for i in range(20, 30):
+            posterior.append(self.X[i], self.Y[i])
+        self.assertEqual( posterior.n, 30 )
+        self.assertMatchesFull(posterior, 30)
+
+    def test_append_block(self):
+        posterior = CholeskyPosterior(rbf, self.noise, self.X[:10], self.Y[:10])
+        posterior.append(self.X[10:25], self.Y[10:25])
+        self.assertMatchesFull(posterior, 25)
+
+    def test_append_nothing(self):
+        posterior = CholeskyPosterior(rbf, self.noise, self.X[:10], self.Y[:10])
+        posterior.append( np.empty( (0, 3) ), np.empty( (0, 1) ) )
+        self.assertMatchesFull(posterior, 10)
+
+    def test_log_likelihood(self):
+        # log N(Y | 0, K + noise*I) computed directly
+        posterior = CholeskyPosterior(rbf, self.noise, self.X[:12], self.Y[:12])
+        posterior.append(self.X[12:], self.Y[12:])
+
+        K = rbf(self.X, self.X) + self.noise * np.eye(30)
+        sign, logdet = np.linalg.slogdet(K)
+        expected = -0.5 * ( self.Y.T @ np.linalg.solve(K, self.Y) ).item() - 0.5 * logdet - 15.0 * np.log(2.0 * np.pi)
+        self.assertAlmostEqual( posterior.log_likelihood(), expected, places=8 )
+
+
+if __name__ == "__main__":
+    unittest.main()
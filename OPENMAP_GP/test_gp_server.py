@@ -0,0 +1,152 @@
+import json
+import numpy as np
+import sys
+import threading
+import types
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+# gp_server imports GPy through gp_manager, train_gp and probe_gp - they are
+# stubbed so the request handling and model cache run without the ML packages
+_stubs = { name: types.ModuleType(name) for name in ('gp_manager', 'train_gp', 'probe_gp') }
+_stubs['gp_manager'].gp_manager = lambda: types.SimpleNamespace(model=None)
+_stubs['train_gp'].train = None
+_stubs['probe_gp'].probe = None
+with mock.patch.dict(sys.modules, _stubs):
+    import gp_server
+
+############################################################
+# gp_server request handling and model cache
+#
+#   python -m unittest test_gp_server
+############################################################
+KEY = 'shared-key'
+
+class GPServerTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(gp_server, train=mock.DEFAULT, probe=mock.DEFAULT, requests=mock.DEFAULT)
+        self.mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.server = gp_server.GPServer( ('127.0.0.1', 0), gp_server.ModelCache(10**9), 1, '/models',
+                                          'http://orchestrator:8000/ml-api/', {'Authorization': 'token abc'}, KEY )
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def request(self, method, path, body=None, key=KEY):
+        url = 'http://127.0.0.1:{}/{}'.format(self.server.server_address[1], path)
+        data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode()
+        req = urllib.request.Request(url, data=data, method=method)
+        if ( key is not None ):
+            req.add_header('X-GP-Server-Key', key)
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as err:
+            return err.code, json.loads(err.read())
+
+    def wait(self):
+        # background train/probe requests finish
+        self.server.executor.shutdown(wait=True)
+
+    def test_key_required(self):
+        body = {'campaign_name': 'c', 'model': 'm'}
+        self.assertEqual( self.request('POST', 'train/', body, key=None)[0], 403 )
+        self.assertEqual( self.request('POST', 'train/', body, key='wrong')[0], 403 )
+        self.assertEqual( self.request('GET', 'models/', key=None)[0], 403 )
+
+        self.assertEqual( self.request('POST', 'train/', body)[0], 202 )
+        self.assertEqual( self.request('GET', 'models/')[0], 200 )
+        self.wait()
+        self.mocks['train'].assert_called_once()
+
+    def test_train_uses_server_configuration(self):
+        body = {'campaign_name': 'c', 'model': 'm', 'data_source': '/etc/passwd', 'api_base': 'http://attacker/'}
+        self.assertEqual( self.request('POST', 'train/', body)[0], 202 )
+        self.wait()
+
+        args = self.mocks['train'].call_args.args
+        self.assertEqual( args, ('c', '/models/m', 'api', 'http://orchestrator:8000/ml-api/', {'Authorization': 'token abc'}) )
+
+    def test_missing_fields(self):
+        status, content = self.request('POST', 'probe/', {'model': 'm'})
+        self.assertEqual( status, 400 )
+        self.assertEqual( content['error'], 'missing fields: campaign_name, num_samples' )
+
+        self.assertEqual( self.request('POST', 'probe/', b'not json')[0], 400 )
+        self.assertEqual( self.request('POST', 'unknown/', {})[0], 404 )
+
+    def test_model_path_rejected(self):
+        for model in ['../m', '/etc/passwd', 'a/b', '..', '']:
+            self.assertEqual( self.request('POST', 'train/', {'campaign_name': 'c', 'model': model})[0], 400 )
+        self.wait()
+        self.mocks['train'].assert_not_called()
+
+    def test_probe_failure_reported(self):
+        self.mocks['probe'].side_effect = RuntimeError('model file damaged')
+
+        with self.assertLogs('gp_server', 'ERROR'):
+            self.assertEqual( self.request('POST', 'probe/', {'campaign_name': 'c', 'model': 'm', 'num_samples': 1})[0], 202 )
+            self.wait()
+
+        self.assertNotIn( 'm', self.server.cache.entries )
+        self.mocks['requests'].post.assert_called_once_with( 'http://orchestrator:8000/ml-api/probeFailed/c/', headers={'Authorization': 'token abc'}, timeout=30 )
+
+    def test_valid_model_name(self):
+        for model in ['abc', 'a.b', '0123456789ab']:
+            self.assertTrue( gp_server.valid_model_name(model) )
+        for model in ['', '.', '..', '../x', '/etc/passwd', 'a/b', 'x\0y', None, 3]:
+            self.assertFalse( gp_server.valid_model_name(model) )
+
+class ModelCacheTests(unittest.TestCase):
+    def held_model(self, n):
+        return types.SimpleNamespace( model=types.SimpleNamespace( X=np.zeros( (n, 2) ), Y=np.zeros( (n, 1) ) ) )
+
+    def fill(self, cache, sizes):
+        for name, n in sizes.items():
+            gp, lock = cache.get(name)
+            gp.model = self.held_model(n).model
+
+    def test_trim_least_recently_used(self):
+        per_model = gp_server.model_bytes( self.held_model(10) )
+        cache = gp_server.ModelCache( 2 * per_model )
+        with mock.patch.object(gp_server, 'gp_manager', lambda: types.SimpleNamespace(model=None)):
+            self.fill(cache, {'a': 10, 'b': 10, 'c': 10})
+            cache.get('a')
+
+        cache.trim()
+        self.assertEqual( list(cache.entries), ['c', 'a'] )
+
+    def test_trim_keeps_models_in_use(self):
+        per_model = gp_server.model_bytes( self.held_model(10) )
+        cache = gp_server.ModelCache( per_model )
+        with mock.patch.object(gp_server, 'gp_manager', lambda: types.SimpleNamespace(model=None)):
+            self.fill(cache, {'a': 10, 'b': 10})
+
+        gp, lock = cache.entries['a']
+        with lock:
+            cache.trim()
+        self.assertEqual( list(cache.entries), ['a'] )
+
+    def test_unloaded_models_free(self):
+        cache = gp_server.ModelCache(0)
+        with mock.patch.object(gp_server, 'gp_manager', lambda: types.SimpleNamespace(model=None)):
+            cache.get('a')
+        self.assertEqual( cache.stats(), { 'a': {'bytes': 0, 'loaded': False} } )
+
+    def test_discard(self):
+        cache = gp_server.ModelCache(10**9)
+        with mock.patch.object(gp_server, 'gp_manager', lambda: types.SimpleNamespace(model=None)):
+            first, lock = cache.get('a')
+            cache.discard('a')
+            cache.discard('missing')
+            second, lock = cache.get('a')
+        self.assertIsNot( first, second )
+
+
+if __name__ == "__main__":
+    unittest.main()
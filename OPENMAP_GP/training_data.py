@@ -0,0 +1,170 @@
+import numpy as np
+import os
+import requests
+import sqlite3
+import tempfile
+
+############################################################
+# training data from the orchestrator's ml-api
+#
+# the npz payload of trainingData/<campaign>/ is kept in cache_file
+# with its ETag, so unchanged data is not downloaded again
+# the files are replaced whole so a concurrent or interrupted
+# download never leaves a partial cache
+############################################################
+TIMEOUT = (10, 300)     # seconds to connect, seconds between bytes received
+
+def write_replace(path, content, mode):
+    fd, tmp_path = tempfile.mkstemp( dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + '.' )
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def fetch_training_data(api_base, campaign_name, header, cache_file):
+    url_data = '{}trainingData/{}/'.format(api_base, campaign_name)
+    etag_file = cache_file + '.etag'
+
+    req_header = dict(header)
+    if ( os.path.exists(cache_file) and os.path.exists(etag_file) ):
+        with open(etag_file) as f:
+            req_header['If-None-Match'] = f.read().strip()
+
+    response = requests.get( url_data, headers=req_header, timeout=TIMEOUT )
+    if ( response.status_code != 304 ):
+        response.raise_for_status()
+        # data before its ETag - an ETag never names data that is not cached
+        write_replace(cache_file, response.content, 'wb')
+        write_replace(etag_file, response.headers.get('ETag', ''), 'w')
+
+    with np.load(cache_file) as npz:
+        return { key: npz[key] for key in npz.files }
+
+def domain_from_data(data):
+    return [ { 'name': str(name), 'type': 'continuous', 'domain': (float(lo), float(hi)) }
+                for name, lo, hi in zip(data['input_names'], data['lower'], data['upper']) ]
+
+############################################################
+# training data from the orchestrator's database file, for ML
+# hosts sharing its filesystem (data_source other than 'api')
+#
+# no GPy imports here, so the extraction can be used and timed
+# (benchmark_extract.py) without the ML packages
+############################################################
+def extract_from_db(dbname, campaign_name):
+    conn = sqlite3.connect(dbname)
+    c = conn.cursor()
+
+    # get input and output variable ids, in the order of the model columns
+    select_invar = 'SELECT i.id from map_base_mapinput as i'
+    select_invar = select_invar + ' JOIN map_base_campaign AS c ON c.for_map_id=i.for_map_id'
+    select_invar = select_invar + ' WHERE c.name=? ORDER BY i.id'
+    c.execute(select_invar, (campaign_name,))
+    invar = [ row[0] for row in c.fetchall() ]
+
+    select_outvar = 'SELECT o.id from map_base_mapoutput as o'
+    select_outvar = select_outvar + ' JOIN map_base_campaign AS c ON c.for_map_id=o.for_map_id'
+    select_outvar = select_outvar + ' WHERE c.name=? ORDER BY o.id'
+    c.execute(select_outvar, (campaign_name,))
+    outvar = [ row[0] for row in c.fetchall() ]
+
+    # upper bound on the number of rows
+    select_count = 'SELECT COUNT(*) FROM map_base_experiment AS e'
+    select_count = select_count + ' JOIN map_base_campaign AS c ON e.campaign_id=c.id'
+    select_count = select_count + ' WHERE c.name=?'
+    c.execute(select_count, (campaign_name,))
+    n_exp = c.fetchone()[0]
+
+    # one row per experiment - input and output values of the campaign are pivoted
+    # into columns by conditional aggregation on their variable ids
+    values = 'SELECT i.experiment_id AS experiment_id, 0 AS kind, i.map_input_id AS var_id, IFNULL(i.value_actual, i.value_request) AS value'
+    values = values + ' FROM map_base_expinputval AS i'
+    values = values + ' JOIN map_base_experiment AS e ON i.experiment_id=e.id'
+    values = values + ' JOIN map_base_campaign AS c ON e.campaign_id=c.id'
+    values = values + ' WHERE c.name=?'
+    values = values + ' UNION ALL'
+    values = values + ' SELECT o.experiment_id, 1, o.map_output_id, o.value FROM map_base_expoutputval AS o'
+    values = values + ' JOIN map_base_experiment AS e ON o.experiment_id=e.id'
+    values = values + ' JOIN map_base_campaign AS c ON e.campaign_id=c.id'
+    values = values + ' WHERE c.name=?'
+
+    columns = [ 'MAX(CASE WHEN v.kind=0 AND v.var_id=? THEN v.value END)' for i in invar ]
+    columns = columns + [ 'MAX(CASE WHEN v.kind=1 AND v.var_id=? THEN v.value END)' for o in outvar ]
+
+    select_in_out = 'SELECT ' + ', '.join(columns)
+    select_in_out = select_in_out + ' FROM ({}) AS v'.format(values)
+    select_in_out = select_in_out + ' GROUP BY v.experiment_id ORDER BY v.experiment_id'
+
+    sel_args = invar + outvar + [campaign_name, campaign_name]
+    c.execute(select_in_out, tuple(sel_args))
+
+    # NULL (missing value) becomes nan
+    data = np.empty( (n_exp, len(invar) + len(outvar)), dtype=np.float64 )
+    n_rows = 0
+    for row in c:
+        data[n_rows] = row
+        n_rows += 1
+    conn.close()
+
+    # experiments missing any input or output value are not used
+    data = data[:n_rows]
+    complete = ~np.isnan(data).any(axis=1)
+
+    inpar = data[complete, :len(invar)]
+    loss = data[complete, len(invar):]
+
+    return (inpar, loss)
+
+def extract_from_db_joins(dbname, campaign_name):
+    # the previous extraction - two joins per input and per output, kept for
+    # benchmark_extract.py (sqlite allows at most 64 tables in a join)
+    conn = sqlite3.connect(dbname)
+    c = conn.cursor()
+
+    c.execute('SELECT i.name FROM map_base_mapinput AS i JOIN map_base_campaign AS c ON c.for_map_id=i.for_map_id WHERE c.name=? ORDER BY i.id', (campaign_name,))
+    invar = c.fetchall()
+    c.execute('SELECT o.name FROM map_base_mapoutput AS o JOIN map_base_campaign AS c ON c.for_map_id=o.for_map_id WHERE c.name=? ORDER BY o.id', (campaign_name,))
+    outvar = c.fetchall()
+
+    col_list = 'SELECT e.id'
+    tbl_list = ' FROM map_base_campaign AS c JOIN map_base_experiment AS e ON e.campaign_id=c.id'
+    nn_list = ''
+    sel_args = []
+    for i in range( len(invar) ):
+        col_list = col_list + ', IFNULL(i{0}.value_actual, i{0}.value_request)'.format(i)
+        tbl_list = tbl_list + ' JOIN map_base_expinputval AS i{0} ON i{0}.experiment_id=e.id'.format(i)
+        tbl_list = tbl_list + ' JOIN (SELECT * FROM map_base_mapinput WHERE name=?) AS mi{0} ON i{0}.map_input_id=mi{0}.id'.format(i)
+        sel_args.append(invar[i][0])
+    for i in range( len(outvar) ):
+        col_list = col_list + ', o{0}.value'.format(i)
+        tbl_list = tbl_list + ' JOIN map_base_expoutputval AS o{0} ON o{0}.experiment_id=e.id'.format(i)
+        tbl_list = tbl_list + ' JOIN (SELECT * FROM map_base_mapoutput WHERE name=?) AS mo{0} ON o{0}.map_output_id=mo{0}.id'.format(i)
+        nn_list = nn_list + ' AND o{0}.value NOT NULL'.format(i)
+        sel_args.append(outvar[i][0])
+    sel_args.append(campaign_name)
+    # ordered by experiment (and variables by id above) to compare with extract_from_db
+    c.execute(col_list + tbl_list + ' WHERE c.name=?' + nn_list + ' ORDER BY e.id', tuple(sel_args))
+    results = c.fetchall()
+    conn.close()
+
+    inpar = [ list(row[1:1+len(invar)]) for row in results ]
+    loss = [ list(row[1+len(invar):]) for row in results ]
+    return (np.array(inpar), np.array(loss))
+
+def extract_var_limits(dbname, campaign_name):
+    conn = sqlite3.connect(dbname)
+    c = conn.cursor()
+
+    domain = []
+
+    select_invar = 'SELECT i.name, i.min_val, i.max_val FROM map_base_mapinput AS i'
+    select_invar = select_invar + ' JOIN map_base_mapbase AS m ON i.for_map_id=m.id'
+    select_invar = select_invar + ' JOIN map_base_campaign AS c ON c.for_map_id=m.id'
+    select_invar = select_invar + ' WHERE c.name=? ORDER BY i.id'
+    for row in c.execute(select_invar, (campaign_name,)):
+        domain.append( { 'name': row[0], 'type': 'continuous', 'domain': (row[1],row[2]) } )
+
+    return domain
@@ -30,9 +30,7 @@ def calc_parabolic_2d(self, i0_name, i1_name, o_name, e_id, m_name):
 
     url_exp_status = base_url + "experimentStatus/{}/{}/".format(c_name, e_name)
     url_mod_status = base_url + "stageStatus/{}/{}/{}/".format(c_name, e_name, m_name)
-    url_inp0 = base_url + "input/{}/{}/{}/".format(c_name, e_name, i0_name)
-    url_inp1 = base_url + "input/{}/{}/{}/".format(c_name, e_name, i1_name)
-    url_out = base_url + "output/{}/{}/{}/".format(c_name, e_name, o_name)
+    url_mod_report = base_url + "stageReport/{}/{}/{}/".format(c_name, e_name, m_name)
 
     # send experiment running
     experiment.status= 'R'
@@ -50,18 +48,13 @@ def calc_parabolic_2d(self, i0_name, i1_name, o_name, e_id, m_name):
     result = inp0.input_value**2 + inp1.input_value**2
     out = ExpOutVar.objects.create(experiment=experiment, module_output=mout, output_value=result)
 
-    # send stage complete
+    # send stage complete together with input actuals and output
     exp_module.status = 'C'
     exp_module.save()
-    status_response = requests.post( url_mod_status, json=StatusSerializer(exp_module).data, headers=header )
-    # send input actuals
-    data_i0 = {'value': inp0.input_value}
-    data_i1 = {'value': inp1.input_value}
-    status_response = requests.put( url_inp0, json=data_i0, headers=header )
-    status_response = requests.put( url_inp1, json=data_i1, headers=header )
-    # send output
-    data_o = {'value': result}
-    status_response = requests.put( url_out, json=data_o, headers=header )
+    data_report = StatusSerializer(exp_module).data
+    data_report['inputs'] = [ {'name': i0_name, 'value': inp0.input_value}, {'name': i1_name, 'value': inp1.input_value} ]
+    data_report['outputs'] = [ {'name': o_name, 'value': result} ]
+    status_response = requests.post( url_mod_report, json=data_report, headers=header )
     # send experiment complete
     experiment.status= 'C'
     experiment.save()
@@ -1,4 +1,6 @@
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 
@@ -227,3 +229,48 @@ class ResultsTests(Surrogate2dTestCase):
 
         self.assertEqual( response.status_code, status.HTTP_200_OK )
         self.assertEqual( response.json(), expected )
+
+############################################################
+#
+# test getting status and results of several experiments
+#
+############################################################
+class BulkTests(Surrogate2dTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.experiments = [ Experiment.objects.create(experiment_name='exp {}'.format(i), campaign_name=self.test_values['campaign_name'], status=exp_status)
+                                for i, exp_status in enumerate(['R', 'C']) ]
+        for experiment in self.experiments:
+            ExpModule.objects.create(experiment=experiment, module=self.module, status=experiment.status)
+        ExpOutVar.objects.create( experiment = self.experiments[1],
+                                  module_output = self.output,
+                                  output_value = self.test_values['test_out']['output_value']
+                                )
+        self.ids = ','.join( str(experiment.id) for experiment in self.experiments + [self.experiments[1]] ) + ',999'
+
+    def test_experiments_status(self):
+        url = reverse( views.experiments_status )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'ids': self.ids}, format='json')
+
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( len(queries), 1 )
+        self.assertEqual( response.json(), {
+                    str(self.experiments[0].id): {'status': 'R', 'modules': {self.module.name: 'R'}},
+                    str(self.experiments[1].id): {'status': 'C', 'modules': {self.module.name: 'C'}},
+                } )
+
+    def test_experiments_results(self):
+        url = reverse( views.experiments_results )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'ids': self.ids}, format='json')
+
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( len(queries), 1 )
+        self.assertEqual( response.json(), { str(self.experiments[1].id): {self.test_values['test_out']['output_name']: self.test_values['test_out']['output_value']} } )
+
+    def test_bad_ids(self):
+        for url in [ reverse( views.experiments_status ), reverse( views.experiments_results ) ]:
+            self.assertEqual( self.client.get(url, {'ids': '1,garbage'}, format='json').status_code, status.HTTP_400_BAD_REQUEST )
+            self.assertEqual( self.client.get(url, format='json').status_code, status.HTTP_400_BAD_REQUEST )
@@ -9,6 +9,8 @@ urlpatterns = [
         path('experiment/<exp_id>/status/<module>/', views.module_status),
         path('experiment/<exp_id>/status/', views.experiment_status),
         path('queue/append/', views.queue_append),
+        path('experiments/status/', views.experiments_status),
+        path('experiments/results/', views.experiments_results),
         path('experiment/<exp_id>/results/<module>/', views.module_results),
         path('experiment/<exp_id>/results/', views.experiment_results),
         ]
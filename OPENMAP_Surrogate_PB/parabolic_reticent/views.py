@@ -9,7 +9,7 @@ from rest_framework.authentication import SessionAuthentication, BasicAuthentica
 from rest_framework.permissions import IsAuthenticated
 
 from surrogate_base.models import Experiment, ExpModule, ExpOutVar
-from surrogate_base.serializers import NewExperimentSerializer, IdSerializer
+from surrogate_base.serializers import NewExperimentSerializer, IdSerializer, IdListSerializer
 from surrogate_base.serializers import ModuleConfigSerializer
 from surrogate_base.serializers import StatusSerializer
 from surrogate_base.serializers import OutputSerializer
@@ -161,3 +161,41 @@ def module_results(request, exp_id, module):
         ret_dict.update(out_dict['name_value'])
 
     return Response(ret_dict, status=status.HTTP_200_OK)
+
+############################################################
+# status of several experiments and their modules
+#   { experiment id: { 'status': status, 'modules': { module: status } } }
+############################################################
+@api_view(['GET'])
+def experiments_status(request):
+    req_serializer = IdListSerializer(data=request.query_params)
+    if not req_serializer.is_valid():
+        return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = Experiment.objects.filter( id__in=req_serializer.validated_data.get('ids') ).values_list( 'id', 'status', 'modules__module__name', 'modules__status' )
+
+    ret_dict = {}
+    for exp_id, exp_status, module_name, module_status in rows:
+        exp_dict = ret_dict.setdefault( exp_id, {'status': exp_status, 'modules': {}} )
+        if ( module_name is not None ):
+            exp_dict['modules'][module_name] = module_status
+
+    return Response(ret_dict, status=status.HTTP_200_OK)
+
+############################################################
+# results of several experiments
+#   { experiment id: { output: value } }, experiments without results are left out
+############################################################
+@api_view(['GET'])
+def experiments_results(request):
+    req_serializer = IdListSerializer(data=request.query_params)
+    if not req_serializer.is_valid():
+        return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    outputs = ExpOutVar.objects.filter( experiment_id__in=req_serializer.validated_data.get('ids') ).select_related('module_output')
+
+    ret_dict = {}
+    for output in outputs:
+        ret_dict.setdefault( output.experiment_id, {} ).update( output.name_value )
+
+    return Response(ret_dict, status=status.HTTP_200_OK)
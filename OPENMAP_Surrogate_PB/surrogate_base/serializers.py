@@ -8,6 +8,18 @@ from surrogate_base.models import Experiment, ExpModule, ExpModuleInpVar
 class IdSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
+############################################################
+# comma separated experiment ids of a bulk request (?ids=1,2,3)
+############################################################
+class IdListSerializer(serializers.Serializer):
+    ids = serializers.CharField()
+
+    def validate_ids(self, ids):
+        try:
+            return sorted( set( int(exp_id) for exp_id in ids.split(',') if exp_id.strip() != '' ) )
+        except ValueError:
+            raise serializers.ValidationError("ids must be a comma separated list of experiment ids")
+
 ############################################################
 #
 ############################################################